@@ -0,0 +1,192 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import hashlib
+import itertools
+import json
+import numbers
+import re
+import sqlite3
+from collections import OrderedDict
+
+import numpy as np
+
+from instrumentation import report
+
+DEFAULT_MAX_ENTRIES = 100000
+SCHEMA = 'CREATE TABLE IF NOT EXISTS results_json (key TEXT PRIMARY KEY, value TEXT)'
+# Algorithms whose score-only result is just the score of a full alignment; local scoring also
+# reports the best cell, which an alignment does not record
+SCORE_FROM_ALIGNMENT = ('global', 'gotoh')
+
+
+def sequence_digest(S):
+    return hashlib.sha1(S.encode('utf-8')).hexdigest()
+
+
+def costs_digest(costs):
+    # Substitution matrices are hashed by content, so a reloaded matrix still hits; numbers are
+    # compared as floats, so 5 and 5.0 give the same key, and matrix=None is the same as no matrix
+    items = {}
+    for name, value in costs.items():
+        if value is None:
+            continue
+        if isinstance(value, np.ndarray):
+            value = hashlib.sha1(np.ascontiguousarray(value, dtype=float).tobytes()).hexdigest()
+        elif isinstance(value, numbers.Real):
+            value = float(value)
+        items[name] = repr(value)
+    return hashlib.sha1(json.dumps(items, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+#%% Compact alignments
+def compact_alignment(st1, st2):
+    # Run-length columns: M has a character on both sides, I a gap in st2, D a gap in st1
+    kinds = ['D' if c1 == '-' else 'I' if c2 == '-' else 'M' for c1, c2 in zip(st1, st2)]
+    return ''.join(f'{len(list(run))}{kind}' for kind, run in itertools.groupby(kinds))
+
+
+def expand_alignment(S1, S2, ops):
+    st1 = ''
+    st2 = ''
+    idx1, idx2 = 0, 0
+    for count, kind in re.findall(r'(\d+)([MID])', ops):
+        count = int(count)
+        if kind != 'D':
+            st1 += S1[idx1:idx1 + count]
+            idx1 += count
+        else:
+            st1 += '-' * count
+        if kind != 'I':
+            st2 += S2[idx2:idx2 + count]
+            idx2 += count
+        else:
+            st2 += '-' * count
+    return st1, st2
+
+
+#%% Cache
+class AlignmentCache:
+    # Results keyed on (sequence digests, algorithm, mode, costs): an in-process LRU tier bounded by
+    # max_entries in front of an optional sqlite file that persists between runs.
+    # Scores are always kept, also the score of each full global/gotoh alignment so later score-only
+    # lookups hit; full alignments only when store_alignments is set
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES, store_alignments=True):
+        self.max_entries = max_entries
+        self.store_alignments = store_alignments
+        self.memory = OrderedDict()
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path)
+            self.db.execute(SCHEMA)
+            self.db.commit()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @property
+    def hits(self):
+        return self.memory_hits + self.disk_hits
+
+    def stats(self):
+        return dict(hits=self.hits, memory_hits=self.memory_hits, disk_hits=self.disk_hits,
+                    misses=self.misses, entries=len(self.memory))
+
+    def key(self, algorithm, digest, score_only, S1, S2):
+        # digest is costs_digest(costs), computed once per call rather than once per pair
+        mode = 'score' if score_only else 'align'
+        parts = [algorithm, mode, digest, sequence_digest(S1), sequence_digest(S2)]
+        return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def lookup(self, algorithm, costs, score_only, pairs):
+        # One result per pair, None where it has to be computed
+        counters = (self.memory_hits, self.disk_hits, self.misses)
+        digest = costs_digest(costs)
+        keys = [self.key(algorithm, digest, score_only, S1, S2) for S1, S2 in pairs]
+        results = [self._get_memory(key) for key in keys]
+
+        missing = [idx for idx, result in enumerate(results) if result is None]
+        if self.db is not None and missing:
+            stored = self._get_disk([keys[idx] for idx in missing])
+            for idx in missing:
+                if keys[idx] in stored:
+                    results[idx] = stored[keys[idx]]
+                    self._put_memory(keys[idx], results[idx])
+                    self.disk_hits += 1
+
+        self.misses += sum(result is None for result in results)
+        report('cache', memory_hits=self.memory_hits - counters[0], disk_hits=self.disk_hits - counters[1],
+               misses=self.misses - counters[2])
+        return [None if result is None else self._unpack(result, S1, S2) for result, (S1, S2) in zip(results, pairs)]
+
+    def store(self, algorithm, costs, score_only, pairs, results):
+        digest = costs_digest(costs)
+        values = []
+        for (S1, S2), result in zip(pairs, results):
+            if not score_only and algorithm in SCORE_FROM_ALIGNMENT:
+                values.append((self.key(algorithm, digest, True, S1, S2), ('result', result[2])))
+            if score_only or self.store_alignments:
+                values.append((self.key(algorithm, digest, score_only, S1, S2), self._pack(result, S1, S2)))
+
+        for key, value in values:
+            self._put_memory(key, value)
+        if self.db is not None and values:
+            rows = [(key, json.dumps(value, default=_json_number)) for key, value in values]
+            self.db.executemany('INSERT OR REPLACE INTO results_json VALUES (?, ?)', rows)
+            self.db.commit()
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def _get_memory(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+        return value
+
+    def _put_memory(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def _get_disk(self, keys):
+        stored = {}
+        # Stay under sqlite's limit on bound parameters
+        for idx in range(0, len(keys), 500):
+            chunk = keys[idx:idx + 500]
+            query = f'SELECT key, value FROM results_json WHERE key IN ({",".join("?" * len(chunk))})'
+            for key, value in self.db.execute(query, chunk):
+                stored[key] = tuple(json.loads(value))
+        return stored
+
+    @staticmethod
+    def _pack(result, S1, S2):
+        # Alignments are kept as run-length columns when they spell out S1 and S2 exactly,
+        # otherwise as the strings themselves
+        if isinstance(result, tuple) and len(result) == 3 and isinstance(result[0], str):
+            st1, st2, score = result
+            ops = compact_alignment(st1, st2)
+            if expand_alignment(S1, S2, ops) == (st1, st2):
+                return ('ops', ops, score)
+            return ('strings', st1, st2, score)
+        return ('result', result)
+
+    @staticmethod
+    def _unpack(value, S1, S2):
+        if value[0] == 'ops':
+            st1, st2 = expand_alignment(S1, S2, value[1])
+            return st1, st2, value[2]
+        if value[0] == 'strings':
+            return value[1], value[2], value[3]
+        # JSON turns tuples such as local scoring's (score, row, col) into lists
+        return tuple(value[1]) if isinstance(value[1], list) else value[1]
+
+
+def _json_number(value):
+    # numpy integers are not JSON serializable; numpy floats already are
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'Cannot store {type(value).__name__} in the cache')
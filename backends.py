@@ -0,0 +1,339 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import os
+import random
+
+import numpy as np
+
+import global_alignment
+import gotoh
+import local_alignment
+from gotoh import G_PATH_SHIFT, E_PATH_SHIFT, F_PATH_SHIFT
+from scoring import encode, score_table, load_matrix
+from utils import scratch_matrix, flush_matrices
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Every backend fills the same matrices with the same signatures as the reference loops:
+#   global/local: (S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, matrix=None, scratch_dir=None) -> V, paths
+#   gotoh:        (S1, S2, match_cost, mismatch_cost, a, b, matrix=None, scratch_dir=None) -> F, E, G, paths
+# A backend may also fill one block of tiled_wavefront.py, like global_alignment.needleman_wunsch_block()
+# and gotoh.gotoh_block():
+#   global_block: (codes1, codes2, scores, ins_cost, del_cost, top, left, keep_paths=False) -> bottom, right, paths
+#   gotoh_block:  (codes1, codes2, scores, a, b, top, left, keep_paths=False) -> bottom, right, paths
+BACKEND_ENV = 'ALIGNMENT_BACKEND'
+DEFAULT_BACKEND = 'numpy'
+ALGORITHMS = ['global', 'local', 'gotoh']
+BLOCK_ALGORITHMS = ['global_block', 'gotoh_block']
+
+BACKENDS = {
+    'reference': {'global': global_alignment.needleman_wunsch,
+                  'local': local_alignment.smith_waterman,
+                  'gotoh': gotoh.gotoh},
+    'numpy': {'global': global_alignment.needleman_wunsch_rows,
+              'local': local_alignment.smith_waterman_rows,
+              'gotoh': gotoh.gotoh_vectorized,
+              'global_block': global_alignment.needleman_wunsch_block,
+              'gotoh_block': gotoh.gotoh_block},
+}
+
+
+def register_backend(name, kernels):
+    # kernels maps each of ALGORITHMS, and optionally of BLOCK_ALGORITHMS, to a fill function following
+    # the shared contract above
+    missing = [algorithm for algorithm in ALGORITHMS if algorithm not in kernels]
+    if missing:
+        raise ValueError(f'Backend {name} has no kernel for: {", ".join(missing)}')
+    BACKENDS[name] = dict(kernels)
+
+
+def available_backends(algorithm=None):
+    # Every backend, or only those with a kernel for algorithm (e.g. 'global_block')
+    return [name for name, kernels in BACKENDS.items() if algorithm is None or algorithm in kernels]
+
+
+def get_kernel(algorithm, backend=None):
+    # backend=None picks the one named in $ALIGNMENT_BACKEND, or the default
+    if backend is None:
+        backend = os.environ.get(BACKEND_ENV, DEFAULT_BACKEND)
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown backend: {backend} (available: {", ".join(BACKENDS)})')
+    if algorithm not in ALGORITHMS + BLOCK_ALGORITHMS:
+        raise ValueError(f'Unknown algorithm: {algorithm}')
+    if algorithm not in BACKENDS[backend]:
+        raise ValueError(f'Backend {backend} has no {algorithm} kernel')
+    return BACKENDS[backend][algorithm]
+
+
+#%% Numba backend (only when numba is importable)
+if numba is not None:
+    @numba.njit(cache=True)
+    def _needleman_wunsch_fill(codes1, codes2, scores, ins_cost, del_cost, V, paths):
+        rows, cols = V.shape
+        paths[0, 0] = 2
+        for j in range(1, cols):
+            V[0, j] = V[0, j - 1] + ins_cost
+            paths[0, j] = 2
+        for i in range(1, rows):
+            V[i, 0] = V[i - 1, 0] + del_cost
+            paths[i, 0] = 1
+            for j in range(1, cols):
+                # Strict comparisons keep the first of equal choices, like np.argmax
+                best = V[i - 1, j - 1] + scores[codes2[i - 1], codes1[j - 1]]
+                idx = 0
+                up = V[i - 1, j] + del_cost
+                if up > best:
+                    best, idx = up, 1
+                left = V[i, j - 1] + ins_cost
+                if left > best:
+                    best, idx = left, 2
+                V[i, j] = best
+                paths[i, j] = idx
+
+    @numba.njit(cache=True)
+    def _smith_waterman_fill(codes1, codes2, scores, ins_cost, del_cost, V, paths):
+        rows, cols = V.shape
+        for i in range(1, rows):
+            for j in range(1, cols):
+                best = 0.0
+                idx = 0
+                diagonal = V[i - 1, j - 1] + scores[codes2[i - 1], codes1[j - 1]]
+                if diagonal > best:
+                    best, idx = diagonal, 1
+                up = V[i - 1, j] + del_cost
+                if up > best:
+                    best, idx = up, 2
+                left = V[i, j - 1] + ins_cost
+                if left > best:
+                    best, idx = left, 3
+                V[i, j] = best
+                paths[i, j] = idx
+
+    @numba.njit(cache=True)
+    def _gotoh_fill(codes1, codes2, scores, a, b, F, E, G, paths):
+        rows, cols = G.shape
+        for j in range(cols):
+            F[0, j] = -np.inf
+            paths[0, j] = 1 << G_PATH_SHIFT
+        for i in range(rows):
+            E[i, 0] = -np.inf
+            paths[i, 0] = 2 << G_PATH_SHIFT
+        for j in range(1, cols):
+            G[0, j] = E[0, j] = -1 * (a + (b * j))
+        for i in range(1, rows):
+            G[i, 0] = F[i, 0] = -1 * (a + (b * i))
+
+        f1 = a + b
+        for i in range(1, rows):
+            for j in range(1, cols):
+                F[i, j] = F[i - 1, j] - b
+                f_idx = 0
+                if G[i - 1, j] - f1 > F[i, j]:
+                    F[i, j] = G[i - 1, j] - f1
+                    f_idx = 1
+
+                E[i, j] = E[i, j - 1] - b
+                e_idx = 0
+                if G[i, j - 1] - f1 > E[i, j]:
+                    E[i, j] = G[i, j - 1] - f1
+                    e_idx = 1
+
+                G[i, j] = G[i - 1, j - 1] + scores[codes2[i - 1], codes1[j - 1]]
+                g_idx = 0
+                if E[i, j] > G[i, j]:
+                    G[i, j] = E[i, j]
+                    g_idx = 1
+                if F[i, j] > G[i, j]:
+                    G[i, j] = F[i, j]
+                    g_idx = 2
+                paths[i, j] = (g_idx << G_PATH_SHIFT) | (e_idx << E_PATH_SHIFT) | (f_idx << F_PATH_SHIFT)
+
+    # The block kernels release the GIL, so the blocks of one anti-diagonal run in parallel on threads
+    @numba.njit(cache=True, nogil=True)
+    def _needleman_wunsch_block_fill(codes1, codes2, scores, ins_cost, del_cost, row, left, right, paths, keep_paths):
+        # row starts as the top edge and ends as the bottom one
+        w = len(codes1)
+        right[0] = row[w - 1]
+        for k in range(len(codes2)):
+            corner = left[k]
+            best = left[k + 1]
+            for j in range(w):
+                up = row[j] + del_cost
+                left_move = best + ins_cost
+                best = corner + scores[codes2[k], codes1[j]]
+                idx = 0
+                if up > best:
+                    best, idx = up, 1
+                if left_move > best:
+                    best, idx = left_move, 2
+                corner = row[j]
+                row[j] = best
+                if keep_paths:
+                    paths[k, j] = idx
+            right[k + 1] = row[w - 1]
+
+    @numba.njit(cache=True, nogil=True)
+    def _gotoh_block_fill(codes1, codes2, scores, a, b, G, F, G_left, E_left, G_right, E_right, paths, keep_paths):
+        # G and F start as the top edge and end as the bottom one
+        w = len(codes1)
+        f1 = a + b
+        G_right[0] = G[w - 1]
+        E_right[0] = -np.inf
+        for k in range(len(codes2)):
+            corner = G_left[k]
+            g = G_left[k + 1]
+            e = E_left[k + 1]
+            for j in range(w):
+                f = F[j] - b
+                f_idx = 0
+                if G[j] - f1 > f:
+                    f = G[j] - f1
+                    f_idx = 1
+
+                e = e - b
+                e_idx = 0
+                if g - f1 > e:
+                    e = g - f1
+                    e_idx = 1
+
+                g = corner + scores[codes2[k], codes1[j]]
+                g_idx = 0
+                if e > g:
+                    g = e
+                    g_idx = 1
+                if f > g:
+                    g = f
+                    g_idx = 2
+                corner = G[j]
+                G[j] = g
+                F[j] = f
+                if keep_paths:
+                    paths[k, j] = (g_idx << G_PATH_SHIFT) | (e_idx << E_PATH_SHIFT) | (f_idx << F_PATH_SHIFT)
+            G_right[k + 1] = g
+            E_right[k + 1] = e
+
+    def needleman_wunsch_numba(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, matrix=None, scratch_dir=None):
+        V = scratch_matrix((len(S2) + 1, len(S1) + 1), float, scratch_dir, 'V')
+        paths = scratch_matrix(V.shape, np.uint8, scratch_dir, 'paths')
+        scores = np.ascontiguousarray(score_table(match_cost, mismatch_cost, matrix), dtype=float)
+        _needleman_wunsch_fill(encode(S1), encode(S2), scores, float(ins_cost), float(del_cost), np.asarray(V), np.asarray(paths))
+        flush_matrices(V, paths)
+        return V, paths
+
+    def smith_waterman_numba(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, matrix=None, scratch_dir=None):
+        V = scratch_matrix((len(S2) + 1, len(S1) + 1), float, scratch_dir, 'V')
+        paths = scratch_matrix(V.shape, np.uint8, scratch_dir, 'paths')
+        scores = np.ascontiguousarray(score_table(match_cost, mismatch_cost, matrix), dtype=float)
+        _smith_waterman_fill(encode(S1), encode(S2), scores, float(ins_cost), float(del_cost), np.asarray(V), np.asarray(paths))
+        flush_matrices(V, paths)
+        return V, paths
+
+    def gotoh_numba(S1, S2, match_cost, mismatch_cost, a, b, matrix=None, scratch_dir=None):
+        shape = (len(S2) + 1, len(S1) + 1)
+        G = scratch_matrix(shape, float, scratch_dir, 'G')
+        F = scratch_matrix(shape, float, scratch_dir, 'F')
+        E = scratch_matrix(shape, float, scratch_dir, 'E')
+        paths = scratch_matrix(shape, np.uint8, scratch_dir, 'paths')
+        scores = np.ascontiguousarray(score_table(match_cost, mismatch_cost, matrix), dtype=float)
+        _gotoh_fill(encode(S1), encode(S2), scores, float(a), float(b),
+                    np.asarray(F), np.asarray(E), np.asarray(G), np.asarray(paths))
+        flush_matrices(F, E, G, paths)
+        return F, E, G, paths
+
+    def needleman_wunsch_block_numba(codes1, codes2, scores, ins_cost, del_cost, top, left, keep_paths=False):
+        row = np.array(top, dtype=float)
+        right = np.empty(len(codes2) + 1)
+        paths = np.empty((len(codes2), len(codes1)) if keep_paths else (0, 0), dtype=np.uint8)
+        _needleman_wunsch_block_fill(codes1, codes2, np.ascontiguousarray(scores, dtype=float), float(ins_cost), float(del_cost),
+                                     row, np.asarray(left, dtype=float), right, paths, keep_paths)
+        return row, right, paths if keep_paths else None
+
+    def gotoh_block_numba(codes1, codes2, scores, a, b, top, left, keep_paths=False):
+        G, F = (np.array(edge, dtype=float) for edge in top)
+        G_left, E_left = (np.asarray(edge, dtype=float) for edge in left)
+        G_right = np.empty(len(codes2) + 1)
+        E_right = np.empty(len(codes2) + 1)
+        paths = np.empty((len(codes2), len(codes1)) if keep_paths else (0, 0), dtype=np.uint8)
+        _gotoh_block_fill(codes1, codes2, np.ascontiguousarray(scores, dtype=float), float(a), float(b), G, F,
+                          G_left, E_left, G_right, E_right, paths, keep_paths)
+        return (G, F), (G_right, E_right), paths if keep_paths else None
+
+    register_backend('numba', {'global': needleman_wunsch_numba,
+                               'local': smith_waterman_numba,
+                               'gotoh': gotoh_numba,
+                               'global_block': needleman_wunsch_block_numba,
+                               'gotoh_block': gotoh_block_numba})
+
+
+#%% Conformance
+# With costs that are not exact in binary (e.g. 0.3) the row kernels round gap runs differently from the
+# loops (see utils.gap_row()), so those cases only need every value within this of the reference
+DEFAULT_DECIMAL_TOLERANCE = 1e-9
+
+
+def random_case(rng, algorithm, max_len, matrix, exact=True):
+    # exact=True picks costs that are exact in binary, so every backend must agree to the last bit;
+    # exact=False picks decimal costs
+    alphabet = 'ARNDCQEGHILKMFPSTWYV' if matrix is not None else 'ACGT'
+    S1 = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, max_len)))
+    S2 = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, max_len)))
+    if exact:
+        match_cost, mismatch_cost = rng.choice([(5, -1), (1, -1), (2, -3), (1, 0)])
+    else:
+        match_cost, mismatch_cost = rng.choice([(1.1, -0.9), (0.3, -0.7), (2.2, -1.3)])
+    if algorithm == 'gotoh':
+        if exact:
+            a, b = rng.choice([(2, 0.5), (0, 1), (4, 0.25), (1, 0)])
+        else:
+            a, b = rng.choice([(0.3, 0.7), (1.1, 0.1), (0, 0.3)])
+        costs = dict(match_cost=match_cost, mismatch_cost=mismatch_cost, a=a, b=b)
+    else:
+        if exact:
+            ins_cost, del_cost = rng.choice([(-0.5, -0.5), (-1, -2), (-2, -1), (0, -1)])
+        else:
+            ins_cost, del_cost = rng.choice([(-0.3, -0.7), (-0.1, -0.2), (-0.7, -0.3)])
+        costs = dict(ins_cost=ins_cost, del_cost=del_cost, match_cost=match_cost, mismatch_cost=mismatch_cost)
+    if matrix is not None:
+        costs['matrix'] = matrix
+    return S1, S2, costs
+
+
+def conforms(expected, result, exact=True, tolerance=DEFAULT_DECIMAL_TOLERANCE):
+    # Exact costs: every matrix, paths included, equal in every cell. Decimal costs: the score matrices
+    # within tolerance; the paths are not compared, since near-equal choices may break ties differently
+    if exact:
+        return all(np.array_equal(x, y) for x, y in zip(expected, result))
+    return all(np.allclose(x, y, rtol=0, atol=tolerance) for x, y in zip(expected, result) if x.dtype != np.uint8)
+
+
+def check_conformance(backends=None, trials=100, max_len=24, seed=0, tolerance=DEFAULT_DECIMAL_TOLERANCE):
+    # Runs every backend against 'reference' on random pairs (empty sequences, both scoring modes, exact
+    # and decimal costs) and returns the (backend, algorithm, S1, S2, costs) cases that do not conform
+    if backends is None:
+        backends = [name for name in BACKENDS if name != 'reference']
+    rng = random.Random(seed)
+    blosum = load_matrix('BLOSUM62')
+
+    failures = []
+    for trial in range(trials):
+        for algorithm in ALGORITHMS:
+            exact = trial % 2 == 0
+            S1, S2, costs = random_case(rng, algorithm, max_len, blosum if trial % 4 == 3 else None, exact)
+            expected = get_kernel(algorithm, 'reference')(S1, S2, **costs)
+            for backend in backends:
+                result = get_kernel(algorithm, backend)(S1, S2, **costs)
+                if not conforms(expected, result, exact, tolerance):
+                    failures.append((backend, algorithm, S1, S2, costs))
+    return failures
+
+
+if __name__ == '__main__':
+    print(f"Backends: {', '.join(available_backends())} (numba {'found' if numba is not None else 'not installed'})")
+    failures = check_conformance()
+    for backend, algorithm, S1, S2, costs in failures:
+        scoring = {name: value for name, value in costs.items() if name != 'matrix'}
+        matrix = ' matrix=BLOSUM62' if 'matrix' in costs else ''
+        print(f"MISMATCH backend={backend} algorithm={algorithm} S1={S1!r} S2={S2!r} costs={scoring}{matrix}")
+    print(f"Conformance: {'ok' if not failures else f'{len(failures)} mismatches'}")
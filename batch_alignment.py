@@ -0,0 +1,114 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import global_alignment
+import gotoh
+import local_alignment
+from backends import get_kernel
+from instrumentation import Profile, enabled, phase, replay
+
+# Chunks per worker, so a slow chunk near the end does not leave the other workers idle
+CHUNKS_PER_WORKER = 4
+
+
+def default_costs(algorithm):
+    if algorithm == 'gotoh':
+        return dict(match_cost=gotoh.DEFAULT_MATCH_COST, mismatch_cost=gotoh.DEFAULT_MISMATCH_COST,
+                    a=gotoh.DEFAULT_A, b=gotoh.DEFAULT_B)
+    module = global_alignment if algorithm == 'global' else local_alignment
+    return dict(ins_cost=module.DEFAULT_INS_COST, del_cost=module.DEFAULT_DEL_COST,
+                match_cost=module.DEFAULT_MATCH_COST, mismatch_cost=module.DEFAULT_MISMATCH_COST)
+
+
+def align_pair(algorithm, costs, S1, S2, backend=None):
+    # The fill comes from the backend registry (see backends.py), chosen per call or by $ALIGNMENT_BACKEND
+    if algorithm not in ('global', 'local', 'gotoh'):
+        raise ValueError(f'Unknown algorithm: {algorithm}')
+    cells = (len(S1) + 1) * (len(S2) + 1)
+    with phase('fill', algorithm=algorithm, backend=backend, cells=cells):
+        matrices = get_kernel(algorithm, backend)(S1, S2, **costs)
+
+    with phase('traceback', algorithm=algorithm):
+        if algorithm == 'global':
+            return global_alignment.reconstruct(S1, S2, *matrices)
+        elif algorithm == 'local':
+            return local_alignment.reconstruct(S1, S2, *matrices)
+        return gotoh.reconstruct(S1, S2, *matrices)
+
+
+def score_pair(algorithm, costs, S1, S2, backend=None):
+    # Linear-memory scoring; local alignment also reports where the best cell is.
+    # These rolling-row kernels have a single implementation, so backend does not change anything
+    with phase('score', algorithm=algorithm, cells=(len(S1) + 1) * (len(S2) + 1)):
+        if algorithm == 'global':
+            return global_alignment.needleman_wunsch_score(S1, S2, **costs)
+        elif algorithm == 'local':
+            return local_alignment.smith_waterman_score(S1, S2, **costs)
+        elif algorithm == 'gotoh':
+            if costs['a'] < 0:
+                # The rolling-row kernel needs a >= 0; score the full matrix like align_pair does
+                return align_pair(algorithm, costs, S1, S2, backend)[2]
+            return gotoh.gotoh_score(S1, S2, **costs)
+    raise ValueError(f'Unknown algorithm: {algorithm}')
+
+
+def _align_chunk(algorithm, costs, score_only, backend, collect, pairs):
+    # With collect, the chunk's events are recorded and returned with the results, since a worker
+    # process cannot reach the parent's subscribers; the parent replays them
+    align = score_pair if score_only else align_pair
+    if not collect:
+        return [align(algorithm, costs, S1, S2, backend) for S1, S2 in pairs], []
+    with Profile() as profile:
+        results = [align(algorithm, costs, S1, S2, backend) for S1, S2 in pairs]
+    return results, profile.events
+
+
+#%% Batch API
+def align_batch(pairs, algorithm='global', costs=None, workers=None, chunk_size=None, score_only=False, cache=None,
+                backend=None, executor=None):
+    # Aligns every (S1, S2) pair and returns the (st1, st2, score) results in input order,
+    # or what score_pair() returns when score_only is set.
+    # With an AlignmentCache, only the pairs it has not seen are computed. Pass a ProcessPoolExecutor
+    # to reuse its workers across calls, e.g. over a stream of batches; otherwise each call starts its own
+    pairs = list(pairs)
+    if costs is None:
+        costs = default_costs(algorithm)
+    if cache is None:
+        return _align_pairs(pairs, algorithm, costs, workers, chunk_size, score_only, backend, executor)
+
+    results = cache.lookup(algorithm, costs, score_only, pairs)
+    missing = [idx for idx, result in enumerate(results) if result is None]
+    if missing:
+        missing_pairs = [pairs[idx] for idx in missing]
+        computed = _align_pairs(missing_pairs, algorithm, costs, workers, chunk_size, score_only, backend, executor)
+        cache.store(algorithm, costs, score_only, missing_pairs, computed)
+        for idx, result in zip(missing, computed):
+            results[idx] = result
+    return results
+
+
+def _align_pairs(pairs, algorithm, costs, workers, chunk_size, score_only, backend, executor=None):
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = max(1, -(-len(pairs) // (workers * CHUNKS_PER_WORKER)))
+
+    if workers <= 1 or len(pairs) <= chunk_size:
+        return _align_chunk(algorithm, costs, score_only, backend, False, pairs)[0]
+
+    # Whole chunks are sent to each process to amortize the pickling of every call
+    chunks = [pairs[idx:idx + chunk_size] for idx in range(0, len(pairs), chunk_size)]
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return _map_chunks(executor, chunks, algorithm, costs, score_only, backend)
+    return _map_chunks(executor, chunks, algorithm, costs, score_only, backend)
+
+
+def _map_chunks(executor, chunks, algorithm, costs, score_only, backend):
+    results = []
+    for chunk_results, events in executor.map(partial(_align_chunk, algorithm, costs, score_only, backend, enabled()), chunks):
+        replay(events)
+        results.extend(chunk_results)
+    return results
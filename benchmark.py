@@ -0,0 +1,225 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import statistics
+import sys
+import time
+from timeit import default_timer as timer
+
+import numpy as np
+
+from backends import available_backends
+from batch_alignment import align_pair, score_pair, default_costs
+from center_star import find_center_star_by_score, find_center_star_by_kmers
+from kmer_distance import kmer_shortlist
+from msa import MSA
+from synthetic_sequences import sequence_family
+from tiled_wavefront import needleman_wunsch_tiled, gotoh_tiled
+
+DEFAULT_SEED = 0
+DEFAULT_REPEATS = 3
+# A case is flagged when it is this much slower (or uses this much more memory) than the baseline
+DEFAULT_TOLERANCE = 0.10
+
+# Past FULL_MATRIX_MAX_LENGTH pairs are scored in linear space instead of filling full matrices,
+# and the pure-Python reference backend is only run up to REFERENCE_MAX_LENGTH
+FULL_MATRIX_MAX_LENGTH = 5000
+REFERENCE_MAX_LENGTH = 1000
+# Center-star by score aligns every pair, so larger families only run the k-mer screen
+CENTER_STAR_SCORE_MAX_N = 100
+CENTER_STAR_LENGTH = 100
+
+# Thread counts the tiled wavefront is run with, to measure how it scales across cores
+TILED_WORKERS = [1, 2, 4]
+TILED = {'global': needleman_wunsch_tiled, 'gotoh': gotoh_tiled}
+
+SUITES = {
+    'quick': dict(algorithms=['global', 'local', 'gotoh'], lengths=[100, 500], family_sizes=[10, 50], tiled_lengths=[2000]),
+    'full': dict(algorithms=['global', 'local', 'gotoh'], lengths=[100, 1000, 5000, 20000], family_sizes=[10, 100, 1000],
+                 tiled_lengths=[20000]),
+}
+
+
+#%% Cases
+def suite_cases(suite, backends=None):
+    # Every case of a suite as a JSON-friendly dict; its name identifies it across runs
+    config = SUITES[suite]
+    if backends is None:
+        backends = available_backends()
+
+    cases = []
+    for algorithm in config['algorithms']:
+        for length in config['lengths']:
+            if length > FULL_MATRIX_MAX_LENGTH:
+                cases.append(dict(name=f'{algorithm}/score/len={length}', kind='pair', algorithm=algorithm,
+                                  mode='score', backend=None, length=length))
+                continue
+            for backend in backends:
+                if backend == 'reference' and length > REFERENCE_MAX_LENGTH:
+                    continue
+                cases.append(dict(name=f'{algorithm}/{backend}/len={length}', kind='pair', algorithm=algorithm,
+                                  mode='align', backend=backend, length=length))
+
+    for algorithm in TILED:
+        for length in config['tiled_lengths']:
+            for backend in available_backends(f'{algorithm}_block'):
+                if backend not in backends:
+                    continue
+                for workers in TILED_WORKERS:
+                    cases.append(dict(name=f'{algorithm}/tiled/{backend}/workers={workers}/len={length}', kind='tiled',
+                                      algorithm=algorithm, backend=backend, workers=workers, length=length))
+
+    for n in config['family_sizes']:
+        methods = ['score', 'kmers'] if n <= CENTER_STAR_SCORE_MAX_N else ['kmers']
+        for method in methods:
+            cases.append(dict(name=f'center-star/{method}/n={n}', kind='center-star', method=method,
+                              n=n, length=CENTER_STAR_LENGTH))
+    return cases
+
+
+def _pair_cells(lengths, idx1, idx2s):
+    # DP cells of aligning sequence idx1 against each of idx2s
+    return sum(lengths[idx1] * lengths[idx2] for idx2 in idx2s if idx2 != idx1)
+
+
+def run_case(case, seed=DEFAULT_SEED, repeats=DEFAULT_REPEATS):
+    # Times one case and returns its metrics. Meant to run in a fresh process (see run_suite()),
+    # so the peak RSS is that of this case alone
+    if case['kind'] == 'pair':
+        S1, S2 = sequence_family(f"{seed}/{case['name']}", 2, case['length'])
+        costs = default_costs(case['algorithm'])
+        run = score_pair if case['mode'] == 'score' else align_pair
+        # Untimed warm-up, so one-off costs like JIT compilation are not measured
+        run(case['algorithm'], costs, S1[:10], S2[:10], case['backend'])
+        work = lambda: run(case['algorithm'], costs, S1, S2, case['backend'])
+        cells = len(S1) * len(S2)
+    elif case['kind'] == 'tiled':
+        S1, S2 = sequence_family(f"{seed}/{case['name']}", 2, case['length'])
+        costs = default_costs(case['algorithm'])
+        run = TILED[case['algorithm']]
+        run(S1[:10], S2[:10], **costs, workers=case['workers'], backend=case['backend'])
+        work = lambda: run(S1, S2, **costs, workers=case['workers'], backend=case['backend'])
+        cells = len(S1) * len(S2)
+    else:
+        s_list = sequence_family(f"{seed}/{case['name']}", case['n'], case['length'])
+        costs = default_costs('global')
+        lengths = [len(S) for S in s_list]
+        N = len(s_list)
+
+        def work():
+            if case['method'] == 'score':
+                center_seq, st1s, st2s, extra, center_idx = find_center_star_by_score(s_list, costs, workers=1)
+            else:
+                center_seq, st1s, st2s, extra, center_idx = find_center_star_by_kmers(s_list, costs, workers=1)
+            MSA.from_center_star(st1s, st2s, center_seq).drop_gap_columns()
+            return extra, center_idx
+
+        extra, center_idx = work()
+        if case['method'] == 'score':
+            # Every unordered pair is scored (the default costs are symmetric)
+            cells = sum(_pair_cells(lengths, idx1, range(idx1 + 1, N)) for idx1 in range(N))
+        else:
+            cells = sum(_pair_cells(lengths, idx, range(N)) for idx in kmer_shortlist(extra))
+        cells += _pair_cells(lengths, center_idx, range(N))
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    seconds = []
+    for _ in range(repeats):
+        start_time = timer()
+        work()
+        seconds.append(timer() - start_time)
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss_unit = 1 if sys.platform == 'darwin' else 1024
+    return dict(case, seconds=seconds, best_seconds=min(seconds), median_seconds=statistics.median(seconds),
+                cells=cells, cells_per_second=cells / min(seconds) if min(seconds) > 0 else None,
+                peak_rss_mb=rss_after * rss_unit / 2 ** 20, rss_growth_mb=(rss_after - rss_before) * rss_unit / 2 ** 20)
+
+
+def run_suite(suite, seed=DEFAULT_SEED, repeats=DEFAULT_REPEATS, backends=None, only=None, log=sys.stderr):
+    # Runs every case (whose name contains only, if given) in its own process, one at a time
+    cases = [case for case in suite_cases(suite, backends) if only is None or only in case['name']]
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for idx, case in enumerate(cases, 1):
+        with context.Pool(1) as pool:
+            result = pool.apply(run_case, (case, seed, repeats))
+        results.append(result)
+        if log is not None:
+            rate = f"{result['cells_per_second']:.3g} cells/s" if result['cells_per_second'] else 'n/a'
+            print(f"[{idx}/{len(cases)}] {case['name']}: {result['best_seconds']:.4f}s, {rate}, "
+                  f"peak {result['peak_rss_mb']:.1f} MB", file=log)
+
+    machine = dict(python=platform.python_version(), numpy=np.__version__, platform=platform.platform(),
+                   processor=platform.processor(), cpus=multiprocessing.cpu_count())
+    return dict(suite=suite, seed=seed, repeats=repeats, created=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                machine=machine, results=results)
+
+
+#%% Comparison
+def compare(baseline, current, tolerance=DEFAULT_TOLERANCE):
+    # Matches cases by name; returns (name, baseline seconds, current seconds, time ratio, memory ratio, flags)
+    # for every case in both runs, where flags lists 'time' and/or 'memory' regressions beyond tolerance
+    baseline_results = {result['name']: result for result in baseline['results']}
+    rows = []
+    for result in current['results']:
+        old = baseline_results.get(result['name'])
+        if old is None:
+            continue
+        time_ratio = result['best_seconds'] / old['best_seconds'] if old['best_seconds'] > 0 else np.inf
+        memory_ratio = result['peak_rss_mb'] / old['peak_rss_mb'] if old['peak_rss_mb'] > 0 else np.inf
+        flags = []
+        if time_ratio > 1 + tolerance:
+            flags.append('time')
+        if memory_ratio > 1 + tolerance:
+            flags.append('memory')
+        rows.append((result['name'], old['best_seconds'], result['best_seconds'], time_ratio, memory_ratio, flags))
+    return rows
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Benchmark the aligners on seeded synthetic sequences')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='run a suite and save its results as JSON')
+    run.add_argument('--suite', choices=list(SUITES), default='quick')
+    run.add_argument('--output', default='-', help="JSON file, '-' for stdout")
+    run.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    run.add_argument('--repeats', type=int, default=DEFAULT_REPEATS)
+    run.add_argument('--backend', action='append', choices=available_backends(), dest='backends',
+                     help='backends to run (repeatable; default: all available)')
+    run.add_argument('--only', help='only the cases whose name contains this text, e.g. gotoh/numpy')
+
+    comparison = commands.add_parser('compare', help='compare two result files and flag regressions')
+    comparison.add_argument('baseline')
+    comparison.add_argument('current')
+    comparison.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                            help='relative slowdown or memory growth that counts as a regression')
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    if args.command == 'run':
+        report = run_suite(args.suite, args.seed, args.repeats, args.backends, args.only)
+        if args.output == '-':
+            json.dump(report, sys.stdout, indent=2)
+        else:
+            with open(args.output, 'w') as fh:
+                json.dump(report, fh, indent=2)
+    else:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        with open(args.current) as fh:
+            current = json.load(fh)
+        rows = compare(baseline, current, args.tolerance)
+        for name, old_seconds, new_seconds, time_ratio, memory_ratio, flags in rows:
+            status = f"REGRESSION ({', '.join(flags)})" if flags else 'ok'
+            print(f'{name}: {old_seconds:.4f}s -> {new_seconds:.4f}s (x{time_ratio:.2f} time, x{memory_ratio:.2f} memory) {status}')
+        regressions = sum(1 for row in rows if row[-1])
+        print(f'{len(rows)} cases compared, {regressions} regressions')
+        sys.exit(1 if regressions else 0)
@@ -1,7 +1,11 @@
 # Author: Jose G. Perez <jperez50@miners.utep.edu>
 import numpy as np
 from timeit import default_timer as timer
-from global_alignment import needleman_wunsch, reconstruct
+from batch_alignment import align_batch
+from instrumentation import Profile, subscribe, unsubscribe
+from kmer_distance import kmer_distance_sums, kmer_shortlist, DEFAULT_K, DEFAULT_SHORTLIST
+from msa import MSA
+from scoring import load_matrix
 from utils import get_input_float, get_input_boolean, get_input_int
 
 DEFAULT_INS_COST = -0.5
@@ -12,153 +16,171 @@ DEFAULT_MISMATCH_COST = -1
 
 #%% Functions
 def combine_sequences(seq_star_list, seq_list):
-    combined_star = ''
-    combined_seq_list = [''] * len(seq_list)
-    idxs = [0] * len(seq_list)
-
-    while True:
-        # Stop running when all the sequences are aligned
-        isRunning = True
-        for seq_list_idx, idx in enumerate(idxs):
-            seq = seq_list[seq_list_idx]
-            seq_len = len(seq)
-            if idx >= seq_len:
-                break
-
-        if not isRunning:
-            break
-
-        # Compare the star sequences, check if one of the star sequences has a gap
-        hasGap = False
-        for seq_star_num, seq_star in enumerate(seq_star_list):
-            seq_star_char_idx = idxs[seq_star_num]
-            try:
-                next_char = seq_star[seq_star_char_idx]
-            except IndexError:
-                return combined_star, combined_seq_list
-            if next_char == '-':
-                # print(f'Found a gap: {seq_star_num, seq_star}')
-                hasGap = True
-                idxs[seq_star_num] += 1
-                break
-
-        # There was a gap in one, add a gap to the NORMAL sequences
-        if hasGap:
-            combined_star += '-'
-            for seq_num in range(len(combined_seq_list)):
-                combined_seq_list[seq_num] += '-'
-        # There was no gap in any, so copy the character of each one to their respective sequences
-        else:
-            for seq_num in range(len(combined_seq_list)):
-                seq1 = seq_list[seq_num]
-                idx1 = idxs[seq_num]
-                combined_seq_list[seq_num] += seq1[idx1]
-                idxs[seq_num] += 1
-
-            combined_star += seq_star_list[seq_num][idx1]
-
-    return combined_star, combined_seq_list
+    # The center's pairwise alignments (st1s) and the other sequences' (st2s) merged into one MSA,
+    # returned as the center's row and the list of the other rows
+    rows = MSA.from_center_star(seq_star_list, seq_list).rows()
+    return rows[0], rows[1:]
 
 
-#%% Main
-print(r"\
- ██████╗███████╗███╗   ██╗████████╗███████╗██████╗     ███████╗████████╗ █████╗ ██████╗\
-██╔════╝██╔════╝████╗  ██║╚══██╔══╝██╔════╝██╔══██╗    ██╔════╝╚══██╔══╝██╔══██╗██╔══██╗\
-██║     █████╗  ██╔██╗ ██║   ██║   █████╗  ██████╔╝    ███████╗   ██║   ███████║██████╔╝\
-██║     ██╔══╝  ██║╚██╗██║   ██║   ██╔══╝  ██╔══██╗    ╚════██║   ██║   ██╔══██║██╔══██╗\
-╚██████╗███████╗██║ ╚████║   ██║   ███████╗██║  ██║    ███████║   ██║   ██║  ██║██║  ██║\
- ╚═════╝╚══════╝╚═╝  ╚═══╝   ╚═╝   ╚══════╝╚═╝  ╚═╝    ╚══════╝   ╚═╝   ╚═╝  ╚═╝╚═╝  ╚═╝\
-"
-)
-
-print("* Default penalty costs *")
-print(f"\tInsertion Cost={DEFAULT_INS_COST}, Deletion Cost={DEFAULT_DEL_COST}, Match Cost={DEFAULT_MATCH_COST}, Mismatch Cost={DEFAULT_MISMATCH_COST}")
-use_default = get_input_boolean('Do you want to use the above costs? [Y/N]')
-if use_default:
-    print("* Using default costs *")
-    ins_cost = DEFAULT_INS_COST
-    del_cost = DEFAULT_DEL_COST
-    match_cost = DEFAULT_MATCH_COST
-    mismatch_cost = DEFAULT_MISMATCH_COST
-else:
-    print("* Defining own costs *")
-    ins_cost = get_input_float('Please type the insertion penalty/cost')
-    del_cost = get_input_float('Please type the deletion penalty/cost')
-    match_cost = get_input_float('Please type the matching penalty/cost')
-    mismatch_cost = get_input_float('Please type the mismatching penalty/cost')
-
-s_list = []
-s_count = get_input_int('How many sequences will you align?')
-for idx in range(s_count):
-    next_seq = input(f'Input sequence #{idx+1}')
-    s_list.append(next_seq)
-
-select_center = get_input_boolean('Do you want to input the center star sequence? [Y/N]')
-if select_center:
-    center_star_seq = input('Input the center star sequence')
-    center_star_st1s = []
-    center_star_st2s = []
-    for seq in s_list:
-        if seq == center_star_seq:
-            continue
-
-        V, paths = needleman_wunsch(center_star_seq, seq, ins_cost, del_cost, match_cost, mismatch_cost)
-        st1, st2, score = reconstruct(center_star_seq, seq, V, paths)
-        center_star_st1s.append(st1)
-        center_star_st2s.append(st2)
-else:
-    print("Finding center star...")
-    start_time_total = timer()
-    best_d = np.inf
+def align_to_center(center_star_seq, s_list, costs, workers=None, cache=None):
+    pairs = [(center_star_seq, seq) for seq in s_list if seq != center_star_seq]
+    results = align_batch(pairs, 'global', costs, workers, cache=cache)
+    center_star_st1s = [st1 for st1, st2, score in results]
+    center_star_st2s = [st2 for st1, st2, score in results]
+    return center_star_st1s, center_star_st2s
+
+
+def find_center_star(s_list, costs, workers=None, cache=None):
+    # The center is the sequence with the highest total alignment score (the scores are similarities)
+    # against all the others, the first one on ties; find_center_star_by_score() and
+    # find_center_star_by_kmers() use the same rule.
+    # Every ordered pair is aligned in one batch, then the results are read back per candidate
+    pairs = [(seq1, seq2) for idx1, seq1 in enumerate(s_list) for idx2, seq2 in enumerate(s_list) if idx1 != idx2]
+    results = align_batch(pairs, 'global', costs, workers, cache=cache)
+
+    best_total = -np.inf
     center_star_seq = ''
     center_star_st1s = []
     center_star_st2s = []
+    others = len(s_list) - 1
     for idx1, seq1 in enumerate(s_list):
-        d_sum = 0
-        st1_list = []
-        st2_list = []
-        for idx2, seq2 in enumerate(s_list):
-            # Don't match
-            if idx1 == idx2:
-                continue
-
-            V, paths = needleman_wunsch(seq1, seq2, ins_cost, del_cost, match_cost, mismatch_cost)
-            st1, st2, score = reconstruct(seq1, seq2, V, paths)
-            st1_list.append(st1)
-            st2_list.append(st2)
-            d_sum += score
-
-        if d_sum < best_d:
-            best_d = d_sum
+        seq1_results = results[idx1 * others:(idx1 + 1) * others]
+        total = sum(score for st1, st2, score in seq1_results)
+
+        if total > best_total:
+            best_total = total
             center_star_seq = seq1
-            center_star_st1s = st1_list
-            center_star_st2s = st2_list
-
-    end_time_star = timer()
-    duration_sec = end_time_star - start_time_total
-    print(f"Finding center star took {duration_sec:.4f} seconds")
-    print(f"Center Star Sequence: {center_star_seq}")
-
-#%% Combine
-combined_star, combined_seq_list = combine_sequences(center_star_st1s, center_star_st2s)
-
-# Clean up
-idxs_to_erase = []
-for char_idx, char in enumerate(combined_star):
-    gap_count = 0
-    for seq in combined_seq_list:
-        if seq[char_idx] == '-':
-            gap_count += 1
-
-    if gap_count == len(combined_seq_list):
-        idxs_to_erase.append(char_idx)
-
-combined_star = ''.join([char for idx, char in enumerate(combined_star) if idx not in idxs_to_erase])
-for seq_idx in range(len(combined_seq_list)):
-    seq = combined_seq_list[seq_idx]
-    combined_seq_list[seq_idx] = ''.join([char for idx, char in enumerate(seq) if idx not in idxs_to_erase])
-
-print("* Alignment *")
-print(f"Sequence: {combined_star} <- Center Star")
-for st in combined_seq_list:
-    print(f"Sequence: {st}")
\ No newline at end of file
+            center_star_st1s = [st1 for st1, st2, score in seq1_results]
+            center_star_st2s = [st2 for st1, st2, score in seq1_results]
+    return center_star_seq, center_star_st1s, center_star_st2s
+
+
+def score_matrix(s_list, costs, workers=None, cache=None):
+    # scores[idx1, idx2] is the score of s_list[idx1] (as S1) against s_list[idx2] (as S2).
+    # Swapping S1 and S2 only swaps the insertion and deletion costs, so when they are equal
+    # every unordered pair is scored once
+    N = len(s_list)
+    upper = [(idx1, idx2) for idx1 in range(N) for idx2 in range(idx1 + 1, N)]
+    matrix = costs.get('matrix')
+    symmetric = costs['ins_cost'] == costs['del_cost'] and (matrix is None or np.array_equal(matrix, matrix.T))
+    idx_pairs = upper if symmetric else upper + [(idx2, idx1) for idx1, idx2 in upper]
+
+    pairs = [(s_list[idx1], s_list[idx2]) for idx1, idx2 in idx_pairs]
+    results = align_batch(pairs, 'global', costs, workers, score_only=True, cache=cache)
+
+    scores = np.zeros((N, N))
+    for (idx1, idx2), score in zip(idx_pairs, results):
+        scores[idx1, idx2] = score
+        if symmetric:
+            scores[idx2, idx1] = score
+    return scores
+
+
+def find_center_star_by_score(s_list, costs, workers=None, scores=None, cache=None):
+    # Same choice as find_center_star(), but only the center's alignments are traced back; the center's
+    # index in s_list is returned too, since duplicate sequences make it ambiguous by value.
+    # Pass the scores from an earlier run to skip scoring entirely, or a cache to skip the pairs
+    # that were already scored or aligned
+    if scores is None:
+        scores = score_matrix(s_list, costs, workers, cache)
+    center_idx = int(np.argmax(scores.sum(axis=1)))
+    center_star_seq = s_list[center_idx]
+
+    pairs = [(center_star_seq, seq) for idx, seq in enumerate(s_list) if idx != center_idx]
+    results = align_batch(pairs, 'global', costs, workers, cache=cache)
+    center_star_st1s = [st1 for st1, st2, score in results]
+    center_star_st2s = [st2 for st1, st2, score in results]
+    return center_star_seq, center_star_st1s, center_star_st2s, scores, center_idx
+
+
+def find_center_star_by_kmers(s_list, costs, workers=None, k=DEFAULT_K, shortlist=DEFAULT_SHORTLIST, cache=None):
+    # Alignment-free screen for large families: the shortlist of sequences closest to all the others
+    # by k-mer distance is confirmed with alignment scores against every sequence (shortlist * N
+    # alignments instead of N^2), keeping the candidate with the highest total score (the lowest index on ties)
+    distance_sums = kmer_distance_sums(s_list, k)
+    candidates = kmer_shortlist(distance_sums, shortlist)
+
+    center_idx = int(candidates[0])
+    if len(candidates) > 1:
+        idx_pairs = [(idx1, idx2) for idx1 in candidates for idx2 in range(len(s_list)) if idx1 != idx2]
+        pairs = [(s_list[idx1], s_list[idx2]) for idx1, idx2 in idx_pairs]
+        results = align_batch(pairs, 'global', costs, workers, score_only=True, cache=cache)
+
+        totals = dict.fromkeys(candidates, 0.0)
+        for (idx1, idx2), score in zip(idx_pairs, results):
+            totals[idx1] += score
+        center_idx = int(max(sorted(candidates), key=lambda idx: totals[idx]))
+    center_star_seq = s_list[center_idx]
+
+    pairs = [(center_star_seq, seq) for idx, seq in enumerate(s_list) if idx != center_idx]
+    results = align_batch(pairs, 'global', costs, workers, cache=cache)
+    center_star_st1s = [st1 for st1, st2, score in results]
+    center_star_st2s = [st2 for st1, st2, score in results]
+    return center_star_seq, center_star_st1s, center_star_st2s, distance_sums, center_idx
+
+
+#%% Main
+if __name__ == '__main__':
+    print(r"\
+     ██████╗███████╗███╗   ██╗████████╗███████╗██████╗     ███████╗████████╗ █████╗ ██████╗\
+    ██╔════╝██╔════╝████╗  ██║╚══██╔══╝██╔════╝██╔══██╗    ██╔════╝╚══██╔══╝██╔══██╗██╔══██╗\
+    ██║     █████╗  ██╔██╗ ██║   ██║   █████╗  ██████╔╝    ███████╗   ██║   ███████║██████╔╝\
+    ██║     ██╔══╝  ██║╚██╗██║   ██║   ██╔══╝  ██╔══██╗    ╚════██║   ██║   ██╔══██║██╔══██╗\
+    ╚██████╗███████╗██║ ╚████║   ██║   ███████╗██║  ██║    ███████║   ██║   ██║  ██║██║  ██║\
+     ╚═════╝╚══════╝╚═╝  ╚═══╝   ╚═╝   ╚══════╝╚═╝  ╚═╝    ╚══════╝   ╚═╝   ╚═╝  ╚═╝╚═╝  ╚═╝\
+    "
+    )
+
+    print("* Default penalty costs *")
+    print(f"\tInsertion Cost={DEFAULT_INS_COST}, Deletion Cost={DEFAULT_DEL_COST}, Match Cost={DEFAULT_MATCH_COST}, Mismatch Cost={DEFAULT_MISMATCH_COST}")
+    use_default = get_input_boolean('Do you want to use the above costs? [Y/N]')
+    if use_default:
+        print("* Using default costs *")
+        ins_cost = DEFAULT_INS_COST
+        del_cost = DEFAULT_DEL_COST
+        match_cost = DEFAULT_MATCH_COST
+        mismatch_cost = DEFAULT_MISMATCH_COST
+    else:
+        print("* Defining own costs *")
+        ins_cost = get_input_float('Please type the insertion penalty/cost')
+        del_cost = get_input_float('Please type the deletion penalty/cost')
+        match_cost = get_input_float('Please type the matching penalty/cost')
+        mismatch_cost = get_input_float('Please type the mismatching penalty/cost')
+
+    s_list = []
+    s_count = get_input_int('How many sequences will you align?')
+    for idx in range(s_count):
+        next_seq = input(f'Input sequence #{idx+1}')
+        s_list.append(next_seq)
+
+    costs = dict(ins_cost=ins_cost, del_cost=del_cost, match_cost=match_cost, mismatch_cost=mismatch_cost)
+    if get_input_boolean('Do you want to score with a substitution matrix such as BLOSUM62? [Y/N]'):
+        costs['matrix'] = load_matrix(input('Type the matrix name or file path'))
+
+    # Time per phase (fills, tracebacks, MSA merge) through the instrumentation hooks
+    profile = subscribe(Profile())
+    select_center = get_input_boolean('Do you want to input the center star sequence? [Y/N]')
+    if select_center:
+        center_star_seq = input('Input the center star sequence')
+        center_star_st1s, center_star_st2s = align_to_center(center_star_seq, s_list, costs)
+    else:
+        print("Finding center star...")
+        start_time_total = timer()
+        center_star_seq, center_star_st1s, center_star_st2s, scores, center_idx = find_center_star_by_score(s_list, costs)
+
+        end_time_star = timer()
+        duration_sec = end_time_star - start_time_total
+        print(f"Finding center star took {duration_sec:.4f} seconds")
+        print(f"Center Star Sequence: {center_star_seq}")
+
+    #%% Combine
+    # Merge the pairwise alignments, then drop the columns that are gaps in every sequence
+    msa = MSA.from_center_star(center_star_st1s, center_star_st2s, center_star_seq).drop_gap_columns()
+    combined_star, *combined_seq_list = msa.rows()
+    unsubscribe(profile)
+    print(profile.summary())
+
+    print("* Alignment *")
+    print(f"Sequence: {combined_star} <- Center Star")
+    for st in combined_seq_list:
+        print(f"Sequence: {st}")
\ No newline at end of file
@@ -0,0 +1,194 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import argparse
+import itertools
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+
+import global_alignment
+import gotoh
+from alignment_cache import AlignmentCache, DEFAULT_MAX_ENTRIES
+from backends import available_backends
+from batch_alignment import align_batch
+from center_star import find_center_star_by_score, find_center_star_by_kmers
+from kmer_distance import DEFAULT_SHORTLIST, MAX_K
+from msa import MSA
+from scoring import load_matrix
+from utils import read_fasta
+
+DEFAULT_WORKERS = 1
+DEFAULT_CHUNK_SIZE = 64
+
+
+def open_input(stack, path):
+    if path == '-':
+        return sys.stdin
+    return stack.enter_context(open(path))
+
+
+def costs_from_args(args):
+    if args.command == 'gotoh':
+        costs = dict(match_cost=args.match_cost, mismatch_cost=args.mismatch_cost, a=args.gap_open, b=args.gap_extend)
+    else:
+        costs = dict(ins_cost=args.ins_cost, del_cost=args.del_cost, match_cost=args.match_cost, mismatch_cost=args.mismatch_cost)
+    if args.matrix is not None:
+        costs['matrix'] = load_matrix(args.matrix)
+    return costs
+
+
+def read_pairs(stack, args):
+    records = read_fasta(open_input(stack, args.input))
+    if args.targets is None:
+        # Zipping an iterator with itself pairs up consecutive records
+        return zip(records, records)
+    return zip(records, read_fasta(open_input(stack, args.targets)))
+
+
+class ResultWriter:
+    # Writes one line per result as soon as it is available; TSV gets a header from the first row
+    def __init__(self, out, fmt):
+        self.out = out
+        self.fmt = fmt
+        self.has_header = False
+
+    def write(self, fields):
+        if self.fmt == 'jsonl':
+            self.out.write(json.dumps(fields) + '\n')
+            return
+        if not self.has_header:
+            self.out.write('\t'.join(fields) + '\n')
+            self.has_header = True
+        self.out.write('\t'.join(str(value) for value in fields.values()) + '\n')
+
+
+def result_fields(args, id1, id2, result):
+    fields = dict(id1=id1, id2=id2)
+    if not args.score_only:
+        st1, st2, score = result
+        fields.update(score=float(score), st1=st1, st2=st2)
+    elif args.command == 'local':
+        score, row_idx, col_idx = result
+        fields.update(score=float(score), end1=int(col_idx), end2=int(row_idx))
+    else:
+        fields.update(score=float(result))
+    return fields
+
+
+#%% Commands
+def run_pairs(args, writer, cache=None):
+    costs = costs_from_args(args)
+    with ExitStack() as stack:
+        pairs = read_pairs(stack, args)
+        # One pool of workers for the whole stream, fed a batch at a time
+        executor = None
+        if args.workers > 1:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=args.workers))
+
+        # Only one batch of records is held at a time
+        batch_size = args.workers * args.chunk_size
+        while True:
+            batch = list(itertools.islice(pairs, batch_size))
+            if not batch:
+                break
+
+            sequences = [(S1, S2) for (id1, S1), (id2, S2) in batch]
+            results = align_batch(sequences, args.command, costs, args.workers, args.chunk_size, args.score_only, cache,
+                                  args.backend, executor)
+            for ((id1, S1), (id2, S2)), result in zip(batch, results):
+                writer.write(result_fields(args, id1, id2, result))
+            writer.out.flush()
+
+
+def run_center_star(args, writer, cache=None):
+    with ExitStack() as stack:
+        records = list(read_fasta(open_input(stack, args.input)))
+    names = [name for name, seq in records]
+    s_list = [seq for name, seq in records]
+
+    costs = costs_from_args(args)
+    if args.kmer is not None:
+        center_star_seq, center_star_st1s, center_star_st2s, distance_sums, center_idx = find_center_star_by_kmers(
+            s_list, costs, args.workers, args.kmer, args.shortlist, cache)
+    else:
+        center_star_seq, center_star_st1s, center_star_st2s, scores, center_idx = find_center_star_by_score(
+            s_list, costs, args.workers, cache=cache)
+    msa = MSA.from_center_star(center_star_st1s, center_star_st2s, center_star_seq).drop_gap_columns()
+    combined_star, *combined_seq_list = msa.rows()
+
+    others = [name for idx, name in enumerate(names) if idx != center_idx]
+    writer.write(dict(id=names[center_idx], center=True, sequence=combined_star))
+    for name, st in zip(others, combined_seq_list):
+        writer.write(dict(id=name, center=False, sequence=st))
+
+
+def positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f'must be at least 1 (got {value})')
+    return value
+
+
+def kmer_length(text):
+    value = int(text)
+    if not 1 <= value <= MAX_K:
+        raise argparse.ArgumentTypeError(f'must be between 1 and {MAX_K} (got {value})')
+    return value
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Align sequences read from FASTA files (or stdin)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    for command in ['global', 'local', 'gotoh', 'center-star']:
+        sub = commands.add_parser(command)
+        sub.add_argument('input', nargs='?', default='-', help="FASTA file, '-' for stdin")
+        sub.add_argument('--format', choices=['tsv', 'jsonl'], default='tsv')
+        sub.add_argument('--output', default='-', help="output file, '-' for stdout")
+        sub.add_argument('--workers', type=positive_int, default=DEFAULT_WORKERS)
+        sub.add_argument('--chunk-size', type=positive_int, default=DEFAULT_CHUNK_SIZE)
+        sub.add_argument('--match-cost', type=float, default=global_alignment.DEFAULT_MATCH_COST)
+        sub.add_argument('--mismatch-cost', type=float, default=global_alignment.DEFAULT_MISMATCH_COST)
+        sub.add_argument('--matrix', help='substitution matrix name (e.g. BLOSUM62) or NCBI-format file; '
+                                          'replaces --match-cost/--mismatch-cost')
+        sub.add_argument('--cache', help='sqlite file that keeps results between runs')
+        sub.add_argument('--cache-size', type=int, default=DEFAULT_MAX_ENTRIES, help='results kept in memory')
+        sub.add_argument('--backend', choices=available_backends(),
+                         help='matrix fill implementation (default: $ALIGNMENT_BACKEND, else numpy)')
+
+        if command == 'gotoh':
+            sub.add_argument('--gap-open', type=float, default=gotoh.DEFAULT_A, help='a in f(k) = a + (b * k)')
+            sub.add_argument('--gap-extend', type=float, default=gotoh.DEFAULT_B, help='b in f(k) = a + (b * k)')
+        else:
+            sub.add_argument('--ins-cost', type=float, default=global_alignment.DEFAULT_INS_COST)
+            sub.add_argument('--del-cost', type=float, default=global_alignment.DEFAULT_DEL_COST)
+
+        if command != 'center-star':
+            sub.add_argument('--targets', help='second FASTA file; records are paired in order with the input. '
+                                               'Without it, consecutive input records are paired')
+            sub.add_argument('--score-only', action='store_true', help='linear-memory scores, no alignment')
+        else:
+            sub.add_argument('--kmer', type=kmer_length, metavar='K',
+                             help='pick the center with a k-mer distance screen instead of scoring every pair')
+            sub.add_argument('--shortlist', type=positive_int, default=DEFAULT_SHORTLIST,
+                             help='k-mer screen candidates confirmed with alignment scores')
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    with ExitStack() as stack:
+        out = sys.stdout if args.output == '-' else stack.enter_context(open(args.output, 'w'))
+        writer = ResultWriter(out, args.format)
+        cache = None
+        if args.cache is not None:
+            cache = AlignmentCache(args.cache, args.cache_size)
+            stack.callback(cache.close)
+
+        if args.command == 'center-star':
+            run_center_star(args, writer, cache)
+        else:
+            run_pairs(args, writer, cache)
+
+        if cache is not None:
+            print(f'Cache: {cache.stats()}', file=sys.stderr)
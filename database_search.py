@@ -0,0 +1,177 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import heapq
+import json
+import os
+
+import numpy as np
+
+from kmer_distance import kmer_codes
+from local_alignment import DEFAULT_INS_COST, DEFAULT_DEL_COST, DEFAULT_MATCH_COST, DEFAULT_MISMATCH_COST, \
+    smith_waterman_banded, banded_best_cell, trace_local
+from scoring import encode, score_table
+from utils import read_fasta
+
+DEFAULT_SEED_K = 7
+DEFAULT_SEARCH_BAND = 16
+DEFAULT_MIN_SEEDS = 2
+DEFAULT_TOP_K = 10
+# Chains are only extended while their ungapped score is at least this fraction of the weakest kept hit
+DEFAULT_UNGAPPED_RATIO = 0.5
+INDEX_ARRAYS = ['residues', 'offsets', 'kmer_keys', 'kmer_starts', 'positions']
+
+
+#%% Reference database
+class ReferenceDatabase:
+    # Every reference sequence back to back in one uint8 array (sequence i is
+    # residues[offsets[i]:offsets[i + 1]]) and a k-mer index over it: the positions of k-mer
+    # kmer_keys[n] are positions[kmer_starts[n]:kmer_starts[n + 1]]
+    def __init__(self, names, residues, offsets, kmer_keys, kmer_starts, positions, k):
+        self.names = names
+        self.residues = residues
+        self.offsets = offsets
+        self.kmer_keys = kmer_keys
+        self.kmer_starts = kmer_starts
+        self.positions = positions
+        self.k = k
+
+    @staticmethod
+    def build(records, k=DEFAULT_SEED_K):
+        # records are (name, sequence) pairs, e.g. from utils.read_fasta()
+        records = list(records)
+        names = [name for name, seq in records]
+        codes = [encode(seq) for name, seq in records]
+        offsets = np.concatenate(([0], np.cumsum([len(c) for c in codes]))).astype(np.int64)
+        residues = np.concatenate(codes + [np.zeros(0, dtype=np.uint8)])
+
+        # K-mers never span two sequences: each sequence's k-mers are taken on their own
+        kmers = [kmer_codes(seq, k) for name, seq in records]
+        all_kmers = np.concatenate(kmers + [np.zeros(0, dtype=np.int64)])
+        all_positions = np.concatenate([offsets[idx] + np.arange(len(c)) for idx, c in enumerate(kmers)] +
+                                       [np.zeros(0, dtype=np.int64)])
+        order = np.argsort(all_kmers, kind='stable')
+        kmer_keys, first = np.unique(all_kmers[order], return_index=True)
+        kmer_starts = np.concatenate((first, [len(order)])).astype(np.int64)
+        return ReferenceDatabase(names, residues, offsets, kmer_keys, kmer_starts, all_positions[order], k)
+
+    @staticmethod
+    def from_fasta(path, k=DEFAULT_SEED_K):
+        with open(path) as fh:
+            return ReferenceDatabase.build(read_fasta(fh), k)
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in INDEX_ARRAYS:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(directory, 'index.json'), 'w') as fh:
+            json.dump(dict(k=self.k, names=self.names), fh)
+
+    @staticmethod
+    def load(directory, mmap=True):
+        # With mmap the arrays stay on disk and only the pages a search touches are read
+        with open(os.path.join(directory, 'index.json')) as fh:
+            meta = json.load(fh)
+        arrays = [np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r' if mmap else None) for name in INDEX_ARRAYS]
+        return ReferenceDatabase(meta['names'], *arrays, meta['k'])
+
+    def __len__(self):
+        return len(self.names)
+
+    def sequence(self, idx):
+        return self.residues[self.offsets[idx]:self.offsets[idx + 1]].tobytes().decode('latin-1')
+
+    def seeds(self, query):
+        # Every exact k-mer match as (reference index, reference position, query position)
+        query_kmers = kmer_codes(query, self.k)
+        slots = np.searchsorted(self.kmer_keys, query_kmers)
+        found = slots < len(self.kmer_keys)
+        found[found] = self.kmer_keys[slots[found]] == query_kmers[found]
+        query_pos = np.flatnonzero(found)
+        starts = np.asarray(self.kmer_starts[slots[found]])
+        counts = np.asarray(self.kmer_starts[slots[found] + 1]) - starts
+
+        # Expand every (start, count) range of the index into its positions without a Python loop
+        ranks = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        positions = np.asarray(self.positions[np.repeat(starts, counts) + ranks])
+        ref_idx = np.searchsorted(self.offsets, positions, side='right') - 1
+        return ref_idx, positions - np.asarray(self.offsets)[ref_idx], np.repeat(query_pos, counts)
+
+
+def chain_seeds(ref_idx, ref_pos, query_pos, band=DEFAULT_SEARCH_BAND, min_seeds=DEFAULT_MIN_SEEDS):
+    # Groups seeds of the same reference whose diagonals (ref_pos - query_pos) lie within band of
+    # each other; returns (reference index, distinct diagonals) for every chain of at least min_seeds seeds
+    diagonals = ref_pos - query_pos
+    order = np.lexsort((diagonals, ref_idx))
+    ref_idx, diagonals = ref_idx[order], diagonals[order]
+
+    new_chain = (ref_idx[1:] != ref_idx[:-1]) | (diagonals[1:] - diagonals[:-1] > band)
+    bounds = np.concatenate(([0], np.flatnonzero(new_chain) + 1, [len(order)])) if len(order) else []
+    return [(int(ref_idx[start]), np.unique(diagonals[start:end]))
+            for start, end in zip(bounds[:-1], bounds[1:]) if end - start >= min_seeds]
+
+
+def ungapped_score(query_codes, ref_codes, diagonal, scores):
+    # Best ungapped local score along one diagonal (ref_pos - query_pos): the largest sum of
+    # consecutive substitution scores, from the prefix sums
+    query_start = max(0, -diagonal)
+    query_end = min(len(query_codes), len(ref_codes) - diagonal)
+    if query_end <= query_start:
+        return 0.0
+    pair_scores = scores[ref_codes[query_start + diagonal:query_end + diagonal], query_codes[query_start:query_end]]
+    prefix = np.concatenate(([0], np.cumsum(pair_scores)))
+    return float((prefix - np.minimum.accumulate(prefix)).max())
+
+
+#%% Search
+def search(database, query, ins_cost=DEFAULT_INS_COST, del_cost=DEFAULT_DEL_COST, match_cost=DEFAULT_MATCH_COST,
+           mismatch_cost=DEFAULT_MISMATCH_COST, top_k=DEFAULT_TOP_K, band=DEFAULT_SEARCH_BAND,
+           min_seeds=DEFAULT_MIN_SEEDS, ungapped_ratio=DEFAULT_UNGAPPED_RATIO, matrix=None, x_drop=None):
+    # Seed-and-extend local search. Exact k-mer seeds are chained along nearby diagonals, each chain is
+    # ranked by its best ungapped diagonal score, and only a band of Smith-Waterman around the chain is
+    # filled. Once top_k hits are held, chains whose ungapped score is below ungapped_ratio times the
+    # weakest of them are not extended. With x_drop each banded extension is also cut off once every
+    # cell of a row is more than x_drop below its best score. Returns the top_k hits, best first, each as
+    # (name, st1, st2, score, (ref_start, query_start), (ref_end, query_end)) with st1 from the query
+    scores = score_table(match_cost, mismatch_cost, matrix)
+    query_codes = encode(query)
+
+    candidates = []
+    for ref, diagonals in chain_seeds(*database.seeds(query), band, min_seeds):
+        ref_codes = database.residues[database.offsets[ref]:database.offsets[ref + 1]]
+        best = max(ungapped_score(query_codes, ref_codes, int(diagonal), scores) for diagonal in diagonals)
+        candidates.append((best, ref, int(diagonals[0]), int(diagonals[-1])))
+    candidates.sort(key=lambda candidate: -candidate[0])
+
+    heap = []
+    seen = set()
+    for ungapped, ref, low, high in candidates:
+        if len(heap) == top_k and ungapped < ungapped_ratio * heap[0][0]:
+            break
+        reference = database.sequence(ref)
+
+        # Reference window that holds the whole query on every diagonal of the chain, plus the band
+        window_start = max(0, low - band)
+        window_end = min(len(reference), high + band + len(query))
+        window = reference[window_start:window_end]
+
+        # Query along the columns, window along the rows: diagonal d is col - row = window_start - d
+        V, paths = smith_waterman_banded(query, window, ins_cost, del_cost, match_cost, mismatch_cost,
+                                         window_start - high - band, window_start - low + band, matrix, x_drop)
+        row_idx, col_idx = banded_best_cell(V)
+        score = V[row_idx, col_idx]
+        if score <= 0:
+            continue
+
+        st1, st2, (row_start, col_start), _ = trace_local(query, window, V, paths, row_idx, col_idx)
+        start = (window_start + row_start, col_start)
+        end = (window_start + row_idx, col_idx)
+        if (ref, start, end) in seen:
+            continue
+        seen.add((ref, start, end))
+
+        # Min-heap of the best top_k so far; ties keep the hit found first
+        entry = (score, -len(seen), (database.names[ref], st1, st2, score, start, end))
+        if len(heap) < top_k:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+    return [hit for score, order, hit in sorted(heap, reverse=True)]
@@ -2,20 +2,28 @@
 import numpy as np
 from timeit import default_timer as timer
 
-from utils import get_input_float, get_input_boolean, combine
+from instrumentation import Profile, phase
+from scoring import encode, score_table
+from utils import get_input_float, get_input_boolean, MatrixView, gap_row, BandedMatrix, band_limits, band_exit_indels, \
+    band_columns, band_diagonal, band_up, scratch_matrix, row_tiles, flush_matrices, DEFAULT_TILE_ROWS
 
-np.set_printoptions(threshold=np.inf, linewidth=500)
 DEFAULT_INS_COST = -0.5
 DEFAULT_DEL_COST = -0.5
 DEFAULT_MATCH_COST = 5
 DEFAULT_MISMATCH_COST = -1
 PATH_CHARACTERS = ['↖', '↑', '←']
+HIRSCHBERG_CUTOFF = 64 * 64
+DEFAULT_BAND = 16
 
 
 #%% Algorithm: Needleman-Wunsch
-def needleman_wunsch(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost):
-    V = np.zeros((len(S2) + 1, len(S1) + 1))
-    paths = np.zeros_like(V)
+def needleman_wunsch(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, matrix=None, scratch_dir=None):
+    scores = score_table(match_cost, mismatch_cost, matrix)
+    codes1 = encode(S1)
+    codes2 = encode(S2)
+
+    V = scratch_matrix((len(S2) + 1, len(S1) + 1), float, scratch_dir, 'V')
+    paths = scratch_matrix(V.shape, np.uint8, scratch_dir, 'paths')
     paths[:, 0] = 1
     paths[0, :] = 2
     # Initialization
@@ -28,23 +36,201 @@ def needleman_wunsch(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost):
         V[i, 0] = V[i-1, 0] + del_cost
 
     for i in range(1, V.shape[0]):
+        # Substitution scores of S2[i - 1] against all of S1 in one gather
+        row_scores = scores[codes2[i - 1], codes1]
         for j in range(1, V.shape[1]):
-            # Check if it's a match or mismatch
-            if S1[j - 1] == S2[i - 1]:
-                mcost = match_cost
-            else:
-                mcost = mismatch_cost
-
-            choices = [V[i-1, j-1] + mcost,
+            choices = [V[i-1, j-1] + row_scores[j - 1],
                        V[i-1, j] + del_cost,
                        V[i, j-1] + ins_cost]
 
             idx = np.argmax(choices)
             paths[i, j] = idx
             V[i, j] = choices[idx]
+    flush_matrices(V, paths)
+    return V, paths
+
+
+#%% Algorithm: Needleman-Wunsch (anti-diagonal wavefront)
+def needleman_wunsch_wavefront(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, matrix=None):
+    scores = score_table(match_cost, mismatch_cost, matrix)
+    V = np.zeros((len(S2) + 1, len(S1) + 1))
+    paths = np.zeros(V.shape, dtype=np.uint8)
+    paths[:, 0] = 1
+    paths[0, :] = 2
+    # Initialization (accumulate adds sequentially, same as the cell-by-cell loop)
+    V[0, 1:] = np.add.accumulate(np.full(len(S1), ins_cost, dtype=V.dtype))
+    V[1:, 0] = np.add.accumulate(np.full(len(S2), del_cost, dtype=V.dtype))
+
+    codes1 = encode(S1)
+    codes2 = encode(S2)
+    rows, cols = V.shape
+    V_flat = V.reshape(-1)
+    paths_flat = paths.reshape(-1)
+
+    # Every cell on anti-diagonal d = i + j only depends on diagonals d-1 and d-2
+    for d in range(2, rows + cols - 1):
+        i = np.arange(max(1, d - cols + 1), min(rows - 1, d - 1) + 1)
+        j = d - i
+        idx = i * cols + j
+
+        diagonal = V_flat[idx - cols - 1] + scores[codes2[i - 1], codes1[j - 1]]
+        up = V_flat[idx - cols] + del_cost
+        left = V_flat[idx - 1] + ins_cost
+
+        # Ties resolve in the same order as np.argmax in the loop: diagonal, up, left
+        best = np.maximum(np.maximum(diagonal, up), left)
+        paths_flat[idx] = np.where(diagonal == best, 0, np.where(up == best, 1, 2))
+        V_flat[idx] = best
+    return V, paths
+
+
+#%% Algorithm: Needleman-Wunsch (row tiles, optionally out of core)
+def needleman_wunsch_rows(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, matrix=None, scratch_dir=None,
+                          tile_rows=DEFAULT_TILE_ROWS):
+    # Same V and paths as needleman_wunsch() (bit for bit when the costs are exact in binary, see
+    # utils.gap_row()), one row at a time. With scratch_dir both are np.memmap
+    # files (V.npy, paths.npy) written sequentially a tile of rows at a time, which
+    # utils.open_scratch_matrix() can reopen for reconstruct() later
+    scores = score_table(match_cost, mismatch_cost, matrix)
+    codes1 = encode(S1)
+    codes2 = encode(S2)
+
+    V = scratch_matrix((len(S2) + 1, len(S1) + 1), float, scratch_dir, 'V')
+    paths = scratch_matrix(V.shape, np.uint8, scratch_dir, 'paths')
+    row = np.zeros(V.shape[1])
+    row[1:] = np.add.accumulate(np.full(len(S1), ins_cost))
+    V[0] = row
+    paths[0] = 2
+
+    V_tile = np.empty((tile_rows, V.shape[1]))
+    paths_tile = np.empty((tile_rows, V.shape[1]), dtype=np.uint8)
+    paths_tile[:, 0] = 1
+    for start, end in row_tiles(V.shape[0], tile_rows):
+        for i in range(start, end):
+            diagonal = row[:-1] + scores[codes2[i - 1], codes1]
+            up = row[1:] + del_cost
+            best = np.maximum(diagonal, up)
+            row = gap_row(row[0] + del_cost, best, ins_cost)
+
+            # Ties resolve in the same order as np.argmax in the loop: diagonal, up, left
+            V_tile[i - start] = row
+            paths_tile[i - start, 1:] = np.where(diagonal == row[1:], 0, np.where(up == row[1:], 1, 2))
+        V[start:end] = V_tile[:end - start]
+        paths[start:end] = paths_tile[:end - start]
+    flush_matrices(V, paths)
+    return V, paths
+
+
+#%% Algorithm: Needleman-Wunsch (score only, two rolling rows)
+def needleman_wunsch_last_row(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, matrix=None):
+    scores = score_table(match_cost, mismatch_cost, matrix)
+    codes1 = encode(S1)
+    row = np.zeros(len(S1) + 1)
+    row[1:] = np.add.accumulate(np.full(len(S1), ins_cost))
+
+    for code2 in encode(S2):
+        best = np.maximum(row[:-1] + scores[code2, codes1], row[1:] + del_cost)
+        row = gap_row(row[0] + del_cost, best, ins_cost)
+    return row
+
+
+def needleman_wunsch_score(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, matrix=None):
+    # Keep the shorter sequence along the row so memory is O(min(n, m))
+    if len(S1) > len(S2):
+        S1, S2 = S2, S1
+        ins_cost, del_cost = del_cost, ins_cost
+        matrix = None if matrix is None else matrix.T
+    return needleman_wunsch_last_row(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, matrix)[-1]
+
+
+#%% Algorithm: Needleman-Wunsch (one block of a tiled wavefront, see tiled_wavefront.py)
+def needleman_wunsch_block(codes1, codes2, scores, ins_cost, del_cost, top, left, keep_paths=False):
+    # top is V[r0 - 1, c0:c1] and left is V[r0 - 1:r1, c0 - 1] (its first value is the corner).
+    # Returns the bottom row, the right column (from the corner row down) and, if asked, the paths
+    h, w = len(codes2), len(codes1)
+    row = top
+    right = np.empty(h + 1)
+    right[0] = top[-1]
+    paths = np.empty((h, w), dtype=np.uint8) if keep_paths else None
+    for k in range(h):
+        diagonal = np.concatenate(([left[k]], row[:-1])) + scores[codes2[k], codes1]
+        up = row + del_cost
+        best = np.maximum(diagonal, up)
+        row = gap_row(left[k + 1], best, ins_cost)[1:]
+        right[k + 1] = row[-1]
+
+        # Same tie-breaks as needleman_wunsch_rows(): diagonal, up, left
+        if keep_paths:
+            paths[k] = np.where(diagonal == row, 0, np.where(up == row, 1, 2))
+    return row, right, paths
+
+
+#%% Algorithm: Hirschberg (linear-space Needleman-Wunsch)
+def hirschberg(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, matrix=None):
+    # Small enough: the full matrices fit in a constant amount of memory
+    if len(S1) <= 1 or len(S2) <= 1 or (len(S1) + 1) * (len(S2) + 1) <= HIRSCHBERG_CUTOFF:
+        V, paths = needleman_wunsch_wavefront(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, matrix)
+        return reconstruct(S1, S2, V, paths)
+
+    # Find where an optimal path crosses the middle row, then solve both halves
+    mid = len(S2) // 2
+    upper = needleman_wunsch_last_row(S1, S2[:mid], ins_cost, del_cost, match_cost, mismatch_cost, matrix)
+    lower = needleman_wunsch_last_row(S1[::-1], S2[mid:][::-1], ins_cost, del_cost, match_cost, mismatch_cost, matrix)[::-1]
+    scores = upper + lower
+    split = np.argmax(scores)
+
+    st1_upper, st2_upper, _ = hirschberg(S1[:split], S2[:mid], ins_cost, del_cost, match_cost, mismatch_cost, matrix)
+    st1_lower, st2_lower, _ = hirschberg(S1[split:], S2[mid:], ins_cost, del_cost, match_cost, mismatch_cost, matrix)
+    return st1_upper + st1_lower, st2_upper + st2_lower, scores[split]
+
+
+#%% Algorithm: Needleman-Wunsch (banded)
+def needleman_wunsch_banded(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, k, matrix=None):
+    scores = score_table(match_cost, mismatch_cost, matrix)
+    lo, hi = band_limits(len(S2), len(S1), k)
+    V = BandedMatrix((len(S2) + 1, len(S1) + 1), lo, hi)
+    paths = BandedMatrix(V.shape, lo, hi, dtype=np.uint8, fill=0)
+    codes1 = np.concatenate(([0], encode(S1)))
+    codes2 = encode(S2)
+
+    # Initialization
+    j, inside = band_columns(0, lo, hi, len(S1))
+    row = np.full(len(j), -np.inf)
+    row[inside] = np.concatenate(([0], np.add.accumulate(np.full(hi, ins_cost))))[j[inside]]
+    V.band[0] = row
+    paths.band[0] = 2
+
+    for i in range(1, len(S2) + 1):
+        j, inside = band_columns(i, lo, hi, len(S1))
+        diagonal = band_diagonal(row, j, scores[codes2[i - 1], codes1])
+        up = band_up(row) + del_cost
+
+        best = np.maximum(diagonal, up)
+        best[~inside] = -np.inf
+        row = gap_row(-np.inf, best, ins_cost)[1:]
+        row[~inside] = -np.inf
+
+        paths.band[i] = np.where(diagonal == row, 0, np.where(up == row, 1, 2))
+        V.band[i] = row
     return V, paths
 
 
+def needleman_wunsch_adaptive(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, k=DEFAULT_BAND, matrix=None):
+    # Double the band until no alignment leaving it could beat the banded score
+    end = len(S1) - len(S2)
+    best_pair = score_table(match_cost, mismatch_cost, matrix).max()
+    bound = lambda g: (len(S1) - (g + end) / 2) * best_pair + ((g + end) / 2) * ins_cost + ((g - end) / 2) * del_cost
+
+    while True:
+        V, paths = needleman_wunsch_banded(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, k, matrix)
+        exit_indels = band_exit_indels(len(S2), len(S1), V.lo, V.hi)
+        if exit_indels is None:
+            return V, paths
+        if V[len(S2), len(S1)] >= max(bound(exit_indels), bound(len(S1) + len(S2))):
+            return V, paths
+        k = max(1, 2 * k)
+
+
 def reconstruct(S1, S2, V, paths):
     row_idx = V.shape[0] - 1
     col_idx = V.shape[1] - 1
@@ -121,23 +307,23 @@ if __name__ == '__main__':
         mismatch_cost = get_input_float('Please type the mismatching penalty/cost')
 
     #%% Algorithm Timing
-    start_time = timer()
-    V, paths = needleman_wunsch(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost)
-    st1, st2, score = reconstruct(S1, S2, V, paths)
+    # The total, and each phase on its own through the instrumentation hooks
+    with Profile() as profile:
+        start_time = timer()
+        with phase('fill', algorithm='global', backend='reference', cells=(len(S1) + 1) * (len(S2) + 1)):
+            V, paths = needleman_wunsch(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost)
+        with phase('traceback', algorithm='global'):
+            st1, st2, score = reconstruct(S1, S2, V, paths)
 
-    combined = combine(V, paths, PATH_CHARACTERS)
-
-    end_time = timer()
-    duration_sec = end_time - start_time
+        end_time = timer()
+        duration_sec = end_time - start_time
 
     #%% Results
     print("** Results **")
     print(f"\tFor: Insertion Cost={ins_cost}, Deletion Cost={del_cost}, Match Cost={match_cost}, Mismatch Cost={mismatch_cost}")
 
     print(f"Calculation took {duration_sec:.4f} seconds")
-    print(f"V=\n{V}")
-    print(f"Paths=\n{paths}")
-    print(f"Combined=\n{combined}")
+    print(profile.summary())
 
     print(f"Original Inputs:")
     print(f"S1: {S1}")
@@ -145,4 +331,14 @@ if __name__ == '__main__':
 
     print(f"Alignment Score={score}")
     print(f"ST1: {st1}")
-    print(f"ST2: {st2}")
\ No newline at end of file
+    print(f"ST2: {st2}")
+
+    #%% Matrices (opt-in)
+    # Only a window is formatted; the whole matrix can be streamed to a file instead
+    if get_input_boolean('Do you want to see the matrix around the alignment end? [Y/N]'):
+        view = MatrixView(V, paths, PATH_CHARACTERS)
+        print(f"Combined=\n{view.render(*view.around(V.shape[0] - 1, V.shape[1] - 1))}")
+    path = input('Type a file name to write the whole matrix to (leave empty to skip)')
+    if path:
+        with open(path, 'w') as fh:
+            MatrixView(V, paths, PATH_CHARACTERS).write(fh)
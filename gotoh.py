@@ -2,31 +2,47 @@
 import numpy as np
 from timeit import default_timer as timer
 
-from utils import get_input_float, get_input_boolean, combine
+from instrumentation import Profile, phase, report
+from scoring import encode, score_table
+from utils import get_input_float, get_input_boolean, MatrixView, affine_gap_row, BandedMatrix, band_limits, band_exit_indels, \
+    band_columns, band_diagonal, band_up, scratch_matrix, row_tiles, flush_matrices, xdrop_extent, DEFAULT_TILE_ROWS
 
-np.set_printoptions(threshold=np.inf, linewidth=500)
 DEFAULT_A = 2
 DEFAULT_B = 0.5
 DEFAULT_MATCH_COST = 5
 DEFAULT_MISMATCH_COST = -1
+DEFAULT_BAND = 16
 
 PATH_F_CHARACTERS = ['↑', '↓↓']
 PATH_G_CHARACTERS = ['↖', '↓↓', '↑↑']
 PATH_E_CHARACTERS = ['←', '↑↑']
 
+# All three traceback directions share one byte per cell: G in bits 0-1, E in bit 2, F in bit 3
+G_PATH_SHIFT = 0
+E_PATH_SHIFT = 2
+F_PATH_SHIFT = 3
 
-def gotoh(S1, S2, match_cost, mismatch_cost, a, b):
+
+def check_gap_open(a):
+    # The row kernels take E as a running max over max(diagonal, F), which is only right when opening
+    # a gap never beats extending one (a >= 0); gotoh() has no such limit
+    if a < 0:
+        raise ValueError(f'This kernel needs a gap opening cost a >= 0 (got {a}); use gotoh() instead')
+
+
+def gotoh(S1, S2, match_cost, mismatch_cost, a, b, matrix=None, scratch_dir=None):
     f = lambda k: a + (b * k)
+    scores = score_table(match_cost, mismatch_cost, matrix)
+    codes1 = encode(S1)
+    codes2 = encode(S2)
 
-    G = np.zeros((len(S2) + 1, len(S1) + 1))
-    F = np.zeros_like(G)
-    E = np.zeros_like(G)
+    G = scratch_matrix((len(S2) + 1, len(S1) + 1), float, scratch_dir, 'G')
+    F = scratch_matrix(G.shape, float, scratch_dir, 'F')
+    E = scratch_matrix(G.shape, float, scratch_dir, 'E')
 
-    G_paths = np.zeros_like(G)
-    G_paths[0, :] = 1
-    G_paths[:, 0] = 2
-    F_paths = np.zeros_like(F)
-    E_paths = np.zeros_like(E)
+    paths = scratch_matrix(G.shape, np.uint8, scratch_dir, 'paths')
+    paths[0, :] = 1 << G_PATH_SHIFT
+    paths[:, 0] = 2 << G_PATH_SHIFT
 
     for j in range(1, len(S1) + 1):
         G[0, j] = E[0, j] = -1 * f(j)
@@ -38,41 +54,368 @@ def gotoh(S1, S2, match_cost, mismatch_cost, a, b):
     F[0, :] = -np.inf
 
     for i in range(1, G.shape[0]):
+        # Substitution scores of S2[i - 1] against all of S1 in one gather
+        row_scores = scores[codes2[i - 1], codes1]
         for j in range(1, G.shape[1]):
             # *************** F ***************
             f_choices = [F[i - 1, j] - b,
                          G[i - 1, j] - f(1)]
             f_idx = np.argmax(f_choices)
-            F_paths[i, j] = f_idx
             F[i, j] = f_choices[f_idx]
 
             # *************** E ***************
             e_choices = [E[i, j - 1] - b,
                          G[i, j - 1] - f(1)]
             e_idx = np.argmax(e_choices)
-            E_paths[i, j] = e_idx
             E[i, j] = e_choices[e_idx]
 
             # *************** G ***************
-            if S1[j - 1] == S2[i - 1]:
-                mcost = match_cost
-            else:
-                mcost = mismatch_cost
-
-            g_choices = [G[i - 1, j - 1] + mcost,
+            g_choices = [G[i - 1, j - 1] + row_scores[j - 1],
                          E[i, j],
                          F[i, j]]
             g_idx = np.argmax(g_choices)
-            G_paths[i, j] = g_idx
             G[i, j] = g_choices[g_idx]
 
-    return F, E, G, F_paths, E_paths, G_paths
+            paths[i, j] = (g_idx << G_PATH_SHIFT) | (e_idx << E_PATH_SHIFT) | (f_idx << F_PATH_SHIFT)
 
+    flush_matrices(F, E, G, paths)
+    return F, E, G, paths
 
-def reconstruct(S1, S2, F, E, G, F_paths, E_paths, G_paths):
-    # Start in the bottom-right corner of G
-    row_idx = G.shape[0] - 1
-    col_idx = G.shape[1] - 1
+
+#%% Algorithm: Gotoh (row-vectorized)
+def gotoh_vectorized(S1, S2, match_cost, mismatch_cost, a, b, matrix=None, scratch_dir=None, tile_rows=DEFAULT_TILE_ROWS):
+    # Same matrices and paths as gotoh(), one whole row of F, E and G at a time. With scratch_dir
+    # all four are np.memmap files (F.npy, E.npy, G.npy, paths.npy) written a tile of rows at a time.
+    # A negative a breaks the row recurrences (see check_gap_open()), so those costs go to the loop
+    if a < 0:
+        return gotoh(S1, S2, match_cost, mismatch_cost, a, b, matrix, scratch_dir)
+    f = lambda k: a + (b * k)
+    scores = score_table(match_cost, mismatch_cost, matrix)
+    codes1 = encode(S1)
+    codes2 = encode(S2)
+
+    shape = (len(S2) + 1, len(S1) + 1)
+    G = scratch_matrix(shape, float, scratch_dir, 'G')
+    F = scratch_matrix(shape, float, scratch_dir, 'F')
+    E = scratch_matrix(shape, float, scratch_dir, 'E')
+    paths = scratch_matrix(shape, np.uint8, scratch_dir, 'paths')
+
+    G_row = np.zeros(shape[1])
+    G_row[1:] = -1 * f(np.arange(1, len(S1) + 1, dtype=float))
+    F_row = np.full(shape[1], -np.inf)
+    E_row = G_row.copy()
+    E_row[0] = -np.inf
+    G[0], F[0], E[0] = G_row, F_row, E_row
+    paths[0] = 1 << G_PATH_SHIFT
+    paths[0, 0] = 2 << G_PATH_SHIFT
+
+    G_tile = np.empty((tile_rows, shape[1]))
+    F_tile = np.empty_like(G_tile)
+    E_tile = np.empty_like(G_tile)
+    paths_tile = np.empty((tile_rows, shape[1]), dtype=np.uint8)
+    paths_tile[:, 0] = 2 << G_PATH_SHIFT
+    for start, end in row_tiles(shape[0], tile_rows):
+        for i in range(start, end):
+            # *************** F ***************
+            f_extend = F_row[1:] - b
+            f_open = G_row[1:] - f(1)
+            F_row = np.concatenate(([-1 * f(float(i))], np.maximum(f_extend, f_open)))
+            f_idx = (f_extend < f_open).astype(np.uint8)
+
+            # *************** E ***************
+            diagonal = G_row[:-1] + scores[codes2[i - 1], codes1]
+            H = np.maximum(diagonal, F_row[1:])
+            E_row = affine_gap_row(-np.inf, np.concatenate(([F_row[0]], H)), f(1), b)
+
+            # *************** G ***************
+            G_row = np.concatenate(([F_row[0]], np.maximum(H, E_row[1:])))
+            e_idx = (E_row[:-1] - b < G_row[:-1] - f(1)).astype(np.uint8)
+            g_idx = np.where(diagonal == G_row[1:], 0, np.where(E_row[1:] == G_row[1:], 1, 2)).astype(np.uint8)
+
+            G_tile[i - start], F_tile[i - start], E_tile[i - start] = G_row, F_row, E_row
+            paths_tile[i - start, 1:] = (g_idx << G_PATH_SHIFT) | (e_idx << E_PATH_SHIFT) | (f_idx << F_PATH_SHIFT)
+        G[start:end], F[start:end], E[start:end] = G_tile[:end - start], F_tile[:end - start], E_tile[:end - start]
+        paths[start:end] = paths_tile[:end - start]
+
+    flush_matrices(F, E, G, paths)
+    return F, E, G, paths
+
+
+def gotoh_xdrop(S1, S2, match_cost, mismatch_cost, a, b, x_drop, matrix=None):
+    # Affine extension from the top-left corner: a cell whose G is more than x_drop below the best G
+    # so far is pruned (-inf in F, E and G), so each row is only computed over the columns that live
+    # cells of the row above can reach, plus the E run to their right; the fill stops at the first row
+    # without a live cell. The extension ends at the best cell of G (pass it to reconstruct() as end).
+    # With x_drop=np.inf this is gotoh(). Returns F, E, G, paths and how much of the matrix was computed
+    check_gap_open(a)
+    f = lambda k: a + (b * k)
+    scores = score_table(match_cost, mismatch_cost, matrix)
+    codes1 = encode(S1)
+    codes2 = encode(S2)
+
+    G = np.full((len(S2) + 1, len(S1) + 1), -np.inf)
+    F = np.full(G.shape, -np.inf)
+    E = np.full(G.shape, -np.inf)
+    paths = np.zeros(G.shape, dtype=np.uint8)
+    last_col = G.shape[1] - 1
+
+    # Row 0 is one gap run, alive while -f(j) stays within x_drop of G[0, 0] = 0
+    best = 0
+    hi = xdrop_extent(-a, -b, -x_drop, last_col)
+    G[0, 0] = 0
+    G[0, 1:hi + 1] = E[0, 1:hi + 1] = -1 * f(np.arange(1, hi + 1, dtype=float))
+    paths[0, :hi + 1] = 1 << G_PATH_SHIFT
+    paths[0, 0] = 2 << G_PATH_SHIFT
+
+    cells = hi + 1
+    rows = 1
+    lo = 0
+    for i in range(1, G.shape[0]):
+        rows += 1
+        # Cells reachable from the live columns lo..hi of the row above
+        if lo == 0:
+            G[i, 0] = F[i, 0] = -1 * f(i)
+            paths[i, 0] = 2 << G_PATH_SHIFT
+        start, end = max(lo, 1), min(hi + 1, last_col)
+        if start <= end:
+            # *************** F ***************
+            f_extend = F[i - 1, start:end + 1] - b
+            f_open = G[i - 1, start:end + 1] - f(1)
+            F[i, start:end + 1] = np.maximum(f_extend, f_open)
+            f_idx = (f_extend < f_open).astype(np.uint8)
+
+            # *************** E ***************
+            # The cell left of start is column 0 or pruned, so E only opens from it
+            diagonal = G[i - 1, start - 1:end] + scores[codes2[i - 1], codes1[start - 1:end]]
+            H = np.maximum(diagonal, F[i, start:end + 1])
+            E[i, start:end + 1] = affine_gap_row(G[i, start - 1] - f(1), H, f(1), b)
+
+            # *************** G ***************
+            G[i, start:end + 1] = np.maximum(H, E[i, start:end + 1])
+            e_idx = (E[i, start - 1:end] - b < G[i, start - 1:end] - f(1)).astype(np.uint8)
+            g_idx = np.where(diagonal == G[i, start:end + 1], 0, np.where(E[i, start:end + 1] == G[i, start:end + 1], 1, 2)).astype(np.uint8)
+            paths[i, start:end + 1] = (g_idx << G_PATH_SHIFT) | (e_idx << E_PATH_SHIFT) | (f_idx << F_PATH_SHIFT)
+        best = max(best, G[i, lo:end + 1].max())
+        threshold = best - x_drop
+
+        # Past end only a run of E is possible: its first cell opens or extends a gap, the rest extend it
+        stop = end
+        if end < last_col:
+            first = max(E[i, end] - b, G[i, end] - f(1))
+            stop = end + xdrop_extent(first + b, -b, threshold, last_col - end)
+            if stop > end:
+                G[i, end + 1:stop + 1] = E[i, end + 1:stop + 1] = first - b * np.arange(stop - end)
+                e_idx = (E[i, end:stop] - b < G[i, end:stop] - f(1)).astype(np.uint8)
+                paths[i, end + 1:stop + 1] = (1 << G_PATH_SHIFT) | (e_idx << E_PATH_SHIFT)
+        cells += stop - lo + 1
+
+        pruned = G[i, lo:stop + 1] < threshold
+        live = np.flatnonzero(~pruned)
+        for M in (F, E, G):
+            M[i, lo:stop + 1][pruned] = -np.inf
+        if len(live) == 0:
+            break
+        lo, hi = lo + int(live[0]), lo + int(live[-1])
+    stats = dict(cells=cells, total_cells=G.size, rows=rows)
+    report('xdrop', algorithm='gotoh', **stats)
+    return F, E, G, paths, stats
+
+
+def unpack_paths(paths):
+    F_paths = (paths >> F_PATH_SHIFT) & 0b1
+    E_paths = (paths >> E_PATH_SHIFT) & 0b1
+    G_paths = (paths >> G_PATH_SHIFT) & 0b11
+    return F_paths, E_paths, G_paths
+
+
+def gotoh_banded(S1, S2, match_cost, mismatch_cost, a, b, k, matrix=None):
+    check_gap_open(a)
+    f = lambda k: a + (b * k)
+    scores = score_table(match_cost, mismatch_cost, matrix)
+
+    lo, hi = band_limits(len(S2), len(S1), k)
+    shape = (len(S2) + 1, len(S1) + 1)
+    G = BandedMatrix(shape, lo, hi)
+    F = BandedMatrix(shape, lo, hi)
+    E = BandedMatrix(shape, lo, hi)
+    paths = BandedMatrix(shape, lo, hi, dtype=np.uint8, fill=0)
+    codes1 = np.concatenate(([0], encode(S1)))
+    codes2 = encode(S2)
+
+    # Initialization
+    j, inside = band_columns(0, lo, hi, len(S1))
+    G_row = np.where(inside, -1 * f(j), -np.inf)
+    G_row[j == 0] = 0
+    E_row = np.where(inside & (j >= 1), G_row, -np.inf)
+    F_row = np.full(len(j), -np.inf)
+    G.band[0], E.band[0], F.band[0] = G_row, E_row, F_row
+    paths.band[0] = np.where(j == 0, 2, 1) << G_PATH_SHIFT
+
+    for i in range(1, len(S2) + 1):
+        j, inside = band_columns(i, lo, hi, len(S1))
+
+        # *************** F ***************
+        f_extend = band_up(F_row) - b
+        f_open = band_up(G_row) - f(1)
+        F_row = np.maximum(f_extend, f_open)
+        F_row[j == 0] = -1 * f(i)
+        f_idx = np.where((f_extend >= f_open) | (j == 0), 0, 1)
+
+        # *************** E ***************
+        diagonal = band_diagonal(G_row, j, scores[codes2[i - 1], codes1])
+        H = np.maximum(diagonal, F_row)
+        H[~inside] = -np.inf
+        E_row = affine_gap_row(-np.inf, H, f(1), b)
+        E_row[~inside | (j == 0)] = -np.inf
+
+        # *************** G ***************
+        G_row = np.maximum(H, E_row)
+        e_extend = np.concatenate(([-np.inf], E_row[:-1])) - b
+        e_open = np.concatenate(([-np.inf], G_row[:-1])) - f(1)
+        e_idx = np.where(e_extend >= e_open, 0, 1)
+        g_idx = np.where(diagonal == G_row, 0, np.where(E_row == G_row, 1, 2))
+
+        G.band[i], E.band[i], F.band[i] = G_row, E_row, F_row
+        paths.band[i] = (g_idx << G_PATH_SHIFT) | (e_idx << E_PATH_SHIFT) | (f_idx << F_PATH_SHIFT)
+    return F, E, G, paths
+
+
+def gotoh_adaptive(S1, S2, match_cost, mismatch_cost, a, b, k=DEFAULT_BAND, matrix=None):
+    # Double the band until no alignment leaving it could beat the banded score; leaving and
+    # re-entering the band takes at least two gaps of opposite directions
+    best_pair = score_table(match_cost, mismatch_cost, matrix).max()
+    bound = lambda g: ((len(S1) + len(S2) - g) / 2) * best_pair - 2 * a - b * g
+
+    while True:
+        F, E, G, paths = gotoh_banded(S1, S2, match_cost, mismatch_cost, a, b, k, matrix)
+        exit_gaps = band_exit_indels(len(S2), len(S1), G.lo, G.hi)
+        if exit_gaps is None:
+            return F, E, G, paths
+        if G[len(S2), len(S1)] >= max(bound(exit_gaps), bound(len(S1) + len(S2))):
+            return F, E, G, paths
+        k = max(1, 2 * k)
+
+
+def gotoh_last_row(S1, S2, match_cost, mismatch_cost, a, b, tb=None, matrix=None):
+    # G and F on the last row; tb is the opening cost of a gap running down column 0
+    check_gap_open(a)
+    f = lambda k: a + (b * k)
+    if tb is None:
+        tb = a
+
+    scores = score_table(match_cost, mismatch_cost, matrix)
+    codes1 = encode(S1)
+    G = -1 * f(np.arange(len(S1) + 1, dtype=float))
+    G[0] = 0
+    F = np.full_like(G, -np.inf)
+
+    for i, code2 in enumerate(encode(S2), 1):
+        mcost = scores[code2, codes1]
+        F = np.maximum(F - b, G - f(1))
+        F[0] = -1 * (tb + (b * i))
+
+        H = np.concatenate(([F[0]], np.maximum(G[:-1] + mcost, F[1:])))
+        E = affine_gap_row(-np.inf, H, f(1), b)
+        G = np.maximum(H, E)
+    return G, F
+
+
+def gotoh_score(S1, S2, match_cost, mismatch_cost, a, b, matrix=None):
+    # The recurrences are symmetric in S1/S2, so keep the shorter one along the row
+    if len(S1) > len(S2):
+        S1, S2 = S2, S1
+        matrix = None if matrix is None else matrix.T
+    return gotoh_last_row(S1, S2, match_cost, mismatch_cost, a, b, matrix=matrix)[0][-1]
+
+
+#%% Algorithm: Gotoh (one block of a tiled wavefront, see tiled_wavefront.py)
+def gotoh_block(codes1, codes2, scores, a, b, top, left, keep_paths=False):
+    # top is (G, F) of row r0 - 1 over columns c0:c1 and left is (G, E) of column c0 - 1 over rows
+    # r0 - 1:r1 (the corner's G is the first value; its E is not used). Returns the bottom (G, F),
+    # the right (G, E) and, if asked, the packed paths
+    f1 = a + b
+    G_row, F_row = top
+    G_left, E_left = left
+    h, w = len(codes2), len(codes1)
+    G_right = np.empty(h + 1)
+    E_right = np.full(h + 1, -np.inf)
+    G_right[0] = G_row[-1]
+    paths = np.empty((h, w), dtype=np.uint8) if keep_paths else None
+    for k in range(h):
+        # *************** F ***************
+        f_extend = F_row - b
+        f_open = G_row - f1
+        F_row = np.maximum(f_extend, f_open)
+
+        # *************** E ***************
+        # Started from the left edge's E and G
+        diagonal = np.concatenate(([G_left[k]], G_row[:-1])) + scores[codes2[k], codes1]
+        H = np.maximum(diagonal, F_row)
+        E_row = affine_gap_row(max(E_left[k + 1] - b, G_left[k + 1] - f1), H, f1, b)
+
+        # *************** G ***************
+        G_row = np.maximum(H, E_row)
+        G_right[k + 1], E_right[k + 1] = G_row[-1], E_row[-1]
+        if keep_paths:
+            f_idx = (f_extend < f_open).astype(np.uint8)
+            e_idx = (np.concatenate(([E_left[k + 1]], E_row[:-1])) - b < np.concatenate(([G_left[k + 1]], G_row[:-1])) - f1).astype(np.uint8)
+            g_idx = np.where(diagonal == G_row, 0, np.where(E_row == G_row, 1, 2)).astype(np.uint8)
+            paths[k] = (g_idx << G_PATH_SHIFT) | (e_idx << E_PATH_SHIFT) | (f_idx << F_PATH_SHIFT)
+    return (G_row, F_row), (G_right, E_right), paths
+
+
+#%% Algorithm: Myers-Miller (linear-space Gotoh)
+def myers_miller(S1, S2, match_cost, mismatch_cost, a, b, matrix=None):
+    check_gap_open(a)
+    return _myers_miller(S1, S2, match_cost, mismatch_cost, a, b, a, a, matrix)
+
+
+def _myers_miller(S1, S2, match_cost, mismatch_cost, a, b, tb, te, matrix=None):
+    # tb/te are the opening costs of a vertical gap touching the top/bottom boundary;
+    # they drop to 0 when the gap continues one that was already paid for by the caller
+    f = lambda k: np.where(k > 0, a + (b * k), 0)
+
+    if len(S2) == 0:
+        return S1, '-' * len(S1), -1 * float(f(len(S1)))
+    if len(S1) == 0:
+        return '-' * len(S2), S2, -1 * (min(tb, te) + (b * len(S2)))
+    if len(S2) == 1:
+        # Either S2 lines up with one character of S1, or it is a gap at the cheaper boundary
+        j = np.arange(len(S1))
+        mcost = score_table(match_cost, mismatch_cost, matrix)[encode(S2)[0], encode(S1)]
+        aligned = mcost - f(j) - f(len(S1) - j - 1)
+        best = np.argmax(aligned)
+        gap = -1 * (min(tb, te) + b) - float(f(len(S1)))
+        if aligned[best] >= gap:
+            return S1, '-' * best + S2 + '-' * (len(S1) - best - 1), aligned[best]
+        elif tb <= te:
+            return '-' + S1, S2 + '-' * len(S1), gap
+        else:
+            return S1 + '-', '-' * len(S1) + S2, gap
+
+    # Forward and reverse passes meet at the middle row, either between two cells (type 1)
+    # or inside a vertical gap that crosses it, whose opening cost was counted twice (type 2)
+    mid = len(S2) // 2
+    CC, DD = gotoh_last_row(S1, S2[:mid], match_cost, mismatch_cost, a, b, tb, matrix)
+    RR, SS = gotoh_last_row(S1[::-1], S2[mid:][::-1], match_cost, mismatch_cost, a, b, te, matrix)
+    type1 = CC + RR[::-1]
+    type2 = DD + SS[::-1] + a
+    split1 = np.argmax(type1)
+    split2 = np.argmax(type2)
+
+    if type1[split1] >= type2[split2]:
+        st1_upper, st2_upper, _ = _myers_miller(S1[:split1], S2[:mid], match_cost, mismatch_cost, a, b, tb, a, matrix)
+        st1_lower, st2_lower, _ = _myers_miller(S1[split1:], S2[mid:], match_cost, mismatch_cost, a, b, a, te, matrix)
+        return st1_upper + st1_lower, st2_upper + st2_lower, type1[split1]
+
+    st1_upper, st2_upper, _ = _myers_miller(S1[:split2], S2[:mid - 1], match_cost, mismatch_cost, a, b, tb, 0, matrix)
+    st1_lower, st2_lower, _ = _myers_miller(S1[split2:], S2[mid + 1:], match_cost, mismatch_cost, a, b, 0, te, matrix)
+    return st1_upper + '--' + st1_lower, st2_upper + S2[mid - 1:mid + 1] + st2_lower, type2[split2]
+
+
+def reconstruct(S1, S2, F, E, G, paths, end=None):
+    # Start in the bottom-right corner of G, or at the (row, col) cell end, e.g. where an X-drop extension stopped
+    row_idx, col_idx = end if end is not None else (G.shape[0] - 1, G.shape[1] - 1)
     score = G[row_idx, col_idx]
 
     st1 = ''
@@ -83,7 +426,7 @@ def reconstruct(S1, S2, F, E, G, F_paths, E_paths, G_paths):
     current_array = 'G'
     while row_idx > 0 and col_idx > 0:
         if current_array == 'G':
-            direction = G_paths[row_idx, col_idx]
+            direction = (paths[row_idx, col_idx] >> G_PATH_SHIFT) & 0b11
             diagonal_g = direction == 0
             jump_to_e = direction == 1
             jump_to_f = direction == 2
@@ -104,7 +447,7 @@ def reconstruct(S1, S2, F, E, G, F_paths, E_paths, G_paths):
                 continue
 
         elif current_array == 'E':
-            direction = E_paths[row_idx, col_idx]
+            direction = (paths[row_idx, col_idx] >> E_PATH_SHIFT) & 0b1
             left_e = direction == 0
             jump_to_g = direction == 1
 
@@ -117,7 +460,7 @@ def reconstruct(S1, S2, F, E, G, F_paths, E_paths, G_paths):
                 current_array = 'G'
                 continue
         else:
-            direction = F_paths[row_idx, col_idx]
+            direction = (paths[row_idx, col_idx] >> F_PATH_SHIFT) & 0b1
             up_f = direction == 0
             jump_to_g = direction == 1
 
@@ -168,24 +511,22 @@ if __name__ == '__main__':
         mismatch_cost = get_input_float('Please type the mismatching penalty/cost')
 
     #%% Algorithm Timing
-    start_time = timer()
-    F, E, G, F_paths, E_paths, G_paths = gotoh(S1, S2, match_cost, mismatch_cost, a, b)
-    st1, st2, score = reconstruct(S1, S2, F, E, G, F_paths, E_paths, G_paths)
-
-    combined_F = combine(F, F_paths, PATH_F_CHARACTERS)
-    combined_G = combine(G, G_paths, PATH_G_CHARACTERS)
-    combined_E = combine(E, E_paths, PATH_E_CHARACTERS)
+    # The total, and each phase on its own through the instrumentation hooks
+    with Profile() as profile:
+        start_time = timer()
+        with phase('fill', algorithm='gotoh', backend='reference', cells=(len(S1) + 1) * (len(S2) + 1)):
+            F, E, G, paths = gotoh(S1, S2, match_cost, mismatch_cost, a, b)
+        with phase('traceback', algorithm='gotoh'):
+            st1, st2, score = reconstruct(S1, S2, F, E, G, paths)
 
-    end_time = timer()
-    duration_sec = end_time - start_time
+        end_time = timer()
+        duration_sec = end_time - start_time
 
     #%% Results
     print("** Results **")
 
     print(f"Calculation took {duration_sec:.4f} seconds")
-    print(f"Combined_F=\n{combined_F}")
-    print(f"Combined_G=\n{combined_G}")
-    print(f"Combined_E=\n{combined_E}")
+    print(profile.summary())
 
     print(f"Original Inputs:")
     print(f"S1: {S1}")
@@ -194,3 +535,17 @@ if __name__ == '__main__':
     print(f"Alignment Score={score}")
     print(f"ST1: {st1}")
     print(f"ST2: {st2}")
+
+    #%% Matrices (opt-in)
+    # Only a window is formatted; the whole matrices can be streamed to files instead
+    views = {'F': MatrixView(F, paths, PATH_F_CHARACTERS, F_PATH_SHIFT, 0b1),
+             'G': MatrixView(G, paths, PATH_G_CHARACTERS, G_PATH_SHIFT, 0b11),
+             'E': MatrixView(E, paths, PATH_E_CHARACTERS, E_PATH_SHIFT, 0b1)}
+    if get_input_boolean('Do you want to see the matrices around the alignment end? [Y/N]'):
+        for name, view in views.items():
+            print(f"Combined_{name}=\n{view.render(*view.around(G.shape[0] - 1, G.shape[1] - 1))}")
+    path = input('Type a file name prefix to write the whole matrices to (leave empty to skip)')
+    if path:
+        for name, view in views.items():
+            with open(f'{path}_{name}.tsv', 'w') as fh:
+                view.write(fh)
@@ -0,0 +1,100 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+from contextlib import nullcontext
+from timeit import default_timer as timer
+
+# Events the aligners report, with their fields:
+#   fill       seconds, algorithm, backend, cells    full DP matrices filled (batch_alignment.align_pair)
+#   score      seconds, algorithm, cells             linear-space scoring (batch_alignment.score_pair, tiled_wavefront)
+#   traceback  seconds, algorithm                    alignment read back from the matrices
+#   render     seconds, cells                        utils.MatrixView formatting a window of a matrix
+#   msa_merge  seconds, sequences                    MSA.from_center_star()
+#   allocate   bytes, name, on_disk                  utils.scratch_matrix()
+#   xdrop      algorithm, cells, total_cells, rows   cells an X-drop fill actually computed
+#   cache      memory_hits, disk_hits, misses        one AlignmentCache.lookup()
+# With no subscribers every hook is a single truth test, so they can stay in place in production
+_subscribers = []
+_NO_PHASE = nullcontext()
+
+
+def subscribe(callback):
+    # callback(event, fields) is called for every event from now on
+    _subscribers.append(callback)
+    return callback
+
+
+def unsubscribe(callback):
+    _subscribers.remove(callback)
+
+
+def enabled():
+    return bool(_subscribers)
+
+
+def report(event, **fields):
+    if _subscribers:
+        for callback in list(_subscribers):
+            callback(event, fields)
+
+
+def replay(events):
+    # Reports (event, fields) pairs recorded elsewhere, e.g. by a Profile in a worker process whose
+    # own reports never reach this process's subscribers
+    for event, fields in events:
+        report(event, **fields)
+
+
+class _Phase:
+    def __init__(self, event, fields):
+        self.event = event
+        self.fields = fields
+
+    def __enter__(self):
+        self.start = timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            report(self.event, seconds=timer() - self.start, **self.fields)
+
+
+def phase(event, **fields):
+    # Times a with-block and reports it as event; without subscribers this is a shared do-nothing context
+    if not _subscribers:
+        return _NO_PHASE
+    return _Phase(event, fields)
+
+
+class Profile:
+    # Collects every event while the with-block runs (or between subscribe/unsubscribe) and sums
+    # the numeric fields per event
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event, fields):
+        self.events.append((event, fields))
+
+    def __enter__(self):
+        subscribe(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        unsubscribe(self)
+
+    def totals(self):
+        # {event: {'count': n, field: sum, ...}} over the numeric fields
+        totals = {}
+        for event, fields in self.events:
+            total = totals.setdefault(event, {'count': 0})
+            total['count'] += 1
+            for name, value in fields.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    total[name] = total.get(name, 0) + value
+        return totals
+
+    def summary(self):
+        lines = []
+        for event, total in self.totals().items():
+            values = ', '.join(f'{name}={value:.4f}' if isinstance(value, float) else f'{name}={value}'
+                               for name, value in total.items())
+            lines.append(f'{event}: {values}')
+        return '\n'.join(lines)
@@ -0,0 +1,166 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import numpy as np
+
+from global_alignment import DEFAULT_INS_COST, DEFAULT_DEL_COST, DEFAULT_MATCH_COST, DEFAULT_MISMATCH_COST
+from instrumentation import phase
+from scoring import encode, score_table
+from utils import gap_row
+
+# Pairs advanced together by one kernel call; small enough that a batch of DP rows stays in cache.
+# The traceback paths take (longest S2) x batch x (longest S1) bytes
+DEFAULT_BATCH_SIZE = 64
+# Compact traceback letters, as in alignment_cache.compact_alignment(): M has a character on both
+# sides, D a gap in S1 (an up move) and I a gap in S2 (a left move)
+OPS = np.array(['', 'M', 'D', 'I'])
+
+
+def pad_codes(sequences):
+    # (B, L) codes of the sequences, padded with 0 up to the longest, and their lengths
+    lengths = np.array([len(S) for S in sequences], dtype=np.int64)
+    codes = np.zeros((len(sequences), lengths.max(initial=0)), dtype=np.uint8)
+    codes[np.arange(codes.shape[1]) < lengths[:, None]] = np.concatenate([encode(S) for S in sequences] +
+                                                                         [np.zeros(0, dtype=np.uint8)])
+    return codes, lengths
+
+
+#%% Batch kernels
+def needleman_wunsch_batch(pairs, ins_cost=DEFAULT_INS_COST, del_cost=DEFAULT_DEL_COST, match_cost=DEFAULT_MATCH_COST,
+                           mismatch_cost=DEFAULT_MISMATCH_COST, matrix=None, traceback=False, batch_size=DEFAULT_BATCH_SIZE):
+    # Global scores of many (S1, S2) pairs at once, as an array in input order. With traceback, also
+    # each alignment as compact run-length ops (see alignment_cache.expand_alignment()), else None
+    scores, ends, starts, ops = _run_batches(pairs, False, traceback, batch_size,
+                                             ins_cost, del_cost, match_cost, mismatch_cost, matrix)
+    return scores, ops
+
+
+def smith_waterman_batch(pairs, ins_cost=DEFAULT_INS_COST, del_cost=DEFAULT_DEL_COST, match_cost=DEFAULT_MATCH_COST,
+                         mismatch_cost=DEFAULT_MISMATCH_COST, matrix=None, traceback=False, batch_size=DEFAULT_BATCH_SIZE):
+    # Local scores of many pairs at once, with the (row, col) of the best cell of each (the first in
+    # row-major order, like smith_waterman_score()). With traceback, also the (row, col) where each local
+    # alignment starts and its compact ops, covering S1[col_start:col_end] and S2[row_start:row_end]
+    return _run_batches(pairs, True, traceback, batch_size, ins_cost, del_cost, match_cost, mismatch_cost, matrix)
+
+
+def _run_batches(pairs, local, traceback, batch_size, ins_cost, del_cost, match_cost, mismatch_cost, matrix):
+    pairs = list(pairs)
+    # Without a matrix the substitution score is a comparison, cheaper than a gather from the table
+    scores_table = score_table(match_cost, mismatch_cost, matrix) if matrix is not None else (match_cost, mismatch_cost)
+    scores = np.zeros(len(pairs))
+    ends = np.zeros((len(pairs), 2), dtype=np.int64)
+    starts = np.zeros((len(pairs), 2), dtype=np.int64) if traceback else None
+    ops = [None] * len(pairs) if traceback else None
+
+    # Pairs of similar lengths share a batch, so little of each batch is padding
+    order = np.lexsort(([len(S2) for S1, S2 in pairs], [len(S1) for S1, S2 in pairs]))
+    for start in range(0, len(pairs), batch_size):
+        idxs = order[start:start + batch_size]
+        codes1, lengths1 = pad_codes([pairs[idx][0] for idx in idxs])
+        codes2, lengths2 = pad_codes([pairs[idx][1] for idx in idxs])
+        with phase('fill', algorithm='local' if local else 'global', backend='batch', cells=int(lengths1 @ lengths2)):
+            batch_scores, batch_ends, paths = _batch_fill(codes1, codes2, lengths1, lengths2, scores_table,
+                                                          ins_cost, del_cost, local, traceback)
+        scores[idxs] = batch_scores
+        ends[idxs] = batch_ends
+        if traceback:
+            with phase('traceback', algorithm='local' if local else 'global'):
+                batch_starts, batch_ops = _batch_traceback(paths, batch_ends, local)
+            starts[idxs] = batch_starts
+            for idx, pair_ops in zip(idxs, batch_ops):
+                ops[idx] = pair_ops
+
+    if local:
+        return scores, ends, starts, ops
+    return scores, None, None, ops
+
+
+def _batch_fill(codes1, codes2, lengths1, lengths2, scores, ins_cost, del_cost, local, traceback):
+    # scores is a substitution table, or a (match_cost, mismatch_cost) tuple
+    # One DP row of every pair at a time: rows of the (B, L1 + 1) array are the pairs, with the same
+    # formulas (and tie-breaks) as needleman_wunsch_rows() and smith_waterman_rows(). Columns past
+    # a pair's S1 hold padding, which nothing left of them depends on; rows past its S2 are ignored
+    B, L1 = codes1.shape
+    batch = np.arange(B)
+    row = np.zeros((B, L1 + 1))
+    if not local:
+        row[:, 1:] = np.add.accumulate(np.full(L1, ins_cost))
+    paths = np.zeros((codes2.shape[1] + 1, B, L1 + 1), dtype=np.uint8) if traceback else None
+    if traceback and not local:
+        paths[0] = 2
+        paths[1:, :, 0] = 1
+
+    # Global: the bottom-right cell of each pair, read when the fill reaches its last row.
+    # Local: the best cell so far among the columns that are inside the pair
+    best = row[batch, lengths1] if not local else np.zeros(B)
+    best_cell = np.stack((np.zeros(B, dtype=np.int64), lengths1 if not local else np.zeros(B, dtype=np.int64)), axis=1)
+    inside = np.arange(L1 + 1) <= lengths1[:, None]
+
+    for i in range(1, codes2.shape[1] + 1):
+        if isinstance(scores, tuple):
+            diagonal = row[:, :-1] + np.where(codes1 == codes2[:, i - 1][:, None], *scores)
+        else:
+            diagonal = row[:, :-1] + scores[codes2[:, i - 1][:, None], codes1]
+        up = row[:, 1:] + del_cost
+        if local:
+            best_choice = np.maximum(np.maximum(diagonal, up), 0)
+            first = np.zeros((B, 1))
+        else:
+            best_choice = np.maximum(diagonal, up)
+            first = row[:, :1] + del_cost
+        row = gap_row(first, best_choice, ins_cost)
+
+        if traceback and local:
+            paths[i, :, 1:] = np.where(row[:, 1:] == 0, 0, np.where(diagonal == row[:, 1:], 1, np.where(up == row[:, 1:], 2, 3)))
+        elif traceback:
+            paths[i, :, 1:] = np.where(diagonal == row[:, 1:], 0, np.where(up == row[:, 1:], 1, 2))
+
+        if local:
+            candidates = np.where(inside, row, -np.inf)
+            col_idx = np.argmax(candidates, axis=1)
+            value = candidates[batch, col_idx]
+            better = (i <= lengths2) & (value > best)
+            best[better] = value[better]
+            best_cell[better] = np.stack((np.full(better.sum(), i), col_idx[better]), axis=1)
+        else:
+            done = lengths2 == i
+            best[done] = row[done, lengths1[done]]
+            best_cell[done, 0] = i
+    return best, best_cell, paths
+
+
+def _batch_traceback(paths, ends, local):
+    # Every pair steps back through its paths at the same time until it reaches the top-left corner
+    # (global) or a cell whose path is 0 (local). Returns the start cells and the compact ops
+    B = paths.shape[1]
+    batch = np.arange(B)
+    row_idx = ends[:, 0].copy()
+    col_idx = ends[:, 1].copy()
+    moves = np.zeros((B, paths.shape[0] + paths.shape[2]), dtype=np.uint8)
+
+    step = 0
+    while True:
+        code = paths[row_idx, batch, col_idx]
+        if local:
+            active = code != 0
+            move = code.astype(np.int64)
+        else:
+            active = (row_idx > 0) | (col_idx > 0)
+            move = code.astype(np.int64) + 1
+        if not active.any():
+            break
+        # move is 1 (diagonal), 2 (up) or 3 (left) for the pairs still tracing back, 0 for the others
+        move[~active] = 0
+        moves[:, step] = move
+        row_idx -= (move == 1) | (move == 2)
+        col_idx -= (move == 1) | (move == 3)
+        step += 1
+
+    ops = []
+    for pair_moves in moves[:, :step][:, ::-1]:
+        pair_moves = pair_moves[pair_moves != 0]
+        if len(pair_moves) == 0:
+            ops.append('')
+            continue
+        run_starts = np.concatenate(([0], np.flatnonzero(pair_moves[1:] != pair_moves[:-1]) + 1))
+        run_lengths = np.diff(np.concatenate((run_starts, [len(pair_moves)])))
+        ops.append(''.join(f'{length}{kind}' for length, kind in zip(run_lengths, OPS[pair_moves[run_starts]])))
+    return np.stack((row_idx, col_idx), axis=1), ops
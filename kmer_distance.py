@@ -0,0 +1,59 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import numpy as np
+
+from scoring import encode
+
+DEFAULT_K = 3
+# Longest k-mer that fits in 64 bits, one byte per character
+MAX_K = 7
+# Candidates from the k-mer screen that are confirmed with alignment scores
+DEFAULT_SHORTLIST = 8
+
+
+def kmer_codes(S, k):
+    # One integer per k-mer of S (k characters packed base 256), in order of position
+    if not 1 <= k <= MAX_K:
+        raise ValueError(f'k must be between 1 and {MAX_K} so a k-mer fits in 64 bits')
+    codes = encode(S).astype(np.int64)
+    if len(codes) < k:
+        return np.zeros(0, dtype=np.int64)
+    packed = np.zeros(len(codes) - k + 1, dtype=np.int64)
+    for offset in range(k):
+        packed = (packed << 8) | codes[offset:len(codes) - k + 1 + offset]
+    return packed
+
+
+def kmer_profiles(s_list, k=DEFAULT_K):
+    # Sparse k-mer count vectors of every sequence, as parallel (row, kmer, count) arrays with
+    # k-mers numbered 0 .. vocabulary_size - 1 over the k-mers that actually occur
+    codes = [kmer_codes(S, k) for S in s_list]
+    seq_idx = np.repeat(np.arange(len(s_list)), [len(c) for c in codes])
+    vocabulary, kmer_idx = np.unique(np.concatenate(codes + [np.zeros(0, dtype=np.int64)]), return_inverse=True)
+
+    pairs, counts = np.unique(seq_idx * len(vocabulary) + kmer_idx, return_counts=True)
+    rows = pairs // max(len(vocabulary), 1)
+    kmers = pairs % max(len(vocabulary), 1)
+    return rows, kmers, counts, len(vocabulary)
+
+
+def kmer_distance_sums(s_list, k=DEFAULT_K):
+    # Sum over j of the cosine distance 1 - cos(i, j) between k-mer count vectors, without building the
+    # N x N matrix: with unit-length count vectors u, sum_j cos(i, j) = u_i . (sum_j u_j), so this is
+    # O(N * L) time and memory
+    N = len(s_list)
+    rows, kmers, counts, vocabulary_size = kmer_profiles(s_list, k)
+    norms = np.sqrt(np.bincount(rows, weights=counts.astype(float) ** 2, minlength=N))
+
+    unit = counts / norms[rows]
+    total = np.bincount(kmers, weights=unit, minlength=vocabulary_size)
+    similarity = np.bincount(rows, weights=unit * total[kmers], minlength=N)
+
+    # Each sequence is at distance 0 from itself; one without k-mers is at distance 1 from all the others
+    return np.where(norms > 0, N - similarity, N - 1)
+
+
+def kmer_shortlist(distance_sums, shortlist=DEFAULT_SHORTLIST):
+    # Indexes of the sequences closest to all the others, best first
+    if shortlist < 1:
+        raise ValueError(f'shortlist must be at least 1 (got {shortlist})')
+    return np.argsort(distance_sums, kind='stable')[:shortlist]
@@ -1,10 +1,15 @@
 # Author: Jose G. Perez <jperez50@miners.utep.edu>
+import heapq
+
 import numpy as np
 from timeit import default_timer as timer
 
-from utils import get_input_float, get_input_boolean, combine
+from global_alignment import hirschberg
+from instrumentation import Profile, phase, report
+from scoring import encode, score_table
+from utils import get_input_float, get_input_boolean, MatrixView, gap_row, scratch_matrix, row_tiles, flush_matrices, \
+    first_max, BandedMatrix, band_columns, band_diagonal, band_up, xdrop_extent, DEFAULT_TILE_ROWS
 
-np.set_printoptions(threshold=np.inf, linewidth=500)
 DEFAULT_INS_COST = -0.5
 DEFAULT_DEL_COST = -0.5
 DEFAULT_MATCH_COST = 5
@@ -13,36 +18,352 @@ PATH_CHARACTERS = ['', '↖', '↑', '←']
 
 
 #%% Algorithm: Smith-Waterman
-def smith_waterman(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost):
-    V = np.zeros((len(S2) + 1, len(S1) + 1))
-    paths = np.zeros_like(V)
+def smith_waterman(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, matrix=None, scratch_dir=None):
+    scores = score_table(match_cost, mismatch_cost, matrix)
+    codes1 = encode(S1)
+    codes2 = encode(S2)
+
+    V = scratch_matrix((len(S2) + 1, len(S1) + 1), float, scratch_dir, 'V')
+    paths = scratch_matrix(V.shape, np.uint8, scratch_dir, 'paths')
     V[:, 0] = V[0, :] = 0
 
     for i in range(1, V.shape[0]):
+        # Substitution scores of S2[i - 1] against all of S1 in one gather
+        row_scores = scores[codes2[i - 1], codes1]
         for j in range(1, V.shape[1]):
-            # Check if it's a match or mismatch
-            if S1[j - 1] == S2[i - 1]:
-                mcost = match_cost
-            else:
-                mcost = mismatch_cost
-
             choices = [0,
-                       V[i-1, j-1] + mcost,
+                       V[i-1, j-1] + row_scores[j - 1],
                        V[i-1, j] + del_cost,
                        V[i, j-1] + ins_cost]
 
             idx = np.argmax(choices)
             paths[i, j] = idx
             V[i, j] = choices[idx]
+    flush_matrices(V, paths)
     return V, paths
 
 
+#%% Algorithm: Smith-Waterman (row tiles, optionally out of core)
+def smith_waterman_rows(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, matrix=None, scratch_dir=None,
+                        tile_rows=DEFAULT_TILE_ROWS):
+    # Same V and paths as smith_waterman() (bit for bit when the costs are exact in binary, see
+    # utils.gap_row()), one row at a time. With scratch_dir both are np.memmap
+    # files (V.npy, paths.npy) written sequentially a tile of rows at a time
+    scores = score_table(match_cost, mismatch_cost, matrix)
+    codes1 = encode(S1)
+    codes2 = encode(S2)
+
+    V = scratch_matrix((len(S2) + 1, len(S1) + 1), float, scratch_dir, 'V')
+    paths = scratch_matrix(V.shape, np.uint8, scratch_dir, 'paths')
+    row = np.zeros(V.shape[1])
+
+    V_tile = np.zeros((tile_rows, V.shape[1]))
+    paths_tile = np.zeros((tile_rows, V.shape[1]), dtype=np.uint8)
+    for start, end in row_tiles(V.shape[0], tile_rows):
+        for i in range(start, end):
+            diagonal = row[:-1] + scores[codes2[i - 1], codes1]
+            up = row[1:] + del_cost
+            best = np.maximum(np.maximum(diagonal, up), 0)
+            row = gap_row(0, best, ins_cost)
+
+            # Same tie-break order as the loop: 0, diagonal, up, left
+            V_tile[i - start] = row
+            paths_tile[i - start, 1:] = np.where(row[1:] == 0, 0, np.where(diagonal == row[1:], 1, np.where(up == row[1:], 2, 3)))
+        V[start:end] = V_tile[:end - start]
+        paths[start:end] = paths_tile[:end - start]
+    flush_matrices(V, paths)
+    return V, paths
+
+
+#%% Algorithm: Smith-Waterman (score only, two rolling rows)
+def smith_waterman_score(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, matrix=None):
+    scores = score_table(match_cost, mismatch_cost, matrix)
+
+    # Keep the shorter sequence along the row so memory is O(min(n, m))
+    transposed = len(S1) > len(S2)
+    if transposed:
+        S1, S2 = S2, S1
+        ins_cost, del_cost = del_cost, ins_cost
+        scores = scores.T
+
+    codes1 = encode(S1)
+    row = np.zeros(len(S1) + 1)
+
+    # Same cell reconstruct() would pick: the first maximum of V in row-major order
+    score, row_idx, col_idx = 0, 0, 0
+    for i, code2 in enumerate(encode(S2), 1):
+        best = np.maximum(np.maximum(row[:-1] + scores[code2, codes1], row[1:] + del_cost), 0)
+        row = gap_row(0, best, ins_cost)
+
+        j = np.argmax(row)
+        end = (j, i) if transposed else (i, j)
+        if row[j] > score or (row[j] == score and end < (row_idx, col_idx)):
+            score = row[j]
+            row_idx, col_idx = end
+    return score, row_idx, col_idx
+
+
+#%% Algorithm: Smith-Waterman (linear space, start-point recovery)
+def smith_waterman_linear(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, matrix=None):
+    # Only the local alignment itself: st1/st2 cover S1[col_start:col_end] and S2[row_start:row_end],
+    # returned as st1, st2, score, (row_start, col_start), (row_end, col_end)
+    score, row_end, col_end = smith_waterman_score(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, matrix)
+    if score <= 0:
+        return '', '', score, (int(row_end), int(col_end)), (int(row_end), int(col_end))
+
+    # The alignment starts where a global alignment anchored at the end cell, run backwards over
+    # the reversed prefixes, reaches its best score
+    _, rows, cols = anchored_score(S1[:col_end][::-1], S2[:row_end][::-1], ins_cost, del_cost, match_cost, mismatch_cost, matrix)
+    row_start = int(row_end - rows)
+    col_start = int(col_end - cols)
+
+    # Only the bounded sub-rectangle is aligned, in linear space
+    st1, st2, _ = hirschberg(S1[col_start:col_end], S2[row_start:row_end], ins_cost, del_cost, match_cost, mismatch_cost, matrix)
+    return st1, st2, score, (row_start, col_start), (int(row_end), int(col_end))
+
+
+def anchored_score(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, matrix=None):
+    # Best global alignment of any prefix of S1 against any prefix of S2 (an alignment anchored at
+    # the top-left corner that may stop anywhere), as (score, row_idx, col_idx) of its end cell
+    scores = score_table(match_cost, mismatch_cost, matrix)
+
+    # Keep the shorter sequence along the row so memory is O(min(n, m))
+    transposed = len(S1) > len(S2)
+    if transposed:
+        S1, S2 = S2, S1
+        ins_cost, del_cost = del_cost, ins_cost
+        scores = scores.T
+
+    codes1 = encode(S1)
+    row = ins_cost * np.arange(len(S1) + 1, dtype=float)
+
+    j = np.argmax(row)
+    score, row_idx, col_idx = row[j], 0, j
+    for i, code2 in enumerate(encode(S2), 1):
+        best = np.maximum(row[:-1] + scores[code2, codes1], row[1:] + del_cost)
+        row = gap_row(del_cost * i, best, ins_cost)
+
+        j = np.argmax(row)
+        if row[j] > score:
+            score, row_idx, col_idx = row[j], i, j
+    if transposed:
+        row_idx, col_idx = col_idx, row_idx
+    return score, row_idx, col_idx
+
+
+#%% Algorithm: Waterman-Eggert (k best non-intersecting local alignments)
+def smith_waterman_top_k(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, k, matrix=None):
+    # Up to k hits in decreasing score order, each as st1, st2, score, (row_start, col_start), (row_end, col_end)
+    # like smith_waterman_linear(); no two hits share a cell of V
+    scores = score_table(match_cost, mismatch_cost, matrix)
+    codes1 = encode(S1)
+    codes2 = encode(S2)
+
+    V = np.zeros((len(S2) + 1, len(S1) + 1))
+    paths = np.zeros(V.shape, dtype=np.uint8)
+    masked = np.zeros(V.shape, dtype=bool)
+    for i in range(1, V.shape[0]):
+        _fill_row(V, paths, masked, i, 1, scores[codes2[i - 1], codes1], ins_cost, del_cost)
+
+    # One candidate per row: its best cell. A row that gets recomputed pushes a new candidate
+    # and bumps its version, so stale candidates are skipped when they come out of the heap
+    versions = np.zeros(V.shape[0], dtype=int)
+    heap = []
+    for i in range(1, V.shape[0]):
+        _push_row_best(heap, V, versions, i)
+
+    hits = []
+    while heap and len(hits) < k:
+        neg_score, row_idx, col_idx, version = heapq.heappop(heap)
+        if version != versions[row_idx]:
+            continue
+
+        st1, st2, (row_start, col_start), cells = trace_local(S1, S2, V, paths, row_idx, col_idx)
+        for i, j in cells:
+            masked[i, j] = True
+        hits.append((st1, st2, -neg_score, (row_start, col_start), (row_idx, col_idx)))
+
+        # Masked cells drop to 0 and values can only change below and to the right of them, so rows
+        # are recomputed from the first masked column on, until a row past the hit comes out unchanged
+        first_masked = {}
+        for i, j in cells:
+            first_masked[i] = min(j, first_masked.get(i, j))
+        start = len(S1) + 1
+        for i in range(min(first_masked), V.shape[0]):
+            start = min(start, first_masked.get(i, start))
+            if start > len(S1):
+                break
+
+            old_row = V[i, start:].copy()
+            _fill_row(V, paths, masked, i, start, scores[codes2[i - 1], codes1], ins_cost, del_cost)
+            changed = np.flatnonzero(V[i, start:] != old_row)
+            _push_row_best(heap, V, versions, i)
+            start = start + changed[0] if len(changed) else len(S1) + 1
+    return hits
+
+
+def _fill_row(V, paths, masked, i, start, row_scores, ins_cost, del_cost):
+    # Smith-Waterman row i from column start onwards; masked cells are held at 0 and stop any gap
+    # running along the row through them
+    diagonal = V[i - 1, start - 1:-1] + row_scores[start - 1:]
+    up = V[i - 1, start:] + del_cost
+    best = np.maximum(np.maximum(diagonal, up), 0)
+
+    row = np.zeros_like(best)
+    left = V[i, start - 1]
+    segment_start = 0
+    for cut in list(np.flatnonzero(masked[i, start:])) + [len(best)]:
+        if cut > segment_start:
+            row[segment_start:cut] = gap_row(left, best[segment_start:cut], ins_cost)[1:]
+        left = 0
+        segment_start = cut + 1
+
+    # Same tie-break order as smith_waterman(): 0, diagonal, up, left
+    idx = np.where(row == 0, 0, np.where(diagonal == row, 1, np.where(up == row, 2, 3)))
+    idx[masked[i, start:]] = 0
+    V[i, start:] = row
+    paths[i, start:] = idx
+
+
+def _push_row_best(heap, V, versions, i):
+    versions[i] += 1
+    j = np.argmax(V[i])
+    if V[i, j] > 0:
+        # Equal scores come out in row-major order, like reconstruct()
+        heapq.heappush(heap, (-V[i, j], i, int(j), versions[i]))
+
+
+def trace_local(S1, S2, V, paths, row_idx, col_idx):
+    # Follows the path from (row_idx, col_idx) back to the first 0; returns the alignment,
+    # the cell it starts from and every cell it uses
+    st1 = ''
+    st2 = ''
+    cells = []
+    while V[row_idx, col_idx] > 0:
+        value = paths[row_idx, col_idx]
+        cells.append((row_idx, col_idx))
+        if value == 1:
+            st1 += S1[col_idx - 1]
+            st2 += S2[row_idx - 1]
+            row_idx -= 1
+            col_idx -= 1
+        elif value == 2:
+            st1 += '-'
+            st2 += S2[row_idx - 1]
+            row_idx -= 1
+        else:
+            st1 += S1[col_idx - 1]
+            st2 += '-'
+            col_idx -= 1
+    return st1[::-1], st2[::-1], (row_idx, col_idx), cells
+
+
+#%% Algorithm: Smith-Waterman (banded)
+def smith_waterman_banded(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, lo, hi, matrix=None, x_drop=None):
+    # Only the cells on diagonals lo <= col - row <= hi, e.g. around a seed hit; cells outside the
+    # band read as 0. Returns V and paths as BandedMatrix, which trace_local() can follow.
+    # With x_drop, cells more than x_drop below the best score so far are pruned (-inf) and the
+    # fill stops at the first row without a live cell
+    scores = score_table(match_cost, mismatch_cost, matrix)
+    V = BandedMatrix((len(S2) + 1, len(S1) + 1), lo, hi, fill=0)
+    paths = BandedMatrix(V.shape, lo, hi, dtype=np.uint8, fill=0)
+    codes1 = np.concatenate(([0], encode(S1)))
+    codes2 = encode(S2)
+
+    row = np.zeros(hi - lo + 1)
+    V.band[0] = row
+    best = 0
+    for i in range(1, len(S2) + 1):
+        j, inside = band_columns(i, lo, hi, len(S1))
+        diagonal = band_diagonal(row, j, scores[codes2[i - 1], codes1])
+        up = band_up(row) + del_cost
+
+        best_choice = np.maximum(np.maximum(diagonal, up), 0)
+        best_choice[~inside] = 0
+        row = gap_row(-np.inf, best_choice, ins_cost)[1:]
+        row[~inside] = 0
+
+        # Same tie-break order as smith_waterman(): 0, diagonal, up, left
+        paths.band[i] = np.where(row == 0, 0, np.where(diagonal == row, 1, np.where(up == row, 2, 3)))
+        if x_drop is not None:
+            best = max(best, row.max())
+            row[row < best - x_drop] = -np.inf
+        V.band[i] = row
+        if x_drop is not None and np.isneginf(row).all():
+            break
+    return V, paths
+
+
+def banded_best_cell(V):
+    # (row, col) of the first maximum of a BandedMatrix in row-major order; (0, 0) when every cell is 0,
+    # since band cells that fall outside the matrix also hold 0
+    row_idx, band_idx = np.unravel_index(np.argmax(V.band), V.band.shape)
+    if V.band[row_idx, band_idx] <= 0:
+        return 0, 0
+    return int(row_idx), int(row_idx + V.lo + band_idx)
+
+
+#%% Algorithm: Smith-Waterman (X-drop)
+def smith_waterman_xdrop(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, x_drop, matrix=None):
+    # A cell more than x_drop below the best score so far is pruned (-inf), so each row is only
+    # computed over the columns that live cells of the row above can reach, plus the gap run to
+    # their right; the fill stops at the first row without a live cell. With x_drop=np.inf this is
+    # smith_waterman(). Returns V, paths and the stats of how much of the matrix was computed
+    scores = score_table(match_cost, mismatch_cost, matrix)
+    codes1 = encode(S1)
+    codes2 = encode(S2)
+
+    V = np.full((len(S2) + 1, len(S1) + 1), -np.inf)
+    paths = np.zeros(V.shape, dtype=np.uint8)
+    V[0] = 0
+    last_col = V.shape[1] - 1
+
+    best = 0
+    cells = V.shape[1]
+    rows = 1
+    lo, hi = 0, last_col
+    for i in range(1, V.shape[0]):
+        rows += 1
+        # Cells reachable from the live columns lo..hi of the row above
+        if lo == 0:
+            V[i, 0] = 0
+        start, end = max(lo, 1), min(hi + 1, last_col)
+        if start <= end:
+            diagonal = V[i - 1, start - 1:end] + scores[codes2[i - 1], codes1[start - 1:end]]
+            up = V[i - 1, start:end + 1] + del_cost
+            best_choice = np.maximum(np.maximum(diagonal, up), 0)
+            row = gap_row(V[i, start - 1], best_choice, ins_cost)
+
+            # Same tie-break order as smith_waterman(): 0, diagonal, up, left
+            V[i, start:end + 1] = row[1:]
+            paths[i, start:end + 1] = np.where(row[1:] == 0, 0, np.where(diagonal == row[1:], 1, np.where(up == row[1:], 2, 3)))
+            best = max(best, row[1:].max())
+        threshold = best - x_drop
+
+        # Past end only a run of left moves (or a fresh 0) is possible, alive while it stays above threshold
+        stop = end
+        if end < last_col:
+            stop = last_col if threshold <= 0 else end + xdrop_extent(V[i, end], ins_cost, threshold, last_col - end)
+            run = np.maximum(V[i, end] + ins_cost * np.arange(1, stop - end + 1), 0)
+            V[i, end + 1:stop + 1] = run
+            paths[i, end + 1:stop + 1] = np.where(run == 0, 0, 3)
+        cells += stop - lo + 1
+
+        segment = V[i, lo:stop + 1]
+        live = np.flatnonzero(segment >= threshold)
+        segment[segment < threshold] = -np.inf
+        if len(live) == 0:
+            break
+        lo, hi = lo + int(live[0]), lo + int(live[-1])
+    stats = dict(cells=cells, total_cells=V.size, rows=rows)
+    report('xdrop', algorithm='local', **stats)
+    return V, paths, stats
+
+
 def reconstruct(S1, S2, V, paths):
-    # For local alignment, pick the highest number in V
-    maxValue = np.amax(V)
-    idxs = np.where(V == maxValue)
-    start_row_idx = idxs[0][0]
-    start_col_idx = idxs[1][0]
+    # For local alignment, pick the highest number in V (the first one in row-major order);
+    # V is read a tile of rows at a time, so it can be a memory-mapped file
+    start_row_idx, start_col_idx = first_max(V)
 
     # Then backtrack until we hit a 0
     # We also keep backtracking until we reach the top-left corner
@@ -152,23 +473,23 @@ if __name__ == '__main__':
         mismatch_cost = get_input_float('Please type the mismatching penalty/cost')
 
     #%% Algorithm Timing
-    start_time = timer()
-    V, paths = smith_waterman(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost)
-    st1, st2, score = reconstruct(S1, S2, V, paths)
-
-    combined = combine(V, paths, PATH_CHARACTERS)
+    # The total, and each phase on its own through the instrumentation hooks
+    with Profile() as profile:
+        start_time = timer()
+        with phase('fill', algorithm='local', backend='reference', cells=(len(S1) + 1) * (len(S2) + 1)):
+            V, paths = smith_waterman(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost)
+        with phase('traceback', algorithm='local'):
+            st1, st2, score = reconstruct(S1, S2, V, paths)
 
-    end_time = timer()
-    duration_sec = end_time - start_time
+        end_time = timer()
+        duration_sec = end_time - start_time
 
     #%% Results
     print("** Results **")
     print(f"\tFor: Insertion Cost={ins_cost}, Deletion Cost={del_cost}, Match Cost={match_cost}, Mismatch Cost={mismatch_cost}")
 
     print(f"Calculation took {duration_sec:.4f} seconds")
-    print(f"V=\n{V}")
-    print(f"Paths=\n{paths}")
-    print(f"Combined=\n{combined}")
+    print(profile.summary())
 
     print(f"Original Inputs:")
     print(f"S1: {S1}")
@@ -176,4 +497,14 @@ if __name__ == '__main__':
 
     print(f"Alignment Score={score}")
     print(f"ST1: {st1}")
-    print(f"ST2: {st2}")
\ No newline at end of file
+    print(f"ST2: {st2}")
+
+    #%% Matrices (opt-in)
+    # Only a window is formatted; the whole matrix can be streamed to a file instead
+    if get_input_boolean('Do you want to see the matrix around the alignment end? [Y/N]'):
+        view = MatrixView(V, paths, PATH_CHARACTERS)
+        print(f"Combined=\n{view.render(*view.around(*first_max(V)))}")
+    path = input('Type a file name to write the whole matrix to (leave empty to skip)')
+    if path:
+        with open(path, 'w') as fh:
+            MatrixView(V, paths, PATH_CHARACTERS).write(fh)
@@ -0,0 +1,61 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import numpy as np
+
+from instrumentation import phase
+from scoring import encode
+
+GAP = ord('-')
+
+
+class MSA:
+    # A multiple sequence alignment as one uint8 row per sequence, one column per alignment column
+    def __init__(self, data):
+        self.data = data
+
+    @staticmethod
+    def from_center_star(center_star_st1s, center_star_st2s, center_star_seq=None):
+        # Merges the pairwise (center, other) alignments into one MSA whose first row is the center.
+        # Every gap a pairwise alignment puts in the center becomes a gap column for all the others
+        with phase('msa_merge', sequences=len(center_star_st1s) + 1):
+            if center_star_seq is None:
+                center_star_seq = center_star_st1s[0].replace('-', '') if center_star_st1s else ''
+            L = len(center_star_seq)
+
+            # slot_gaps[p] = gap columns right before center character p (p = L is after the last one)
+            placements = []
+            slot_gaps = np.zeros(L + 1, dtype=int)
+            for st1, st2 in zip(center_star_st1s, center_star_st2s):
+                if len(st1) != len(st2) or st1.replace('-', '') != center_star_seq:
+                    raise ValueError('Every alignment must have the center sequence as st1')
+                is_gap = encode(st1) == GAP
+                slot = np.cumsum(~is_gap) - (~is_gap)
+                gaps = np.bincount(slot[is_gap], minlength=L + 1)
+
+                # Rank of each gap within its slot: gaps so far minus the gaps of the earlier slots
+                gaps_before = np.concatenate(([0], np.cumsum(gaps)[:-1]))
+                rank = np.arange(len(st1)) - slot - gaps_before[slot]
+                placements.append((slot, is_gap, rank, encode(st2)))
+                slot_gaps = np.maximum(slot_gaps, gaps)
+
+            # Slot p starts at column p + (gap columns of the slots before it)
+            slot_start = np.arange(L + 1) + np.concatenate(([0], np.cumsum(slot_gaps)[:-1]))
+            width = L + slot_gaps.sum()
+
+            data = np.full((len(placements) + 1, width), GAP, dtype=np.uint8)
+            data[0, slot_start[:L] + slot_gaps[:L]] = encode(center_star_seq)
+            for row, (slot, is_gap, rank, codes2) in enumerate(placements, 1):
+                data[row, slot_start[slot] + np.where(is_gap, rank, slot_gaps[slot])] = codes2
+            return MSA(data)
+
+    def gap_columns(self):
+        return (self.data == GAP).all(axis=0)
+
+    def drop_gap_columns(self):
+        return MSA(self.data[:, ~self.gap_columns()])
+
+    def rows(self):
+        return [row.tobytes().decode('latin-1') for row in self.data]
+
+    @property
+    def shape(self):
+        return self.data.shape
@@ -0,0 +1,59 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import os
+from functools import lru_cache
+
+import numpy as np
+
+MATRIX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'matrices')
+ALPHABET_SIZE = 256
+
+
+def encode(S):
+    # One uint8 code per character, used to index the rows and columns of a scoring table
+    return np.frombuffer(S.encode('latin-1'), dtype=np.uint8)
+
+
+@lru_cache(maxsize=None)
+def match_mismatch_matrix(match_cost, mismatch_cost):
+    # The built-in scoring as a table: match_cost on the diagonal, mismatch_cost everywhere else
+    scores = np.full((ALPHABET_SIZE, ALPHABET_SIZE), mismatch_cost, dtype=float)
+    np.fill_diagonal(scores, match_cost)
+    scores.flags.writeable = False
+    return scores
+
+
+def load_matrix(path):
+    # Reads a substitution matrix in NCBI format (e.g. BLOSUM62) into a table over every code.
+    # A bare name such as 'BLOSUM62' is looked up in the bundled matrices directory.
+    if not os.path.exists(path):
+        path = os.path.join(MATRIX_DIR, path)
+
+    with open(path) as fh:
+        rows = [line.split() for line in fh if line.strip() and not line.startswith('#')]
+    letters = rows[0]
+    values = np.array([[float(value) for value in row[1:]] for row in rows[1:]])
+    row_letters = [row[0] for row in rows[1:]]
+    if row_letters != letters or values.shape != (len(letters), len(letters)):
+        raise ValueError(f'{path} is not a square substitution matrix')
+
+    # Characters outside the alphabet score like X (unknown) when the matrix has it
+    default = letters.index('X') if 'X' in letters else None
+    lookup = np.full(ALPHABET_SIZE, -1)
+    for idx, letter in enumerate(letters):
+        lookup[ord(letter)] = idx
+        lookup[ord(letter.lower())] = idx
+
+    scores = np.full((ALPHABET_SIZE, ALPHABET_SIZE), values.min())
+    known = lookup >= 0
+    if default is not None:
+        lookup[~known] = default
+        known[:] = True
+    scores[np.ix_(known, known)] = values[np.ix_(lookup[known], lookup[known])]
+    scores.flags.writeable = False
+    return scores
+
+
+def score_table(match_cost, mismatch_cost, matrix=None):
+    if matrix is not None:
+        return matrix
+    return match_mismatch_matrix(match_cost, mismatch_cost)
@@ -0,0 +1,161 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import numpy as np
+from timeit import default_timer as timer
+
+from local_alignment import DEFAULT_INS_COST, DEFAULT_DEL_COST, DEFAULT_MATCH_COST, DEFAULT_MISMATCH_COST
+from scoring import encode, score_table
+from utils import get_input_float, get_input_boolean, get_input_int
+
+DEFAULT_LANES = 256
+LANE_DTYPES = [np.int16, np.int32, np.int64]
+
+
+def integer_scale(costs):
+    # Smallest factor that turns every cost into an integer, so scores fit integer lanes
+    for scale in range(1, 1001):
+        if all(abs(round(cost * scale) - cost * scale) < 1e-9 for cost in costs):
+            return scale
+    raise ValueError('Costs cannot be scaled to integers')
+
+
+#%% Query Profile
+class QueryProfile:
+    # Scores of every query position against every character, in the striped order the kernel
+    # reads them: lane l of segment s holds query position (l * segments) + s
+    def __init__(self, query, ins_cost, del_cost, match_cost, mismatch_cost, lanes=DEFAULT_LANES, matrix=None):
+        self.query = query
+        codes = encode(query)
+        table = score_table(match_cost, mismatch_cost, matrix)
+        query_scores = table[:, np.unique(codes)]
+
+        self.scale = integer_scale([ins_cost, del_cost] + list(np.unique(query_scores)))
+        self.ins_cost = round(ins_cost * self.scale)
+        self.del_cost = round(del_cost * self.scale)
+        self.table = np.round(table * self.scale).astype(np.int64)
+        self.max_pair = int(query_scores.max(initial=0) * self.scale)
+        self.max_cost = max(abs(self.ins_cost), abs(self.del_cost), int(np.abs(query_scores).max(initial=0) * self.scale))
+
+        self.lanes = lanes
+        self.segments = max(1, -(-len(query) // lanes))
+        self.positions = np.arange(self.segments * lanes).reshape(lanes, self.segments).T
+        self.padding = self.positions >= len(query)
+        self.striped_codes = np.concatenate((codes, np.zeros(self.padding.sum(), dtype=np.uint8)))[self.positions]
+        self._lane_rows = {}
+
+        # Throughput over every search run with this profile
+        self.cells = 0
+        self.seconds = 0.0
+
+    def lane_row(self, code, dtype):
+        # Built the first time a subject brings in this character, then reused for every subject.
+        # Padding positions past the end of the query get a score low enough to never matter
+        rows = self._lane_rows.setdefault(dtype, {})
+        if code not in rows:
+            pad = np.iinfo(dtype).min // 2
+            rows[code] = np.where(self.padding, pad, self.table[code, self.striped_codes]).astype(dtype)
+        return rows[code]
+
+    def cell_updates_per_second(self):
+        return self.cells / self.seconds if self.seconds > 0 else 0.0
+
+
+#%% Algorithm: Striped Smith-Waterman (Farrar)
+def striped_smith_waterman(profile, S2):
+    start_time = timer()
+
+    # Try the narrowest lanes first and widen them if the scores could have overflowed
+    for dtype in LANE_DTYPES:
+        result = _striped_fill(profile, S2, dtype)
+        if result is not None:
+            break
+
+    profile.cells += len(profile.query) * len(S2)
+    profile.seconds += timer() - start_time
+
+    score, row_idx, col_idx = result
+    return score / profile.scale, row_idx, col_idx
+
+
+def _striped_fill(profile, S2, dtype):
+    limits = np.iinfo(dtype)
+    overflow = limits.max - profile.max_pair
+    if profile.max_cost > limits.max // 4:
+        return None
+
+    ins_cost = dtype(profile.ins_cost)
+    del_cost = dtype(profile.del_cost)
+    pad = dtype(limits.min // 2)
+    zero = dtype(0)
+
+    H = np.zeros((profile.segments, profile.lanes), dtype=dtype)
+    score, row_idx, col_idx = 0, 0, 0
+    for i, code2 in enumerate(encode(S2), 1):
+        profile_row = profile.lane_row(code2, dtype)
+        H_prev = H
+        H = np.empty_like(H_prev)
+
+        # Diagonal for segment 0 comes from the last segment, one lane over
+        vH = np.concatenate(([zero], H_prev[-1, :-1]))
+        vF = np.full(profile.lanes, pad, dtype=dtype)
+        for s in range(profile.segments):
+            vH = np.maximum(np.maximum(vH + profile_row[s], H_prev[s] + del_cost), np.maximum(vF, zero))
+            H[s] = vH
+            vF = vH + ins_cost
+            vH = H_prev[s]
+
+        # Lazy F: carry insertions across lane boundaries until they stop improving anything
+        updating = True
+        while updating:
+            vF = np.concatenate(([pad], vF[:-1]))
+            for s in range(profile.segments):
+                if not (vF > H[s]).any():
+                    updating = False
+                    break
+                H[s] = np.maximum(H[s], vF)
+                vF = H[s] + ins_cost
+
+        row_max = H.max()
+        if row_max > overflow:
+            return None
+        if row_max > score:
+            score = row_max
+            row_idx = i
+            col_idx = int(profile.positions[H == row_max].min()) + 1
+    return int(score), row_idx, col_idx
+
+
+if __name__ == '__main__':
+    print("*** Striped Smith-Waterman ***")
+    S1 = input('Type the query string (S1)')
+
+    print("* Default penalty costs *")
+    print(f"\tInsertion Cost={DEFAULT_INS_COST}, Deletion Cost={DEFAULT_DEL_COST}, Match Cost={DEFAULT_MATCH_COST}, Mismatch Cost={DEFAULT_MISMATCH_COST}")
+    use_default = get_input_boolean('Do you want to use the above costs? [Y/N]')
+
+    #%% Costs
+    if use_default:
+        print("* Using default costs *")
+        ins_cost = DEFAULT_INS_COST
+        del_cost = DEFAULT_DEL_COST
+        match_cost = DEFAULT_MATCH_COST
+        mismatch_cost = DEFAULT_MISMATCH_COST
+    else:
+        print("* Defining own costs *")
+        ins_cost = get_input_float('Please type the insertion penalty/cost')
+        del_cost = get_input_float('Please type the deletion penalty/cost')
+        match_cost = get_input_float('Please type the matching penalty/cost')
+        mismatch_cost = get_input_float('Please type the mismatching penalty/cost')
+
+    subjects = []
+    subject_count = get_input_int('How many subject strings will you search?')
+    for idx in range(subject_count):
+        subjects.append(input(f'Type subject string #{idx+1}'))
+
+    #%% Algorithm Timing
+    profile = QueryProfile(S1, ins_cost, del_cost, match_cost, mismatch_cost)
+    for idx, S2 in enumerate(subjects):
+        score, row_idx, col_idx = striped_smith_waterman(profile, S2)
+        print(f"Subject #{idx+1}: Alignment Score={score}, ends at S2[{row_idx}], S1[{col_idx}]")
+
+    print(f"Searched {profile.cells} cells in {profile.seconds:.4f} seconds")
+    print(f"Cell updates per second={profile.cell_updates_per_second():.0f}")
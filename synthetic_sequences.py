@@ -0,0 +1,46 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import random
+
+ALPHABET = 'ACGT'
+# Substitutions, insertions and deletions per position between members of a family
+MUTATION_RATE = 0.1
+
+
+#%% Seeded sequences shared by the benchmark and the tests
+def random_sequence(rng, length, alphabet=ALPHABET):
+    return ''.join(rng.choices(alphabet, k=length))
+
+
+def mutate(rng, S, rate=MUTATION_RATE, alphabet=ALPHABET):
+    # Each position is substituted, followed by an inserted character, or deleted with probability rate / 3
+    out = []
+    for c in S:
+        r = rng.random()
+        if r < rate / 3:
+            out.append(rng.choice(alphabet))
+        elif r < 2 * rate / 3:
+            out.append(c + rng.choice(alphabet))
+        elif r >= rate:
+            out.append(c)
+    return ''.join(out)
+
+
+def random_pairs(seed, count, max_len, alphabet=ALPHABET):
+    # count pairs of unrelated sequences of 0..max_len characters each, e.g. for parity checks
+    rng = random.Random(seed)
+    return [(random_sequence(rng, rng.randint(0, max_len), alphabet), random_sequence(rng, rng.randint(0, max_len), alphabet))
+            for _ in range(count)]
+
+
+def related_pair(seed, length, tail, rate=MUTATION_RATE):
+    # A random sequence and a mutated copy of it, each followed by tail unrelated characters, e.g. for extensions
+    rng = random.Random(seed)
+    root = random_sequence(rng, length)
+    return root + random_sequence(rng, tail), mutate(rng, root, rate) + random_sequence(rng, tail)
+
+
+def sequence_family(seed, n, length, rate=MUTATION_RATE):
+    # n mutated copies of one random root sequence; the same seed always gives the same family
+    rng = random.Random(seed)
+    root = random_sequence(rng, length)
+    return [mutate(rng, root, rate) for _ in range(n)]
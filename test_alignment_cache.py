@@ -0,0 +1,47 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import json
+import sqlite3
+
+from alignment_cache import AlignmentCache, costs_digest
+from batch_alignment import align_batch, default_costs
+from synthetic_sequences import random_pairs
+
+
+def test_costs_digest_normalizes_numbers():
+    assert costs_digest(dict(ins_cost=-1, match_cost=5)) == costs_digest(dict(ins_cost=-1.0, match_cost=5.0))
+    assert costs_digest(dict(a=2, matrix=None)) == costs_digest(dict(a=2))
+    assert costs_digest(dict(a=2)) != costs_digest(dict(a=3))
+
+
+def test_results_persist_as_json(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    pairs = random_pairs(1, 10, 20)
+    cache = AlignmentCache(path)
+    expected = align_batch(pairs, 'local', workers=1, score_only=True, cache=cache)
+    cache.close()
+
+    db = sqlite3.connect(path)
+    for (value,) in db.execute('SELECT value FROM results_json'):
+        json.loads(value)
+    db.close()
+
+    cache = AlignmentCache(path)
+    assert align_batch(pairs, 'local', workers=1, score_only=True, cache=cache) == expected
+    assert cache.stats()['disk_hits'] == len(pairs) and cache.misses == 0
+
+
+def test_alignments_also_store_their_scores(tmp_path):
+    pairs = random_pairs(2, 10, 20)
+    for algorithm in ['global', 'gotoh']:
+        for store_alignments in [True, False]:
+            cache = AlignmentCache(str(tmp_path / f'{algorithm}{store_alignments}.sqlite'), store_alignments=store_alignments)
+            alignments = align_batch(pairs, algorithm, workers=1, cache=cache)
+            # Integer costs hit the entries stored with float ones
+            costs = {name: int(value) if float(value).is_integer() else value for name, value in default_costs(algorithm).items()}
+            scores = align_batch(pairs, algorithm, costs, workers=1, score_only=True, cache=cache)
+            assert scores == [score for _, _, score in alignments]
+            assert cache.misses == len(pairs)
+
+            align_batch(pairs, algorithm, workers=1, cache=cache)
+            assert cache.misses == (len(pairs) if store_alignments else 2 * len(pairs))
+            cache.close()
@@ -0,0 +1,16 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import pytest
+
+from backends import available_backends, check_conformance, get_kernel
+
+
+@pytest.mark.parametrize('backend', [name for name in available_backends() if name != 'reference'])
+def test_backend_conforms_to_reference(backend):
+    assert check_conformance([backend], trials=40) == []
+
+
+def test_unknown_backend_raises():
+    with pytest.raises(ValueError):
+        get_kernel('global', 'nope')
+    with pytest.raises(ValueError):
+        get_kernel('nope', 'numpy')
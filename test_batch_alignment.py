@@ -0,0 +1,43 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from batch_alignment import align_batch
+from instrumentation import Profile
+from synthetic_sequences import random_pairs
+
+
+@pytest.mark.parametrize('score_only', [False, True])
+def test_workers_match_one_process(score_only):
+    pairs = random_pairs(1, 30, 40)
+    for algorithm in ['global', 'local', 'gotoh']:
+        expected = align_batch(pairs, algorithm, workers=1, score_only=score_only)
+        assert align_batch(pairs, algorithm, workers=2, chunk_size=4, score_only=score_only) == expected
+
+
+def test_worker_events_reach_parent_subscribers():
+    pairs = random_pairs(2, 12, 20)
+    with Profile() as profile:
+        align_batch(pairs, 'global', workers=2, chunk_size=3)
+    totals = profile.totals()
+    assert totals['fill']['count'] == len(pairs)
+    assert totals['traceback']['count'] == len(pairs)
+    assert totals['fill']['cells'] == sum((len(S1) + 1) * (len(S2) + 1) for S1, S2 in pairs)
+
+
+def test_shared_executor_serves_several_batches():
+    pairs = random_pairs(3, 40, 30)
+    expected = align_batch(pairs, 'global', workers=1)
+    results = []
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        for start in range(0, len(pairs), 10):
+            results += align_batch(pairs[start:start + 10], 'global', workers=2, chunk_size=3, executor=executor)
+    assert results == expected
+
+
+def test_negative_gap_open_scores_like_alignment():
+    pairs = random_pairs(3, 10, 25)
+    costs = dict(match_cost=5, mismatch_cost=-1, a=-1, b=0.5)
+    alignments = align_batch(pairs, 'gotoh', costs, workers=1)
+    assert align_batch(pairs, 'gotoh', costs, workers=1, score_only=True) == [score for st1, st2, score in alignments]
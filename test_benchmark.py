@@ -0,0 +1,30 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import pytest
+
+from benchmark import SUITES, suite_cases, run_case, compare
+from synthetic_sequences import sequence_family
+
+
+@pytest.mark.parametrize('suite', list(SUITES))
+def test_case_names_are_unique(suite):
+    names = [case['name'] for case in suite_cases(suite)]
+    assert len(names) == len(set(names))
+
+
+def test_families_are_seeded():
+    assert sequence_family(1, 5, 50) == sequence_family(1, 5, 50) != sequence_family(2, 5, 50)
+
+
+def test_run_case_reports_metrics():
+    case = dict(name='global/numpy/len=50', kind='pair', algorithm='global', mode='align', backend='numpy', length=50)
+    result = run_case(case, repeats=2)
+    assert len(result['seconds']) == 2 and result['best_seconds'] == min(result['seconds'])
+    assert result['cells'] > 0 and result['peak_rss_mb'] > 0
+
+
+def test_compare_flags_regressions():
+    baseline = dict(results=[dict(name='a', best_seconds=1.0, peak_rss_mb=100), dict(name='b', best_seconds=1.0, peak_rss_mb=100)])
+    current = dict(results=[dict(name='a', best_seconds=1.05, peak_rss_mb=100), dict(name='b', best_seconds=1.5, peak_rss_mb=150),
+                            dict(name='c', best_seconds=1.0, peak_rss_mb=100)])
+    rows = compare(baseline, current, tolerance=0.1)
+    assert [(name, flags) for name, *_, flags in rows] == [('a', []), ('b', ['time', 'memory'])]
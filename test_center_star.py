@@ -0,0 +1,62 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import random
+
+import pytest
+
+from center_star import find_center_star, find_center_star_by_score, find_center_star_by_kmers
+from cli import build_parser
+from kmer_distance import kmer_shortlist
+
+COSTS = dict(ins_cost=-0.5, del_cost=-0.5, match_cost=5, mismatch_cost=-1)
+
+
+def family(seed, count, length, mutations):
+    rng = random.Random(seed)
+    base = ''.join(rng.choice('ACGT') for _ in range(length))
+    s_list = []
+    for _ in range(count):
+        seq = list(base)
+        for _ in range(rng.randint(1, mutations)):
+            seq[rng.randrange(length)] = rng.choice('ACGT')
+        s_list.append(''.join(seq))
+    return base, s_list
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_center_selections_agree(seed):
+    # All three pick the sequence with the highest total score; the k-mer screen does too when
+    # every sequence is on its shortlist
+    base, s_list = family(seed, 7, 30, 8)
+    s_list.insert(seed, base)
+    center, *_ = find_center_star(s_list, COSTS, workers=1)
+    assert find_center_star_by_score(s_list, COSTS, workers=1)[0] == center
+    assert find_center_star_by_kmers(s_list, COSTS, workers=1, shortlist=len(s_list))[0] == center
+
+
+def test_center_is_the_unmutated_sequence():
+    base, s_list = family(7, 9, 60, 6)
+    s_list.append(base)
+    assert find_center_star_by_score(s_list, COSTS, workers=1)[0] == base
+
+
+def test_center_index_is_returned():
+    # With the center duplicated, the index says which copy was picked
+    base, s_list = family(8, 6, 40, 6)
+    s_list = s_list[:3] + [base] + s_list[3:] + [base]
+    for select in [find_center_star_by_score, find_center_star_by_kmers]:
+        center, st1s, st2s, extra, center_idx = select(s_list, COSTS, workers=1)
+        assert center_idx == 3 and s_list[center_idx] == center
+        assert len(st1s) == len(s_list) - 1
+
+
+def test_shortlist_must_be_positive():
+    with pytest.raises(ValueError):
+        kmer_shortlist([1.0, 2.0], 0)
+    with pytest.raises(SystemExit):
+        build_parser().parse_args(['center-star', '--shortlist', '0'])
+
+
+@pytest.mark.parametrize('k', ['0', '8'])
+def test_kmer_length_is_checked_by_the_parser(k):
+    with pytest.raises(SystemExit):
+        build_parser().parse_args(['center-star', '--kmer', k])
@@ -0,0 +1,50 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from batch_alignment import align_batch
+from cli import build_parser
+from synthetic_sequences import random_pairs
+
+CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cli.py')
+RECORDS = random_pairs(11, 12, 30)
+
+
+@pytest.fixture
+def fasta(tmp_path):
+    path = tmp_path / 'pairs.fa'
+    with open(path, 'w') as fh:
+        for idx, (S1, S2) in enumerate(RECORDS):
+            fh.write(f'>a{idx} first\n{S1}\n>b{idx}\n{S2[:10]}\n{S2[10:]}\n')
+    return str(path)
+
+
+def run_cli(*args):
+    return subprocess.run([sys.executable, CLI, *args], capture_output=True, text=True, check=True).stdout
+
+
+@pytest.mark.parametrize('workers', ['1', '2'])
+def test_pairs_stream_in_order(fasta, workers):
+    lines = run_cli('global', fasta, '--format', 'jsonl', '--workers', workers, '--chunk-size', '2').splitlines()
+    expected = align_batch(RECORDS, 'global', workers=1)
+    assert [json.loads(line) for line in lines] == [
+        dict(id1=f'a{idx}', id2=f'b{idx}', score=float(score), st1=st1, st2=st2) for idx, (st1, st2, score) in enumerate(expected)]
+
+
+def test_score_only_tsv(fasta):
+    lines = run_cli('local', fasta, '--score-only').splitlines()
+    assert lines[0] == 'id1\tid2\tscore\tend1\tend2'
+    expected = align_batch(RECORDS, 'local', workers=1, score_only=True)
+    for line, (score, row_idx, col_idx) in zip(lines[1:], expected):
+        assert line.split('\t')[2:] == [str(float(score)), str(col_idx), str(row_idx)]
+
+
+@pytest.mark.parametrize('option', ['--workers', '--chunk-size'])
+@pytest.mark.parametrize('value', ['0', '-1'])
+def test_batch_options_must_be_positive(option, value):
+    with pytest.raises(SystemExit):
+        build_parser().parse_args(['global', option, value])
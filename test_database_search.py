@@ -0,0 +1,50 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import random
+
+import numpy as np
+
+from database_search import ReferenceDatabase, search
+from local_alignment import smith_waterman_score
+from synthetic_sequences import random_sequence, mutate
+
+
+def planted_database(seed, count=40, length=300):
+    # Unrelated references, every tenth holding a mutated copy of the query
+    rng = random.Random(seed)
+    query = random_sequence(rng, 120)
+    records = []
+    for idx in range(count):
+        reference = random_sequence(rng, length)
+        if idx % 10 == 0:
+            pos = rng.randrange(length)
+            reference = reference[:pos] + mutate(rng, query, 0.05) + reference[pos:]
+        records.append((f'ref{idx}', reference))
+    return query, records + [('empty', ''), ('short', 'ACG')]
+
+
+def test_seeds_are_every_exact_kmer_match():
+    query, records = planted_database(1, count=10, length=60)
+    database = ReferenceDatabase.build(records, k=5)
+    found = set(zip(*(array.tolist() for array in database.seeds(query))))
+    expected = {(ref, ref_pos, query_pos) for ref, (name, reference) in enumerate(records)
+                for ref_pos in range(len(reference) - 4) for query_pos in range(len(query) - 4)
+                if reference[ref_pos:ref_pos + 5] == query[query_pos:query_pos + 5]}
+    assert found == expected
+
+
+def test_search_finds_the_planted_copies(tmp_path):
+    query, records = planted_database(2)
+    ReferenceDatabase.build(records).save(str(tmp_path))
+    database = ReferenceDatabase.load(str(tmp_path))
+    assert isinstance(database.positions, np.memmap)
+    assert [database.sequence(idx) for idx in range(len(database))] == [reference for name, reference in records]
+
+    hits = search(database, query, top_k=4)
+    references = dict(records)
+    full = sorted(((smith_waterman_score(query, reference, -0.5, -0.5, 5, -1)[0], name) for name, reference in records),
+                  reverse=True)[:4]
+    assert [name for name, *_ in hits] == [name for score, name in full]
+    for name, st1, st2, score, (ref_start, query_start), (ref_end, query_end) in hits:
+        assert st1.replace('-', '') == query[query_start:query_end]
+        assert st2.replace('-', '') == references[name][ref_start:ref_end]
+        assert score <= smith_waterman_score(query, references[name], -0.5, -0.5, 5, -1)[0]
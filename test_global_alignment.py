@@ -0,0 +1,87 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import numpy as np
+import pytest
+
+from global_alignment import needleman_wunsch, needleman_wunsch_wavefront, needleman_wunsch_rows, needleman_wunsch_adaptive, \
+    needleman_wunsch_score, hirschberg, reconstruct
+from scoring import load_matrix
+from synthetic_sequences import random_pairs
+
+PROTEIN = 'ARNDCQEGHILKMFPSTWYV'
+COSTS = [(-0.5, -0.5, 5, -1), (-1, -2, 1, -1), (-2, -1, 2, -3), (0, -1, 1, 0), (-0.3, -0.7, 1.1, -0.9)]
+
+
+@pytest.mark.parametrize('costs', COSTS)
+def test_wavefront_matches_loop(costs):
+    # Every cell is computed with the same additions as the loop, so even decimal costs match exactly
+    for S1, S2 in random_pairs(1, 40, 30):
+        V, paths = needleman_wunsch(S1, S2, *costs)
+        V_wave, paths_wave = needleman_wunsch_wavefront(S1, S2, *costs)
+        assert np.array_equal(V, V_wave)
+        assert np.array_equal(paths, paths_wave)
+        assert reconstruct(S1, S2, V, paths) == reconstruct(S1, S2, V_wave, paths_wave)
+
+
+def test_wavefront_matches_loop_with_matrix():
+    blosum = load_matrix('BLOSUM62')
+    for S1, S2 in random_pairs(2, 40, 30, PROTEIN):
+        V, paths = needleman_wunsch(S1, S2, -4, -4, 0, 0, blosum)
+        V_wave, paths_wave = needleman_wunsch_wavefront(S1, S2, -4, -4, 0, 0, blosum)
+        assert np.array_equal(V, V_wave)
+        assert np.array_equal(paths, paths_wave)
+        assert reconstruct(S1, S2, V, paths) == reconstruct(S1, S2, V_wave, paths_wave)
+
+
+@pytest.mark.parametrize('k', [0, 1, 16])
+def test_adaptive_band_matches_full_score(k):
+    for S1, S2 in random_pairs(3, 30, 40):
+        V, paths = needleman_wunsch(S1, S2, -0.5, -0.5, 5, -1)
+        V_band, paths_band = needleman_wunsch_adaptive(S1, S2, -0.5, -0.5, 5, -1, k)
+        assert V_band[len(S2), len(S1)] == V[-1, -1]
+
+
+@pytest.mark.parametrize('costs', COSTS[:4])
+def test_rows_match_loop_on_disk(costs, tmp_path):
+    # Costs exact in binary: the row kernel matches the loop bit for bit, also through memory-mapped files
+    for S1, S2 in random_pairs(5, 30, 30):
+        V, paths = needleman_wunsch(S1, S2, *costs)
+        V_rows, paths_rows = needleman_wunsch_rows(S1, S2, *costs, scratch_dir=str(tmp_path), tile_rows=7)
+        assert np.array_equal(V, V_rows)
+        assert np.array_equal(paths, paths_rows)
+
+
+def test_rows_decimal_costs_within_rounding():
+    # Decimal costs: gap runs round differently (see utils.gap_row()), so only the values are close
+    for S1, S2 in random_pairs(6, 40, 40):
+        V, paths = needleman_wunsch(S1, S2, *COSTS[4])
+        V_rows, paths_rows = needleman_wunsch_rows(S1, S2, *COSTS[4])
+        assert np.allclose(V, V_rows, rtol=0, atol=1e-9)
+        assert reconstruct(S1, S2, V_rows, paths_rows)[2] == pytest.approx(V[-1, -1], abs=1e-9)
+
+
+@pytest.mark.parametrize('costs', COSTS[:4])
+def test_score_matches_full_matrix(costs):
+    for S1, S2 in random_pairs(7, 40, 40):
+        V, paths = needleman_wunsch(S1, S2, *costs)
+        assert needleman_wunsch_score(S1, S2, *costs) == V[-1, -1]
+
+
+def column_score(st1, st2, ins_cost, del_cost, match_cost, mismatch_cost):
+    # Score of an alignment added up column by column; a gap in st1 is a deletion
+    score = 0
+    for c1, c2 in zip(st1, st2):
+        if c1 == '-':
+            score += del_cost
+        elif c2 == '-':
+            score += ins_cost
+        else:
+            score += match_cost if c1 == c2 else mismatch_cost
+    return score
+
+
+@pytest.mark.parametrize('costs', COSTS[:4])
+def test_hirschberg_is_an_optimal_alignment(costs):
+    for S1, S2 in random_pairs(8, 20, 80):
+        st1, st2, score = hirschberg(S1, S2, *costs)
+        assert st1.replace('-', '') == S1 and st2.replace('-', '') == S2
+        assert score == needleman_wunsch(S1, S2, *costs)[0][-1, -1] == column_score(st1, st2, *costs)
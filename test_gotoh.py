@@ -0,0 +1,97 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import numpy as np
+import pytest
+
+from gotoh import gotoh, gotoh_adaptive, unpack_paths, reconstruct, gotoh_vectorized, gotoh_banded, gotoh_score, gotoh_xdrop, myers_miller
+from synthetic_sequences import random_pairs, related_pair
+from tiled_wavefront import gotoh_tiled
+from utils import first_max
+
+
+@pytest.mark.parametrize('k', [0, 1, 16])
+def test_adaptive_band_matches_full_score(k):
+    for S1, S2 in random_pairs(3, 30, 40):
+        F, E, G, paths = gotoh(S1, S2, 5, -1, 2, 0.5)
+        F_band, E_band, G_band, paths_band = gotoh_adaptive(S1, S2, 5, -1, 2, 0.5, k)
+        assert G_band[len(S2), len(S1)] == G[-1, -1]
+
+
+def test_vectorized_negative_gap_open_matches_loop():
+    # A gap opening bonus breaks the running max over E, so these costs must take the loop
+    for S1, S2 in random_pairs(4, 30, 30):
+        expected = gotoh(S1, S2, 5, -1, -1, 2)
+        result = gotoh_vectorized(S1, S2, 5, -1, -1, 2)
+        assert all(np.array_equal(x, y) for x, y in zip(expected, result))
+
+
+@pytest.mark.parametrize('kernel', [
+    lambda: gotoh_score('ACGT', 'AGT', 5, -1, -1, 2),
+    lambda: gotoh_banded('ACGT', 'AGT', 5, -1, -1, 2, 4),
+    lambda: gotoh_xdrop('ACGT', 'AGT', 5, -1, -1, 2, np.inf),
+    lambda: myers_miller('ACGT', 'AGT', 5, -1, -1, 2),
+    lambda: gotoh_tiled('ACGT', 'AGT', 5, -1, -1, 2),
+])
+def test_row_kernels_reject_negative_gap_open(kernel):
+    with pytest.raises(ValueError):
+        kernel()
+
+
+@pytest.mark.parametrize('a, b', [(2, 0.5), (0, 1), (3, 0.5), (1, 0)])
+def test_score_matches_full_matrix(a, b):
+    for S1, S2 in random_pairs(8, 40, 40):
+        F, E, G, paths = gotoh(S1, S2, 5, -1, a, b)
+        assert gotoh_score(S1, S2, 5, -1, a, b) == G[-1, -1]
+
+
+def affine_column_score(st1, st2, match_cost, mismatch_cost, a, b):
+    # Score of an alignment added up column by column; each run of gaps on one side costs a + (b * length)
+    score = 0
+    previous = None
+    for c1, c2 in zip(st1, st2):
+        kind = 'D' if c1 == '-' else 'I' if c2 == '-' else 'M'
+        if kind == 'M':
+            score += match_cost if c1 == c2 else mismatch_cost
+        else:
+            score -= b + (a if kind != previous else 0)
+        previous = kind
+    return score
+
+
+@pytest.mark.parametrize('a, b', [(2, 0.5), (0, 1), (3, 0.5), (1, 0)])
+def test_myers_miller_is_an_optimal_alignment(a, b):
+    for S1, S2 in random_pairs(9, 20, 80):
+        st1, st2, score = myers_miller(S1, S2, 5, -1, a, b)
+        assert st1.replace('-', '') == S1 and st2.replace('-', '') == S2
+        assert score == gotoh(S1, S2, 5, -1, a, b)[2][-1, -1] == affine_column_score(st1, st2, 5, -1, a, b)
+
+
+def test_packed_paths_hold_every_direction():
+    # Each byte must unpack to the choices the matrices themselves imply, first of equals winning
+    a, b = 2, 0.5
+    for S1, S2 in random_pairs(10, 20, 25):
+        F, E, G, paths = gotoh(S1, S2, 5, -1, a, b)
+        assert paths.dtype == np.uint8
+        F_paths, E_paths, G_paths = unpack_paths(paths)
+        for i in range(1, G.shape[0]):
+            for j in range(1, G.shape[1]):
+                assert F_paths[i, j] == (G[i - 1, j] - (a + b) > F[i - 1, j] - b)
+                assert E_paths[i, j] == (G[i, j - 1] - (a + b) > E[i, j - 1] - b)
+                diagonal = G[i - 1, j - 1] + (5 if S1[j - 1] == S2[i - 1] else -1)
+                assert G_paths[i, j] == [diagonal, E[i, j], F[i, j]].index(G[i, j])
+
+
+@pytest.mark.parametrize('a, b', [(2, 0.5), (0, 1), (1, 0)])
+def test_xdrop_without_limit_is_the_full_fill(a, b):
+    for S1, S2 in random_pairs(14, 20, 25):
+        expected = gotoh(S1, S2, 5, -1, a, b)
+        F, E, G, paths, stats = gotoh_xdrop(S1, S2, 5, -1, a, b, np.inf)
+        assert all(np.array_equal(x, y) for x, y in zip(expected, (F, E, G, paths)))
+        assert stats['cells'] == G.size
+
+
+def test_xdrop_prunes_after_the_related_prefix():
+    S1, S2 = related_pair(15, 600, 300)
+    F, E, G, paths, stats = gotoh_xdrop(S1, S2, 1, -3, 2, 1, 20)
+    assert stats['cells'] < stats['total_cells'] // 2
+    st1, st2, score = reconstruct(S1, S2, F, E, G, paths, first_max(G))
+    assert score == G.max() == affine_column_score(st1, st2, 1, -3, 2, 1)
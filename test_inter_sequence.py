@@ -0,0 +1,48 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import numpy as np
+import pytest
+
+from alignment_cache import compact_alignment, expand_alignment
+from global_alignment import needleman_wunsch_rows, needleman_wunsch_score, reconstruct
+from inter_sequence import needleman_wunsch_batch, smith_waterman_batch
+from local_alignment import smith_waterman, trace_local
+from scoring import load_matrix
+from synthetic_sequences import random_pairs
+from utils import first_max
+
+COSTS = [(-0.5, -0.5, 5, -1), (-1, -2, 1, -1), (-2, -1, 2, -3), (0, -1, 1, 0)]
+PROTEIN = 'ARNDCQEGHILKMFPSTWYV'
+
+
+@pytest.mark.parametrize('costs', COSTS)
+def test_global_batch_matches_per_pair(costs):
+    pairs = random_pairs(16, 40, 15)
+    scores, ops = needleman_wunsch_batch(pairs, *costs, traceback=True, batch_size=16)
+    for (S1, S2), score, pair_ops in zip(pairs, scores, ops):
+        st1, st2, expected = reconstruct(S1, S2, *needleman_wunsch_rows(S1, S2, *costs))
+        assert score == expected and pair_ops == compact_alignment(st1, st2)
+        assert expand_alignment(S1, S2, pair_ops) == (st1, st2)
+    assert np.array_equal(needleman_wunsch_batch(pairs, *costs)[0], [needleman_wunsch_score(S1, S2, *costs) for S1, S2 in pairs])
+
+
+@pytest.mark.parametrize('costs', COSTS)
+def test_local_batch_matches_per_pair(costs):
+    pairs = random_pairs(17, 40, 15)
+    scores, ends, starts, ops = smith_waterman_batch(pairs, *costs, traceback=True, batch_size=7)
+    for (S1, S2), score, end, start, pair_ops in zip(pairs, scores, ends, starts, ops):
+        V, paths = smith_waterman(S1, S2, *costs)
+        row_idx, col_idx = first_max(V)
+        if V[row_idx, col_idx] <= 0:
+            row_idx, col_idx = 0, 0
+        st1, st2, expected_start, cells = trace_local(S1, S2, V, paths, row_idx, col_idx)
+        assert score == V[row_idx, col_idx] and tuple(end) == (row_idx, col_idx) and tuple(start) == expected_start
+        assert pair_ops == compact_alignment(st1, st2)
+
+
+def test_batch_with_matrix():
+    blosum = load_matrix('BLOSUM62')
+    pairs = random_pairs(18, 30, 15, PROTEIN)
+    scores, ops = needleman_wunsch_batch(pairs, -4, -4, 0, 0, matrix=blosum, traceback=True)
+    for (S1, S2), score, pair_ops in zip(pairs, scores, ops):
+        st1, st2, expected = reconstruct(S1, S2, *needleman_wunsch_rows(S1, S2, -4, -4, 0, 0, blosum))
+        assert score == expected and expand_alignment(S1, S2, pair_ops) == (st1, st2)
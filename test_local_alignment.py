@@ -0,0 +1,117 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import numpy as np
+import pytest
+
+from local_alignment import smith_waterman, smith_waterman_rows, smith_waterman_score, smith_waterman_linear, \
+    smith_waterman_top_k, smith_waterman_xdrop, trace_local, reconstruct
+from scoring import load_matrix, score_table
+from synthetic_sequences import random_pairs, related_pair
+from utils import first_max
+
+COSTS = [(-0.5, -0.5, 5, -1), (-1, -2, 1, -1), (-2, -1, 2, -3), (0, -1, 1, 0)]
+DECIMAL_COSTS = (-0.3, -0.7, 1.1, -0.9)
+
+
+@pytest.mark.parametrize('costs', COSTS)
+def test_rows_match_loop_on_disk(costs, tmp_path):
+    for S1, S2 in random_pairs(5, 30, 30):
+        V, paths = smith_waterman(S1, S2, *costs)
+        V_rows, paths_rows = smith_waterman_rows(S1, S2, *costs, scratch_dir=str(tmp_path), tile_rows=7)
+        assert np.array_equal(V, V_rows)
+        assert np.array_equal(paths, paths_rows)
+        assert reconstruct(S1, S2, V, paths) == reconstruct(S1, S2, V_rows, paths_rows)
+
+
+def test_rows_decimal_costs_within_rounding():
+    for S1, S2 in random_pairs(6, 40, 40):
+        V, paths = smith_waterman(S1, S2, *DECIMAL_COSTS)
+        V_rows, paths_rows = smith_waterman_rows(S1, S2, *DECIMAL_COSTS)
+        assert np.allclose(V, V_rows, rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize('costs', COSTS)
+def test_score_reports_first_best_cell(costs):
+    # The best score and, like reconstruct(), the first cell holding it in row-major order
+    for S1, S2 in random_pairs(9, 40, 40):
+        V, paths = smith_waterman(S1, S2, *costs)
+        row_idx, col_idx = np.unravel_index(np.argmax(V), V.shape)
+        assert smith_waterman_score(S1, S2, *costs) == (V[row_idx, col_idx], row_idx, col_idx)
+
+
+def column_score(st1, st2, ins_cost, del_cost, match_cost, mismatch_cost, matrix=None):
+    scores = score_table(match_cost, mismatch_cost, matrix)
+    score = 0
+    for c1, c2 in zip(st1, st2):
+        if c1 == '-':
+            score += del_cost
+        elif c2 == '-':
+            score += ins_cost
+        else:
+            score += scores[ord(c2), ord(c1)]
+    return score
+
+
+@pytest.mark.parametrize('costs', COSTS)
+def test_linear_recovers_an_optimal_local_alignment(costs):
+    blosum = load_matrix('BLOSUM62')
+    for idx, (S1, S2) in enumerate(random_pairs(10, 40, 40)):
+        matrix = blosum if idx % 4 == 3 else None
+        V, paths = smith_waterman(S1, S2, *costs, matrix=matrix)
+        st1, st2, score, (row_start, col_start), (row_end, col_end) = smith_waterman_linear(S1, S2, *costs, matrix=matrix)
+        assert score == V.max()
+        assert st1.replace('-', '') == S1[col_start:col_end] and st2.replace('-', '') == S2[row_start:row_end]
+        assert column_score(st1, st2, *costs, matrix) == pytest.approx(score, abs=1e-9)
+
+
+def waterman_eggert(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, k):
+    # Recomputes the whole matrix from scratch after every hit, with the hit's cells held at 0;
+    # returns (score, start, end) of each hit
+    scores = score_table(match_cost, mismatch_cost)
+    masked = np.zeros((len(S2) + 1, len(S1) + 1), dtype=bool)
+    hits = []
+    for _ in range(k):
+        V = np.zeros(masked.shape)
+        paths = np.zeros(masked.shape, dtype=np.uint8)
+        for i in range(1, V.shape[0]):
+            for j in range(1, V.shape[1]):
+                if not masked[i, j]:
+                    choices = [0, V[i - 1, j - 1] + scores[ord(S2[i - 1]), ord(S1[j - 1])], V[i - 1, j] + del_cost, V[i, j - 1] + ins_cost]
+                    paths[i, j] = np.argmax(choices)
+                    V[i, j] = choices[paths[i, j]]
+        if V.max() <= 0:
+            break
+        i, j = np.unravel_index(np.argmax(V), V.shape)
+        end, score = (int(i), int(j)), V[i, j]
+        while V[i, j] > 0:
+            masked[i, j] = True
+            i, j = (i - 1, j - 1) if paths[i, j] == 1 else (i - 1, j) if paths[i, j] == 2 else (i, j - 1)
+        hits.append((score, (int(i), int(j)), end))
+    return hits
+
+
+@pytest.mark.parametrize('costs', COSTS[:3])
+def test_top_k_matches_full_recomputation(costs):
+    for k, (S1, S2) in enumerate(random_pairs(11, 12, 25), 1):
+        hits = smith_waterman_top_k(S1, S2, *costs, k % 5 + 1)
+        assert [(score, start, end) for st1, st2, score, start, end in hits] == waterman_eggert(S1, S2, *costs, k % 5 + 1)
+        for st1, st2, score, (row_start, col_start), (row_end, col_end) in hits:
+            assert st1.replace('-', '') == S1[col_start:col_end] and st2.replace('-', '') == S2[row_start:row_end]
+
+
+@pytest.mark.parametrize('costs', COSTS)
+def test_xdrop_without_limit_is_the_full_fill(costs):
+    for S1, S2 in random_pairs(12, 30, 25):
+        V, paths = smith_waterman(S1, S2, *costs)
+        V_xdrop, paths_xdrop, stats = smith_waterman_xdrop(S1, S2, *costs, np.inf)
+        assert np.array_equal(V, V_xdrop) and np.array_equal(paths, paths_xdrop)
+        assert stats['cells'] == V.size
+
+
+def test_xdrop_prunes_after_the_related_prefix():
+    # Related for 600 characters, then unrelated: the extension stops early with the same best score
+    S1, S2 = related_pair(13, 600, 300)
+    V, paths, stats = smith_waterman_xdrop(S1, S2, -2, -2, 1, -3, 20)
+    assert stats['cells'] < stats['total_cells'] // 2
+    row_idx, col_idx = first_max(V)
+    st1, st2, start, cells = trace_local(S1, S2, V, paths, row_idx, col_idx)
+    assert V[row_idx, col_idx] == smith_waterman_score(S1, S2, -2, -2, 1, -3)[0] == column_score(st1, st2, -2, -2, 1, -3)
@@ -0,0 +1,33 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import pytest
+
+from center_star import find_center_star_by_score
+from msa import MSA
+from synthetic_sequences import sequence_family
+
+COSTS = dict(ins_cost=-0.5, del_cost=-0.5, match_cost=5, mismatch_cost=-1)
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_center_star_msa_keeps_every_pairwise_alignment(seed):
+    s_list = sequence_family(seed, 5, 25, 0.2)
+    center, st1s, st2s, scores, center_idx = find_center_star_by_score(s_list, COSTS, workers=1)
+    rows = MSA.from_center_star(st1s, st2s, center).drop_gap_columns().rows()
+    assert len(set(map(len, rows))) == 1
+    assert rows[0].replace('-', '') == center
+    for row, st1, st2 in zip(rows[1:], st1s, st2s):
+        # Dropping the columns that are gaps in both the center and this row gives back its pairwise alignment
+        keep = [idx for idx in range(len(row)) if rows[0][idx] != '-' or row[idx] != '-']
+        assert ''.join(rows[0][idx] for idx in keep) == st1
+        assert ''.join(row[idx] for idx in keep) == st2
+
+
+def test_gap_columns_are_dropped():
+    msa = MSA.from_center_star(['A-C', 'AC-'], ['AGC', 'ACT'])
+    assert msa.rows() == ['A-C-', 'AGC-', 'A-CT']
+    assert MSA.from_center_star(['A-C'], ['A-C']).drop_gap_columns().rows() == ['AC', 'AC']
+
+
+def test_center_must_be_st1():
+    with pytest.raises(ValueError):
+        MSA.from_center_star(['AC', 'AG'], ['AC', 'AG'])
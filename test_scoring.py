@@ -0,0 +1,30 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import numpy as np
+import pytest
+
+from scoring import encode, load_matrix, score_table
+
+
+def test_match_mismatch_table():
+    scores = score_table(5, -1)
+    codes = encode('ACGT')
+    assert np.array_equal(scores[codes[:, None], codes], np.where(np.eye(4, dtype=bool), 5, -1))
+    assert score_table(5, -1) is scores
+
+
+def test_blosum62_lookup():
+    blosum = load_matrix('BLOSUM62')
+    assert blosum[ord('A'), ord('A')] == 4
+    assert blosum[ord('W'), ord('W')] == 11
+    assert blosum[ord('A'), ord('R')] == blosum[ord('R'), ord('A')] == -1
+    # Lower case scores like upper case, and unknown characters like X
+    assert blosum[ord('w'), ord('W')] == 11
+    assert blosum[ord('J'), ord('A')] == blosum[ord('X'), ord('A')]
+    assert np.array_equal(blosum, blosum.T)
+
+
+def test_load_matrix_rejects_non_square(tmp_path):
+    path = tmp_path / 'bad'
+    path.write_text('   A  C\nA  1 -1\n')
+    with pytest.raises(ValueError):
+        load_matrix(str(path))
@@ -0,0 +1,32 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import pytest
+
+from local_alignment import smith_waterman_score
+from striped_alignment import QueryProfile, striped_smith_waterman
+from synthetic_sequences import random_pairs
+
+COSTS = [(-0.5, -0.5, 5, -1), (-1, -2, 1, -1), (-2, -0.5, 2, -3)]
+
+
+@pytest.mark.parametrize('lanes', [1, 3, 8, 128])
+@pytest.mark.parametrize('costs', COSTS)
+def test_striped_matches_row_kernel(costs, lanes):
+    # The same score and best cell as smith_waterman_score(), with the profile reused across subjects
+    pairs = random_pairs(lanes, 20, 40)
+    profile = QueryProfile(pairs[0][0], *costs, lanes=lanes)
+    for _, S2 in pairs:
+        assert striped_smith_waterman(profile, S2) == smith_waterman_score(profile.query, S2, *costs)
+    assert profile.cells == sum(len(profile.query) * len(S2) for _, S2 in pairs)
+
+
+def test_striped_decimal_costs():
+    costs = (-0.3, -0.3, 1, -0.7)
+    for S1, S2 in random_pairs(1, 20, 40):
+        score, row_idx, col_idx = striped_smith_waterman(QueryProfile(S1, *costs, lanes=4), S2)
+        assert score == pytest.approx(smith_waterman_score(S1, S2, *costs)[0], abs=1e-9)
+
+
+def test_striped_widens_lanes_on_overflow():
+    # 40000 does not fit int16 lanes
+    S = 'ACGT' * 10
+    assert striped_smith_waterman(QueryProfile(S, -1, -1, 1000, -1), S) == (1000 * len(S), len(S), len(S))
@@ -0,0 +1,47 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import pytest
+
+import global_alignment
+import gotoh
+from backends import BACKENDS
+from scoring import load_matrix
+from synthetic_sequences import random_pairs
+from tiled_wavefront import needleman_wunsch_tiled, gotoh_tiled
+
+BLOCK_BACKENDS = [name for name, kernels in BACKENDS.items() if 'global_block' in kernels]
+PROTEIN = 'ARNDCQEGHILKMFPSTWYV'
+
+
+@pytest.mark.parametrize('backend', BLOCK_BACKENDS)
+@pytest.mark.parametrize('tile, workers', [(1, 1), (3, 2), (7, 3), (64, 2)])
+def test_tiled_global_matches_rows(backend, tile, workers):
+    for idx, (S1, S2) in enumerate(random_pairs(tile, 10, 40)):
+        costs = [(-0.5, -0.5, 5, -1), (-1, -2, 1, -1), (-2, -1, 2, -3), (0, -1, 1, 0)][idx % 4]
+        expected = global_alignment.reconstruct(S1, S2, *global_alignment.needleman_wunsch_rows(S1, S2, *costs))
+        assert needleman_wunsch_tiled(S1, S2, *costs, tile=tile, workers=workers, backend=backend) == expected[2]
+        assert needleman_wunsch_tiled(S1, S2, *costs, tile=tile, workers=workers, traceback=True, backend=backend) == expected
+
+
+@pytest.mark.parametrize('backend', BLOCK_BACKENDS)
+@pytest.mark.parametrize('tile, workers', [(1, 1), (3, 2), (7, 3), (64, 2)])
+def test_tiled_gotoh_matches_vectorized(backend, tile, workers):
+    for idx, (S1, S2) in enumerate(random_pairs(tile, 10, 40)):
+        a, b = [(2, 0.5), (0, 1), (4, 0.25), (1, 0)][idx % 4]
+        expected = gotoh.reconstruct(S1, S2, *gotoh.gotoh_vectorized(S1, S2, 5, -1, a, b))
+        assert gotoh_tiled(S1, S2, 5, -1, a, b, tile=tile, workers=workers, backend=backend) == expected[2]
+        assert gotoh_tiled(S1, S2, 5, -1, a, b, tile=tile, workers=workers, traceback=True, backend=backend) == expected
+
+
+@pytest.mark.parametrize('backend', BLOCK_BACKENDS)
+def test_tiled_with_matrix(backend):
+    blosum = load_matrix('BLOSUM62')
+    for S1, S2 in random_pairs(4, 6, 40, PROTEIN):
+        expected = global_alignment.reconstruct(S1, S2, *global_alignment.needleman_wunsch_rows(S1, S2, -4, -4, 0, 0, blosum))
+        assert needleman_wunsch_tiled(S1, S2, -4, -4, 0, 0, blosum, tile=5, workers=2, traceback=True, backend=backend) == expected
+        expected = gotoh.reconstruct(S1, S2, *gotoh.gotoh_vectorized(S1, S2, 0, 0, 10, 1, blosum))
+        assert gotoh_tiled(S1, S2, 0, 0, 10, 1, blosum, tile=5, workers=2, traceback=True, backend=backend) == expected
+
+
+def test_backend_without_block_kernels_raises():
+    with pytest.raises(ValueError):
+        needleman_wunsch_tiled('ACGT', 'AGT', -1, -1, 1, -1, backend='reference')
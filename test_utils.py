@@ -0,0 +1,43 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import io
+
+import numpy as np
+
+from global_alignment import needleman_wunsch_rows, PATH_CHARACTERS
+from gotoh import gotoh, PATH_G_CHARACTERS, G_PATH_SHIFT
+from utils import MatrixView, combine, format_cell, open_scratch_matrix
+
+
+def test_window_matches_full_combine(tmp_path):
+    V, paths = needleman_wunsch_rows('ACGTTGCAACGT' * 3, 'AGTTCAACG' * 3, -0.5, -0.5, 5, -1, scratch_dir=str(tmp_path))
+    view = MatrixView(open_scratch_matrix(str(tmp_path), 'V'), open_scratch_matrix(str(tmp_path), 'paths'), PATH_CHARACTERS)
+    full = combine(np.asarray(V), np.asarray(paths), PATH_CHARACTERS)
+    rows, cols = view.around(5, 30, radius=3)
+    assert (rows, cols) == (slice(2, 9), slice(27, 34))
+    assert np.array_equal(view.cells(rows, cols), full[rows, cols])
+
+
+def test_window_is_clamped_to_the_matrix():
+    V = np.zeros((4, 6))
+    view = MatrixView(V, np.zeros(V.shape, dtype=np.uint8), PATH_CHARACTERS)
+    assert view.around(0, 5, radius=2) == (slice(0, 3), slice(3, 6))
+
+
+def test_lines_are_written_in_chunks():
+    V, paths = needleman_wunsch_rows('ACGTAC', 'AGTC', -0.5, -0.5, 5, -1)
+    view = MatrixView(V, paths, PATH_CHARACTERS)
+    lines = view.render(slice(1, 4), slice(2, 5)).split('\n')
+    assert lines[0] == '\t2\t3\t4'
+    assert [line.split('\t')[0] for line in lines[1:]] == ['1', '2', '3']
+    assert lines[1].split('\t')[1:] == [format_cell(V[1, col], paths[1, col], PATH_CHARACTERS) for col in range(2, 5)]
+
+    fh = io.StringIO()
+    view.write(fh, chunk_rows=2)
+    assert fh.getvalue() == view.render() + '\n'
+
+
+def test_packed_paths_pick_their_bits():
+    F, E, G, paths = gotoh('ACGT', 'AGT', 5, -1, 2, 0.5)
+    view = MatrixView(G, paths, PATH_G_CHARACTERS, G_PATH_SHIFT, 0b11)
+    cells = view.cells(slice(None), slice(None))
+    assert cells[3, 4] == PATH_G_CHARACTERS[(paths[3, 4] >> G_PATH_SHIFT) & 0b11] + str(G[3, 4])
@@ -0,0 +1,173 @@
+# Author: Jose G. Perez <jperez50@miners.utep.edu>
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import global_alignment
+import gotoh
+from backends import get_kernel
+from gotoh import G_PATH_SHIFT, E_PATH_SHIFT, F_PATH_SHIFT, check_gap_open
+from instrumentation import phase
+from scoring import encode, score_table
+
+# Rows and columns of S1 x S2 per block. Blocks on the same anti-diagonal run in parallel; only their
+# edge rows and columns are passed on, and only those are kept for a checkpointed traceback
+DEFAULT_TILE = 1024
+
+
+#%% Wavefront
+def block_bounds(length, tile):
+    # [start, end) matrix indexes of each block along one side (index 0 is the gap row/column)
+    return [(start, min(start + tile, length + 1)) for start in range(1, length + 1, tile)]
+
+
+def wavefront(row_blocks, col_blocks, run_block, workers=None):
+    # Calls run_block(bi, bj) for every block, one anti-diagonal of blocks at a time; the blocks of an
+    # anti-diagonal share no edges, so they run at the same time on the thread pool. The numpy block
+    # kernels only release the GIL inside each row operation, so they hardly scale past one core; the
+    # numba ones release it for the whole block
+    if workers is None:
+        workers = os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for k in range(row_blocks + col_blocks - 1):
+            blocks = [(bi, k - bi) for bi in range(max(0, k - col_blocks + 1), min(row_blocks, k + 1))]
+            list(executor.map(lambda block: run_block(*block), blocks))
+
+
+#%% Needleman-Wunsch
+def needleman_wunsch_tiled(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, matrix=None, tile=DEFAULT_TILE,
+                           workers=None, traceback=False, backend=None):
+    # Global score of one large pair in O(n + m) memory, filled a block at a time on a thread pool with
+    # the backend's 'global_block' kernel (see backends.py).
+    # With traceback, every block's input edges are kept as checkpoints and the path is recovered by
+    # refilling only the blocks it crosses; returns (st1, st2, score) like reconstruct() then
+    if not S1 or not S2:
+        V, paths = global_alignment.needleman_wunsch_rows(S1, S2, ins_cost, del_cost, match_cost, mismatch_cost, matrix)
+        st1, st2, score = global_alignment.reconstruct(S1, S2, V, paths)
+        return (st1, st2, score) if traceback else score
+
+    fill_block = get_kernel('global_block', backend)
+    scores = score_table(match_cost, mismatch_cost, matrix)
+    codes1 = encode(S1)
+    codes2 = encode(S2)
+    rows = block_bounds(len(S2), tile)
+    cols = block_bounds(len(S1), tile)
+
+    # The latest bottom row of every block column and right column of every block row
+    first_row = np.add.accumulate(np.full(len(S1), ins_cost))
+    top_edges = [first_row[c0 - 1:c1 - 1] for c0, c1 in cols]
+    left_edges = [np.concatenate(([0], np.add.accumulate(np.full(len(S2), del_cost))))[r0 - 1:r1] for r0, r1 in rows]
+    checkpoints = {}
+
+    def run_block(bi, bj):
+        (r0, r1), (c0, c1) = rows[bi], cols[bj]
+        if traceback:
+            checkpoints[bi, bj] = (top_edges[bj], left_edges[bi])
+        top_edges[bj], left_edges[bi], _ = fill_block(codes1[c0 - 1:c1 - 1], codes2[r0 - 1:r1 - 1], scores,
+                                                      ins_cost, del_cost, top_edges[bj], left_edges[bi])
+
+    with phase('score', algorithm='global', cells=len(S1) * len(S2)):
+        wavefront(len(rows), len(cols), run_block, workers)
+    score = top_edges[-1][-1]
+    if not traceback:
+        return score
+
+    # Walk back block by block: refill the block holding the current cell and follow its paths out of it
+    st1 = []
+    st2 = []
+    row_idx, col_idx = len(S2), len(S1)
+    while row_idx > 0 and col_idx > 0:
+        bi, bj = (row_idx - 1) // tile, (col_idx - 1) // tile
+        (r0, r1), (c0, c1) = rows[bi], cols[bj]
+        top, left = checkpoints[bi, bj]
+        _, _, paths = fill_block(codes1[c0 - 1:c1 - 1], codes2[r0 - 1:r1 - 1], scores, ins_cost, del_cost, top, left, True)
+        while row_idx >= r0 and col_idx >= c0:
+            value = paths[row_idx - r0, col_idx - c0]
+            st1.append(S1[col_idx - 1] if value != 1 else '-')
+            st2.append(S2[row_idx - 1] if value != 2 else '-')
+            row_idx -= value != 2
+            col_idx -= value != 1
+
+    # Row 0 only moves left and column 0 only moves up
+    st1.extend(S1[col_idx - 1::-1] if col_idx > 0 else '')
+    st2.extend('-' * col_idx)
+    st1.extend('-' * row_idx)
+    st2.extend(S2[row_idx - 1::-1] if row_idx > 0 else '')
+    return ''.join(reversed(st1)), ''.join(reversed(st2)), score
+
+
+#%% Gotoh
+def gotoh_tiled(S1, S2, match_cost, mismatch_cost, a, b, matrix=None, tile=DEFAULT_TILE, workers=None, traceback=False,
+                backend=None):
+    # Same as needleman_wunsch_tiled() for affine gaps, with the 'gotoh_block' kernel: G and F cross block
+    # boundaries downwards, G and E rightwards. With traceback returns (st1, st2, score) like gotoh.reconstruct()
+    check_gap_open(a)
+    if not S1 or not S2:
+        F, E, G, paths = gotoh.gotoh_vectorized(S1, S2, match_cost, mismatch_cost, a, b, matrix)
+        st1, st2, score = gotoh.reconstruct(S1, S2, F, E, G, paths)
+        return (st1, st2, score) if traceback else score
+
+    f = lambda k: a + (b * k)
+    fill_block = get_kernel('gotoh_block', backend)
+    scores = score_table(match_cost, mismatch_cost, matrix)
+    codes1 = encode(S1)
+    codes2 = encode(S2)
+    rows = block_bounds(len(S2), tile)
+    cols = block_bounds(len(S1), tile)
+
+    first_row = -1 * f(np.arange(1, len(S1) + 1, dtype=float))
+    first_col = np.concatenate(([0], -1 * f(np.arange(1, len(S2) + 1, dtype=float))))
+    top_edges = [(first_row[c0 - 1:c1 - 1], np.full(c1 - c0, -np.inf)) for c0, c1 in cols]
+    left_edges = [(first_col[r0 - 1:r1], np.full(r1 - r0 + 1, -np.inf)) for r0, r1 in rows]
+    checkpoints = {}
+
+    def run_block(bi, bj):
+        (r0, r1), (c0, c1) = rows[bi], cols[bj]
+        if traceback:
+            checkpoints[bi, bj] = (top_edges[bj], left_edges[bi])
+        top_edges[bj], left_edges[bi], _ = fill_block(codes1[c0 - 1:c1 - 1], codes2[r0 - 1:r1 - 1], scores, a, b,
+                                                      top_edges[bj], left_edges[bi])
+
+    with phase('score', algorithm='gotoh', cells=len(S1) * len(S2)):
+        wavefront(len(rows), len(cols), run_block, workers)
+    score = top_edges[-1][0][-1]
+    if not traceback:
+        return score
+
+    # Same walk as gotoh.reconstruct(), refilling one block at a time; it stops at row 0 or column 0
+    st1 = []
+    st2 = []
+    row_idx, col_idx = len(S2), len(S1)
+    current_array = 'G'
+    while row_idx > 0 and col_idx > 0:
+        bi, bj = (row_idx - 1) // tile, (col_idx - 1) // tile
+        (r0, r1), (c0, c1) = rows[bi], cols[bj]
+        top, left = checkpoints[bi, bj]
+        _, _, paths = fill_block(codes1[c0 - 1:c1 - 1], codes2[r0 - 1:r1 - 1], scores, a, b, top, left, True)
+        while row_idx >= r0 and col_idx >= c0:
+            value = paths[row_idx - r0, col_idx - c0]
+            if current_array == 'G':
+                direction = (value >> G_PATH_SHIFT) & 0b11
+                if direction == 1:
+                    current_array = 'E'
+                elif direction == 2:
+                    current_array = 'F'
+                else:
+                    st1.append(S1[col_idx - 1])
+                    st2.append(S2[row_idx - 1])
+                    row_idx -= 1
+                    col_idx -= 1
+            elif current_array == 'E':
+                st1.append(S1[col_idx - 1])
+                st2.append('-')
+                col_idx -= 1
+                if (value >> E_PATH_SHIFT) & 0b1:
+                    current_array = 'G'
+            else:
+                st1.append('-')
+                st2.append(S2[row_idx - 1])
+                row_idx -= 1
+                if (value >> F_PATH_SHIFT) & 0b1:
+                    current_array = 'G'
+    return ''.join(reversed(st1)), ''.join(reversed(st2)), score
@@ -1,6 +1,17 @@
 # Author: Jose G. Perez <jperez50@miners.utep.edu>
+import os
+
 import numpy as np
 
+from instrumentation import enabled, phase, report
+
+# Rows computed in memory before they are written out to a (possibly memory-mapped) matrix
+DEFAULT_TILE_ROWS = 256
+# Rows formatted at a time when a MatrixView is written out
+DEFAULT_RENDER_CHUNK_ROWS = 64
+# Rows and columns shown on each side of the cell a MatrixView window is centered on
+DEFAULT_RENDER_RADIUS = 8
+
 
 def get_input_float(message):
     while True:
@@ -32,14 +43,228 @@ def get_input_boolean(message):
         continue
 
 
-def combine(arr, path, chars):
-    combined = np.zeros_like(arr).astype(np.object)
-    for row_idx, (value_row, direction_row) in enumerate(zip(arr, path)):
-        for col_idx, (value, direction) in enumerate(zip(value_row, direction_row)):
-            if value == np.inf:
-                combined[row_idx, col_idx] = '∞'
-            elif value == -np.inf:
-                combined[row_idx, col_idx] = '-∞'
-            else:
-                combined[row_idx, col_idx] = chars[int(direction)] + str(value)
-    return combined
\ No newline at end of file
+def read_fasta(handle):
+    # Yields (name, sequence) one record at a time, so inputs of any size stream through
+    name = None
+    chunks = []
+    for line in handle:
+        line = line.strip()
+        if line.startswith('>'):
+            if name is not None:
+                yield name, ''.join(chunks)
+            fields = line[1:].split(maxsplit=1)
+            name = fields[0] if fields else ''
+            chunks = []
+        elif line and name is not None:
+            chunks.append(line)
+
+    if name is not None:
+        yield name, ''.join(chunks)
+
+
+def combine(arr, path, chars, shift=0, mask=0b11):
+    # Every cell formatted as its direction character and value; only for small matrices,
+    # MatrixView formats just a window of a large one
+    return MatrixView(arr, path, chars, shift, mask).cells(slice(None), slice(None))
+
+
+def format_cell(value, direction, chars, shift=0, mask=0b11):
+    # Directions may be packed several to a byte, so pick out the bits at shift
+    if value == np.inf:
+        return '∞'
+    elif value == -np.inf:
+        return '-∞'
+    return chars[(int(direction) >> shift) & mask] + str(value)
+
+
+class MatrixView:
+    # A matrix and its paths, formatted like combine() but lazily: only the rows and columns asked
+    # for are read and formatted, so arr and path can be large or memory-mapped
+    def __init__(self, arr, path, chars, shift=0, mask=0b11):
+        self.arr = arr
+        self.path = path
+        self.chars = chars
+        self.shift = shift
+        self.mask = mask
+        self.shape = arr.shape
+
+    def cells(self, rows, cols):
+        # The formatted cells of arr[rows, cols] as an object array
+        values = np.asarray(self.arr[rows, cols])
+        directions = np.asarray(self.path[rows, cols])
+        with phase('render', cells=values.size):
+            combined = np.zeros(values.shape, dtype=object)
+            for idx in np.ndindex(values.shape):
+                combined[idx] = format_cell(values[idx], directions[idx], self.chars, self.shift, self.mask)
+        return combined
+
+    def around(self, row_idx, col_idx, radius=DEFAULT_RENDER_RADIUS):
+        # (rows, cols) slices of the window centered on a cell, e.g. the best cell or where the traceback starts
+        return (slice(max(0, row_idx - radius), min(self.shape[0], row_idx + radius + 1)),
+                slice(max(0, col_idx - radius), min(self.shape[1], col_idx + radius + 1)))
+
+    def lines(self, rows=slice(None), cols=slice(None), chunk_rows=DEFAULT_RENDER_CHUNK_ROWS):
+        # Tab-separated text of the window: a header of column indexes, then each row led by its index.
+        # Rows are formatted chunk_rows at a time, so only one chunk is in memory
+        row_start, row_stop, _ = rows.indices(self.shape[0])
+        col_start, col_stop, _ = cols.indices(self.shape[1])
+        yield '\t'.join([''] + [str(col_idx) for col_idx in range(col_start, col_stop)])
+        for start in range(row_start, row_stop, chunk_rows):
+            chunk = self.cells(slice(start, min(start + chunk_rows, row_stop)), slice(col_start, col_stop))
+            for offset, row in enumerate(chunk):
+                yield '\t'.join([str(start + offset)] + list(row))
+
+    def write(self, fh, rows=slice(None), cols=slice(None), chunk_rows=DEFAULT_RENDER_CHUNK_ROWS):
+        for line in self.lines(rows, cols, chunk_rows):
+            fh.write(line + '\n')
+
+    def render(self, rows=slice(None), cols=slice(None)):
+        return '\n'.join(self.lines(rows, cols))
+
+
+def gap_running_max(values, gap_cost):
+    # out[j] = max(values[j], out[j - 1] + gap_cost), computed without a Python loop;
+    # along the last axis, so a 2-D array is a batch of independent rows
+    steps = np.arange(values.shape[-1]) * gap_cost
+    return np.maximum.accumulate(values - steps, axis=-1) + steps
+
+
+def gap_row(first, best, gap_cost):
+    # The row step of every linear-gap row kernel: out[0] = first and out[j] = max(best[j - 1], out[j - 1] + gap_cost),
+    # where best holds each cell's diagonal/up choice. Along the last axis, like gap_running_max(); first
+    # is a scalar or one value per row. Every cell is then recomputed from its left neighbour, so it equals
+    # exactly one of its two choices and the kernels' equality tests for the paths find it.
+    # This matches the cell-by-cell loops bit for bit when the costs and scores are exact in binary
+    # (integers, halves, quarters, ...). With costs such as 0.3 the running max rounds a gap run differently
+    # from adding gap_cost once per cell, so values can differ in the last bits and near-equal choices can
+    # break ties differently, giving another alignment of the same score up to rounding
+    first = np.broadcast_to(first, best.shape[:-1] + (1,))
+    out = gap_running_max(np.concatenate((first, best), axis=-1), gap_cost)
+    out[..., 1:] = np.maximum(best, out[..., :-1] + gap_cost)
+    return out
+
+
+def affine_gap_row(first, H, open_cost, extend_cost):
+    # The E (left gap) row step of every Gotoh row kernel: out[0] = first and
+    # out[j] = max(out[j - 1] - extend_cost, H[j - 1] - open_cost), where H holds each cell's max(diagonal, F).
+    # Opening from a G cell that itself came from E never beats extending that E when the opening cost
+    # a >= 0, so opening from H instead of G gives the same E; the kernels check a >= 0 (gotoh.check_gap_open()).
+    # Exact in the same sense as gap_row()
+    return gap_running_max(np.concatenate(([first], H[:-1] - open_cost)), -extend_cost)
+
+
+def xdrop_extent(value, gap_cost, threshold, limit):
+    # Largest t <= limit with value + (t * gap_cost) >= threshold, i.e. how many more cells a run of
+    # gaps starting from value stays alive for under X-drop (0 if it never does)
+    if value < threshold:
+        return 0
+    if gap_cost >= 0:
+        return limit
+    return int(min(limit, (value - threshold) // -gap_cost))
+
+
+class BandedMatrix:
+    # A (rows x cols) matrix that only stores the cells with lo <= col - row <= hi, one band row
+    # per matrix row; anything outside the band reads as fill
+    def __init__(self, shape, lo, hi, dtype=float, fill=-np.inf):
+        self.shape = shape
+        self.lo = lo
+        self.hi = hi
+        self.fill = fill
+        self.band = np.full((shape[0], hi - lo + 1), fill, dtype=dtype)
+
+    def __getitem__(self, idx):
+        row_idx, col_idx = idx
+        band_idx = col_idx - row_idx - self.lo
+        if 0 <= band_idx < self.band.shape[1]:
+            return self.band[row_idx, band_idx]
+        return self.fill
+
+    def __setitem__(self, idx, value):
+        row_idx, col_idx = idx
+        self.band[row_idx, col_idx - row_idx - self.lo] = value
+
+    def to_dense(self):
+        dense = np.full(self.shape, self.fill, dtype=self.band.dtype)
+        for row_idx in range(self.shape[0]):
+            col_idxs = row_idx + np.arange(self.lo, self.hi + 1)
+            inside = (col_idxs >= 0) & (col_idxs < self.shape[1])
+            dense[row_idx, col_idxs[inside]] = self.band[row_idx, inside]
+        return dense
+
+
+def band_limits(len_rows, len_cols, k):
+    # Diagonal offsets (col - row) covered by a band of width k around both corners,
+    # for the (len_rows + 1) x (len_cols + 1) matrix of two sequences
+    lo = max(min(0, len_cols - len_rows) - k, -len_rows)
+    hi = min(max(0, len_cols - len_rows) + k, len_cols)
+    return lo, hi
+
+
+def band_columns(i, lo, hi, len_cols):
+    # Band row k of matrix row i holds cell (i, i + lo + k), so the diagonal neighbour of a cell sits at
+    # the same band index of the previous band row and the upper neighbour one band index to the right.
+    # Returns the column of each band cell and which of them fall inside the matrix
+    j = i + np.arange(lo, hi + 1)
+    return j, (j >= 0) & (j <= len_cols)
+
+
+def band_diagonal(band_row, j, row_scores):
+    # Diagonal move into each cell of a band row from the previous band row; row_scores[j] scores
+    # column j against the current row's character (row_scores[0] is padding)
+    return np.where(j >= 1, band_row + row_scores[np.clip(j, 0, len(row_scores) - 1)], -np.inf)
+
+
+def band_up(band_row):
+    # The previous band row's value above each cell of the current one
+    return np.append(band_row[1:], -np.inf)
+
+
+def band_exit_indels(len_rows, len_cols, lo, hi):
+    # Fewest gap characters any alignment needs to leave the band, or None if it cannot
+    end = len_cols - len_rows
+    exits = []
+    if hi + 1 <= len_cols:
+        exits.append((hi + 1) + (hi + 1 - end))
+    if lo - 1 >= -len_rows:
+        exits.append((1 - lo) + (end - lo + 1))
+    return min(exits) if exits else None
+
+
+def scratch_matrix(shape, dtype=float, scratch_dir=None, name='V'):
+    # A zeroed matrix, in memory or, with scratch_dir, as the np.memmap file scratch_dir/name.npy
+    if enabled():
+        report('allocate', bytes=int(np.prod(shape)) * np.dtype(dtype).itemsize, name=name, on_disk=scratch_dir is not None)
+    if scratch_dir is None:
+        return np.zeros(shape, dtype=dtype)
+    os.makedirs(scratch_dir, exist_ok=True)
+    return np.lib.format.open_memmap(os.path.join(scratch_dir, f'{name}.npy'), mode='w+', dtype=dtype, shape=shape)
+
+
+def open_scratch_matrix(scratch_dir, name='V', mode='r'):
+    # Reopens a matrix written by scratch_matrix() without loading it, e.g. to reconstruct again
+    return np.load(os.path.join(scratch_dir, f'{name}.npy'), mmap_mode=mode)
+
+
+def row_tiles(rows, tile_rows=DEFAULT_TILE_ROWS):
+    # (start, end) of each tile of rows after row 0
+    return [(start, min(start + tile_rows, rows)) for start in range(1, rows, tile_rows)]
+
+
+def flush_matrices(*matrices):
+    for matrix in matrices:
+        if isinstance(matrix, np.memmap):
+            matrix.flush()
+
+
+def first_max(V, tile_rows=DEFAULT_TILE_ROWS):
+    # (row, col) of the first maximum in row-major order, reading a tile of rows at a time
+    best = -np.inf
+    best_idx = (0, 0)
+    for start in range(0, V.shape[0], tile_rows):
+        tile = np.asarray(V[start:start + tile_rows])
+        row_idx, col_idx = np.unravel_index(np.argmax(tile), tile.shape)
+        if tile[row_idx, col_idx] > best:
+            best = tile[row_idx, col_idx]
+            best_idx = (start + int(row_idx), int(col_idx))
+    return best_idx